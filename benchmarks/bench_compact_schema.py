@@ -0,0 +1,129 @@
+# benchmarks/bench_compact_schema.py
+# 紧凑存储对比：旧结构 (判别结果存文本) 与新结构 (小整数编码 + 报警文本查找表) 的库文件大小和查询耗时
+# 在 channel_monitor.db 的两份临时副本上运行 (可用 --double N 把数据翻倍 N 次)，不会改动原库
+# 用法: python benchmarks/bench_compact_schema.py [--db channel_monitor.db] [--double 3]
+import argparse
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+COPY_SQL = """
+INSERT INTO monitor_data (timestamp, depth, velocity_surf, voltage, velocity_avg, flow_rate,
+                          fr_number, regime, flow_type, alert_msg)
+SELECT timestamp, depth, velocity_surf, voltage, velocity_avg, flow_rate,
+       fr_number, regime, flow_type, alert_msg
+FROM monitor_data
+"""
+
+# 名称 -> (旧结构 SQL, 新结构 SQL)
+QUERIES = {
+    "流态占比 (GROUP BY regime)": (
+        "SELECT regime, COUNT(*) FROM monitor_data GROUP BY regime",
+        "SELECT regime_code, COUNT(*) FROM monitor_data GROUP BY regime_code",
+    ),
+    "报警条数": (
+        "SELECT COUNT(*) FROM monitor_data WHERE alert_msg != '正常'",
+        "SELECT COUNT(*) FROM monitor_data WHERE alert_id != (SELECT id FROM alert_text WHERE text = '正常')",
+    ),
+    "全表扫描 (导出)": (
+        "SELECT id, timestamp, depth, flow_rate, regime, flow_type, alert_msg FROM monitor_data",
+        None,  # 新结构使用与接口相同的还原表达式，见 main()
+    ),
+}
+
+
+def timed(con, sql, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        con.execute(sql).fetchall()
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description="紧凑存储基准")
+    parser.add_argument("--db", default=os.path.join(ROOT, "channel_monitor.db"))
+    parser.add_argument("--double", type=int, default=0, help="把数据复制翻倍的次数")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="bench_compact_")
+    legacy = os.path.join(workdir, "legacy.db")
+    compact = os.path.join(workdir, "compact.db")
+    try:
+        shutil.copy(args.db, legacy)
+        con = sqlite3.connect(legacy)
+        if "regime_code" in {row[1] for row in con.execute("PRAGMA table_info(monitor_data)")}:
+            sys.exit("--db 需要是旧结构的库 (判别结果为文本列)")
+        for _ in range(args.double):
+            con.execute(COPY_SQL)
+        con.commit()
+        con.close()
+        shutil.copy(legacy, compact)
+
+        # 导入 models 时 compact.db 只做在线迁移，整表转换与 VACUUM 由离线升级命令完成 (与现场升级步骤一致)
+        os.environ["MONITOR_DB_URL"] = f"sqlite:///{compact}"
+        sys.path.insert(0, ROOT)
+        from database.models import Base, engine, build_engine
+        from database.codes import column
+        from database.migrations import main as migrate_main, migrate
+        from sqlalchemy import select
+        t0 = time.perf_counter()
+        migrate_main([])
+        migrate_time = time.perf_counter() - t0
+        engine.dispose()
+        # legacy.db 同样只做在线迁移 (索引、测站列、汇总表齐全)，两边只差判别结果的存储方式
+        legacy_engine = build_engine(f"sqlite:///{legacy}")
+        Base.metadata.create_all(bind=legacy_engine)
+        migrate(legacy_engine)
+        legacy_engine.dispose()
+        export_sql = str(select(*[column(name) for name in
+                                  ("id", "timestamp", "depth", "flow_rate", "regime", "flow_type", "alert_msg")])
+                         .compile(compile_kwargs={"literal_binds": True}))
+
+        # 库文件按迁移后留在磁盘上的样子测量，不再额外 VACUUM
+        results = {}
+        for name, path in (("legacy", legacy), ("compact", compact)):
+            size = os.path.getsize(path)
+            con = sqlite3.connect(path)
+            rows = con.execute("SELECT COUNT(*) FROM monitor_data").fetchone()[0]
+            (data_bytes,) = con.execute(
+                "SELECT SUM(pgsize) FROM dbstat WHERE name = 'monitor_data'"
+            ).fetchone() if _has_dbstat(con) else (None,)
+            timings = {}
+            for label, (old_sql, new_sql) in QUERIES.items():
+                sql = old_sql if name == "legacy" else (new_sql or export_sql)
+                timings[label] = timed(con, sql, args.repeat)
+            results[name] = (rows, size, data_bytes, timings)
+            con.close()
+
+        print(f"rows: {results['legacy'][0]}, offline migration (incl. VACUUM): {migrate_time:.2f} s")
+        print(f"{'':>28} {'legacy':>12} {'compact':>12} {'ratio':>8}")
+        for label, idx in (("db file (KB)", 1), ("monitor_data table (KB)", 2)):
+            old, new = results["legacy"][idx], results["compact"][idx]
+            if old is None:
+                continue
+            print(f"{label:>28} {old / 1024:12.0f} {new / 1024:12.0f} {new / old:8.2f}")
+        for label in QUERIES:
+            old, new = results["legacy"][3][label], results["compact"][3][label]
+            print(f"{label + ' (ms)':>28} {old * 1000:12.2f} {new * 1000:12.2f} {new / old:8.2f}")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def _has_dbstat(con):
+    try:
+        con.execute("SELECT 1 FROM dbstat LIMIT 1")
+        return True
+    except sqlite3.OperationalError:
+        return False
+
+
+if __name__ == "__main__":
+    main()
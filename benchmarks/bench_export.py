@@ -0,0 +1,85 @@
+# benchmarks/bench_export.py
+# 导出格式对比：CSV / CSV.gz / Parquet / Arrow 的导出耗时、文件大小、pandas 读取耗时
+# 在 channel_monitor.db 的临时副本上运行 (可用 --double N 把数据翻倍 N 次)，不会改动原库
+# 用法: python benchmarks/bench_export.py [--db channel_monitor.db] [--double 3]
+import argparse
+import io
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+COPY_SQL = """
+INSERT INTO monitor_data (timestamp, depth, velocity_surf, voltage, velocity_avg, flow_rate,
+                          fr_number, regime, flow_type, alert_msg)
+SELECT timestamp, depth, velocity_surf, voltage, velocity_avg, flow_rate,
+       fr_number, regime, flow_type, alert_msg
+FROM monitor_data
+"""
+
+
+def prepare_db(src, doublings):
+    workdir = tempfile.mkdtemp(prefix="bench_export_")
+    path = os.path.join(workdir, "channel_monitor.db")
+    shutil.copy(src, path)
+    con = sqlite3.connect(path)
+    for _ in range(doublings):
+        con.execute(COPY_SQL)
+    con.commit()
+    rows = con.execute("SELECT COUNT(*) FROM monitor_data").fetchone()[0]
+    con.close()
+    return workdir, path, rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="导出格式基准")
+    parser.add_argument("--db", default=os.path.join(ROOT, "channel_monitor.db"))
+    parser.add_argument("--double", type=int, default=0, help="把数据复制翻倍的次数")
+    args = parser.parse_args()
+
+    workdir, path, rows = prepare_db(args.db, args.double)
+    os.environ["MONITOR_DB_URL"] = f"sqlite:///{path}"
+    sys.path.insert(0, ROOT)
+
+    import pandas as pd
+    from fastapi.testclient import TestClient
+    import main as app_main
+
+    readers = {
+        "csv": lambda data: pd.read_csv(io.BytesIO(data)),
+        "csv.gz": lambda data: pd.read_csv(io.BytesIO(data), compression="gzip"),
+        "parquet": lambda data: pd.read_parquet(io.BytesIO(data)),
+        "arrow": lambda data: pd.read_feather(io.BytesIO(data)),
+    }
+    queries = {
+        "csv": "format=csv",
+        "csv.gz": "format=csv&gzip=true",
+        "parquet": "format=parquet",
+        "arrow": "format=arrow",
+    }
+
+    print(f"rows: {rows}")
+    print(f"{'format':>8} {'export (s)':>11} {'rows/s':>10} {'size (KB)':>10} {'pandas load (s)':>16}")
+    try:
+        with TestClient(app_main.app) as client:
+            for name, query in queries.items():
+                t0 = time.perf_counter()
+                resp = client.get(f"/api/export?{query}")
+                t_export = time.perf_counter() - t0
+                resp.raise_for_status()
+
+                t0 = time.perf_counter()
+                readers[name](resp.content)
+                t_load = time.perf_counter() - t0
+                print(f"{name:>8} {t_export:>11.3f} {rows / t_export:>10.0f} "
+                      f"{len(resp.content) / 1024:>10.0f} {t_load:>16.3f}")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+# benchmarks/bench_hydraulic.py
+# 标量接口 vs 向量化接口 性能对比
+# 用法: python benchmarks/bench_hydraulic.py [--sizes 10000 100000 ...] [--scalar-max 1000000]
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from core.hydraulic import HydraulicCalculator, REGIME_LABELS, FLOW_TYPE_LABELS  # noqa: E402
+
+
+def make_columns(n, seed=0):
+    """生成与模拟器分布相近的随机水深/流速列"""
+    rng = np.random.default_rng(seed)
+    depth = np.clip(2.0 + np.cumsum(rng.uniform(-0.05, 0.05, n)), 0.0, None)
+    velocity = 4.0 / np.maximum(depth, 0.5) + rng.uniform(-0.1, 0.1, n)
+    width = np.full(n, 5.0)
+    return depth, width, velocity
+
+
+def run_scalar(calc, depth, width, velocity):
+    out = []
+    last = None
+    for h, b, v in zip(depth.tolist(), width.tolist(), velocity.tolist()):
+        _, v_avg, q = calc.calculate_flow(h, b, v)
+        fr, regime, _ = calc.determine_regime(v_avg, h)
+        flow_type = calc.check_non_uniform(h, last)
+        last = h
+        out.append((q, fr, regime, flow_type))
+    return out
+
+
+def run_vector(calc, depth, width, velocity):
+    _, v_avg, q = calc.calculate_flow_array(depth, width, velocity)
+    fr, regime = calc.determine_regime_array(v_avg, depth)
+    flow_type = calc.check_non_uniform_array(depth)
+    return q, fr, regime, flow_type
+
+
+def check_consistency(calc, n=20000):
+    """抽样校验：向量化结果必须与标量结果逐元素一致"""
+    depth, width, velocity = make_columns(n, seed=1)
+    depth[::97] = 0.0  # 覆盖无水断面
+    scalar = run_scalar(calc, depth, width, velocity)
+    q, fr, regime, flow_type = run_vector(calc, depth, width, velocity)
+    for i, (sq, sfr, sregime, sflow) in enumerate(scalar):
+        assert sq == q[i], i
+        assert sfr == round(float(fr[i]), 3), i
+        assert sregime == REGIME_LABELS[regime[i]], i
+        assert sflow == FLOW_TYPE_LABELS[flow_type[i]], i
+
+
+def main():
+    parser = argparse.ArgumentParser(description="HydraulicCalculator 标量 vs 向量化基准")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10**4, 10**5, 10**6, 10**7])
+    parser.add_argument("--scalar-max", type=int, default=10**6,
+                        help="超过该行数的标量耗时按每行耗时外推，避免跑几分钟")
+    args = parser.parse_args()
+
+    calc = HydraulicCalculator()
+    check_consistency(calc)
+    print("consistency check: OK")
+    print(f"{'rows':>10} {'scalar (s)':>12} {'vector (s)':>12} {'speedup':>9}")
+
+    per_row = None
+    for n in args.sizes:
+        depth, width, velocity = make_columns(n)
+
+        t0 = time.perf_counter()
+        run_vector(calc, depth, width, velocity)
+        t_vec = time.perf_counter() - t0
+
+        if n <= args.scalar_max:
+            t0 = time.perf_counter()
+            run_scalar(calc, depth, width, velocity)
+            t_scalar = time.perf_counter() - t0
+            per_row = t_scalar / n
+            note = ""
+        else:
+            t_scalar = per_row * n if per_row else float("nan")
+            note = " (extrapolated)"
+
+        print(f"{n:>10} {t_scalar:>12.4f} {t_vec:>12.4f} {t_scalar / t_vec:>8.0f}x{note}")
+
+
+if __name__ == "__main__":
+    main()
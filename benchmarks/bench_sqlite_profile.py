@@ -0,0 +1,108 @@
+# benchmarks/bench_sqlite_profile.py
+# 对比存储配置档在 "看板读 + 采集写" 并发场景下的吞吐
+# 每个配置档都在 channel_monitor.db 的临时副本上运行，不会改动原库
+# 用法: python benchmarks/bench_sqlite_profile.py [--db channel_monitor.db] [--seconds 5]
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+from sqlalchemy import text
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# 导入 models 时会在默认库上建表，这里指向内存库，避免改动被测的原库
+os.environ.setdefault("MONITOR_DB_URL", "sqlite://")
+from database.models import STORAGE_PROFILES, Base, build_engine  # noqa: E402
+from database.codes import REGIME_CODES, FLOW_TYPE_CODES  # noqa: E402
+from database.migrations import migrate  # noqa: E402
+
+HISTORY_SQL = text("SELECT * FROM monitor_data ORDER BY timestamp DESC LIMIT 30")
+# 与写后队列编码后的行一致：判别结果存编码，报警文本存 alert_text 的 id
+INSERT_SQL = text(
+    "INSERT INTO monitor_data (station_id, timestamp, depth, velocity_surf, voltage, velocity_avg, flow_rate,"
+    " fr_number, sediment, floating_count, regime_code, flow_type_code, alert_id)"
+    " VALUES ('default', :timestamp, 2.0, 1.6, 12.5, 1.36, 13.6, 0.307, 0.0, 0,"
+    f" {REGIME_CODES['缓流 (Subcritical)']}, {FLOW_TYPE_CODES['均匀流']}, :alert_id)"
+)
+
+
+def run_profile(src_db, profile, seconds, readers, writers, rows_per_commit):
+    workdir = tempfile.mkdtemp(prefix=f"bench_{profile}_")
+    db_path = os.path.join(workdir, "channel_monitor.db")
+    shutil.copy(src_db, db_path)
+    engine = build_engine(f"sqlite:///{db_path}", profile)
+    # 副本先升级到当前结构 (旧库在这里做离线迁移，不计入测量时间)
+    Base.metadata.create_all(bind=engine)
+    migrate(engine, offline=True)
+    with engine.begin() as conn:
+        conn.execute(text("INSERT OR IGNORE INTO alert_text (text) VALUES ('正常')"))
+        alert_id = conn.execute(text("SELECT id FROM alert_text WHERE text = '正常'")).scalar()
+
+    stop = threading.Event()
+    counts = {"reads": 0, "writes": 0, "errors": 0}
+    lock = threading.Lock()
+
+    def reader():
+        n = 0
+        while not stop.is_set():
+            try:
+                with engine.connect() as conn:
+                    conn.execute(HISTORY_SQL).fetchall()
+                n += 1
+            except Exception:
+                with lock:
+                    counts["errors"] += 1
+        with lock:
+            counts["reads"] += n
+
+    def writer():
+        n = 0
+        while not stop.is_set():
+            try:
+                with engine.begin() as conn:
+                    conn.execute(INSERT_SQL, [{"timestamp": datetime.now(), "alert_id": alert_id}] * rows_per_commit)
+                n += rows_per_commit
+            except Exception:
+                with lock:
+                    counts["errors"] += 1
+        with lock:
+            counts["writes"] += n
+
+    threads = [threading.Thread(target=reader) for _ in range(readers)]
+    threads += [threading.Thread(target=writer) for _ in range(writers)]
+    for t in threads:
+        t.start()
+    time.sleep(seconds)
+    stop.set()
+    for t in threads:
+        t.join()
+
+    engine.dispose()
+    shutil.rmtree(workdir, ignore_errors=True)
+    return {k: v / seconds if k != "errors" else v for k, v in counts.items()}
+
+
+def main():
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    parser = argparse.ArgumentParser(description="SQLite 存储配置档并发读写基准")
+    parser.add_argument("--db", default=os.path.join(root, "channel_monitor.db"))
+    parser.add_argument("--seconds", type=float, default=5.0)
+    parser.add_argument("--readers", type=int, default=4)
+    parser.add_argument("--writers", type=int, default=1)
+    parser.add_argument("--rows-per-commit", type=int, default=1,
+                        help="1 模拟逐条提交，>1 模拟写后队列的微批")
+    parser.add_argument("--profiles", nargs="+", default=list(STORAGE_PROFILES))
+    args = parser.parse_args()
+
+    print(f"{'profile':>8} {'reads/s':>10} {'rows written/s':>15} {'errors':>7}")
+    for profile in args.profiles:
+        res = run_profile(args.db, profile, args.seconds, args.readers, args.writers, args.rows_per_commit)
+        print(f"{profile:>8} {res['reads']:>10.0f} {res['writes']:>15.0f} {res['errors']:>7}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+# benchmarks/bench_stations.py
+# 多测站并发负载测试：K 个模拟测站各自一个线程并发上传，进程内直接调用 FastAPI 应用
+# 结束后校验每个测站的入库条数，并测量单站历史查询 (走数据库) 的耗时
+# 在 channel_monitor.db 的临时副本上运行，不会改动原库
+# 用法: python benchmarks/bench_stations.py [--stations 40] [--readings 200]
+import argparse
+import os
+import random
+import shutil
+import sqlite3
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+def check_ring_wrap():
+    """
+    回归校验：启动时历史不足容量 (complete=True) 的测站，写满一圈后必须回退到数据库，
+    不能再把缓冲当成全部历史
+    """
+    from datetime import datetime, timedelta
+    from core.ringbuffer import ReadingRing
+
+    ring = ReadingRing(capacity=8, station_id="wrap")
+    t0 = datetime(2024, 1, 1)
+    rows = [{"id": i, "timestamp": t0 + timedelta(seconds=i), "depth": 1.0} for i in range(1, 21)]
+    ring.seed(rows[:3], complete=True)
+    assert ring.query(limit=50) is not None and len(ring.query(limit=50)) == 3
+    ring.extend(rows[3:])
+    assert not ring.complete
+    assert ring.query(limit=50) is None                      # 缓冲只有 8 条，库里有 20 条
+    assert ring.query(limit=50, before_id=10) is None        # id < 10 的大部分已被挤出
+    assert ring.delta(None, 50) is None
+    assert ring.delta(1, 50) is None
+    assert [r["id"] for r in ring.query(limit=5)] == list(range(16, 21))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="多测站并发负载测试")
+    parser.add_argument("--db", default=os.path.join(ROOT, "channel_monitor.db"))
+    parser.add_argument("--stations", type=int, default=40)
+    parser.add_argument("--readings", type=int, default=200, help="每个测站上传的读数条数")
+    parser.add_argument("--rate", type=float, default=0.0, help="每个测站每秒上传条数，0 表示不限速")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="bench_stations_")
+    path = os.path.join(workdir, "channel_monitor.db")
+    shutil.copy(args.db, path)
+    os.environ["MONITOR_DB_URL"] = f"sqlite:///{path}"
+    sys.path.insert(0, ROOT)
+
+    check_ring_wrap()
+    print("ring wrap check: OK")
+
+    from fastapi.testclient import TestClient
+    # 副本若是旧库，先做离线升级 (整表转换不计入压测)
+    from database.migrations import main as migrate_main
+    migrate_main([])
+    import main as app_main
+
+    latencies = []
+    errors = []
+    lock = threading.Lock()
+
+    def station(client, sid):
+        depth = 2.0
+        local = []
+        for _ in range(args.readings):
+            depth = max(0.5, depth + random.uniform(-0.05, 0.05))
+            payload = {"station_id": sid, "depth": round(depth, 3),
+                       "velocity_surf": round(4.0 / depth, 3), "voltage": 12.5}
+            t0 = time.perf_counter()
+            resp = client.post("/api/upload_data", json=payload)
+            local.append(time.perf_counter() - t0)
+            if resp.status_code != 200:
+                with lock:
+                    errors.append(resp.status_code)
+            if args.rate:
+                time.sleep(1.0 / args.rate)
+        with lock:
+            latencies.extend(local)
+
+    try:
+        with TestClient(app_main.app) as client:
+            sids = [f"station-{i:02d}" for i in range(args.stations)]
+            threads = [threading.Thread(target=station, args=(client, sid)) for sid in sids]
+            t0 = time.perf_counter()
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+            app_main.writer.flush()
+            elapsed = time.perf_counter() - t0
+
+            total = args.stations * args.readings
+            print(f"stations: {args.stations}, readings: {total}, errors: {len(errors)}")
+            print(f"ingest: {total / elapsed:.0f} rows/s (incl. flush), "
+                  f"p50 {percentile(latencies, 0.50) * 1000:.2f} ms, "
+                  f"p95 {percentile(latencies, 0.95) * 1000:.2f} ms, "
+                  f"p99 {percentile(latencies, 0.99) * 1000:.2f} ms")
+
+            # 单站历史查询：until 参数强制走数据库，检验复合索引是否生效
+            timings = []
+            for sid in sids:
+                t1 = time.perf_counter()
+                rows = client.get("/api/history", params={"station_id": sid, "limit": 100,
+                                                          "until": "2100-01-01T00:00:00"}).json()
+                timings.append(time.perf_counter() - t1)
+                assert all(r["station_id"] == sid for r in rows)
+            print(f"per-station history (DB path, limit=100): median {statistics.median(timings) * 1000:.2f} ms")
+            print("writer:", app_main.writer.stats())
+
+        con = sqlite3.connect(path)
+        counts = dict(con.execute(
+            "SELECT station_id, COUNT(*) FROM monitor_data WHERE station_id LIKE 'station-%' GROUP BY station_id"
+        ))
+        plan = con.execute(
+            "EXPLAIN QUERY PLAN SELECT * FROM monitor_data WHERE station_id = 'station-00' "
+            "ORDER BY timestamp DESC LIMIT 100"
+        ).fetchall()
+        con.close()
+        missing = {sid: counts.get(sid, 0) for sid in sids if counts.get(sid, 0) != args.readings}
+        print("row counts per station:", "OK" if not missing else f"MISMATCH {missing}")
+        print("query plan:", plan[0][-1])
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
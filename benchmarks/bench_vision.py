@@ -0,0 +1,156 @@
+# benchmarks/bench_vision.py
+# 漂浮物识别的单帧耗时与多路并行吞吐：
+# - 单帧：原算法 (全分辨率 findContours + 两遍 Python 循环算 contourArea) 与 Detector (缩放 / ROI / 连通域统计) 对比
+# - 多路：N 个子进程各自解码并识别一段录像，统计总帧率
+# 不指定录像时生成一段合成录像 (渠道内有漂浮物，岸边和水面有小色斑干扰)
+# 用法: python benchmarks/bench_vision.py [clip.mp4 ...] [--workers 1,2,4]
+import argparse
+import multiprocessing
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from vision_sensor import Detector, LOWER_GREEN, UPPER_GREEN, MIN_AREA  # noqa: E402
+
+# 渠道水面区域 (画面下方的梯形)
+CHANNEL_ROI = [[0.1, 0.35], [0.9, 0.35], [1.0, 1.0], [0.0, 1.0]]
+
+
+def legacy_detect(frame):
+    """原 vision_sensor 的识别流程 (基线)"""
+    hsv = cv2.cvtColor(frame, cv2.COLOR_BGR2HSV)
+    mask = cv2.inRange(hsv, LOWER_GREEN, UPPER_GREEN)
+    contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    count = sum(1 for c in contours if cv2.contourArea(c) > MIN_AREA)
+    boxes = []
+    for c in contours:
+        if cv2.contourArea(c) > MIN_AREA:
+            boxes.append(cv2.boundingRect(c))
+    return boxes
+
+
+def make_clip(path, frames=300, size=(1280, 720), fps=30):
+    rng = np.random.default_rng(0)
+    w, h = size
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"MJPG"), fps, size)
+    base = np.zeros((h, w, 3), np.uint8)
+    base[: int(h * 0.35)] = (40, 70, 60)          # 岸坡
+    base[int(h * 0.35):] = (90, 60, 30)           # 水面
+    specks = rng.integers(0, [w, h], size=(400, 2))
+    for i in range(frames):
+        frame = base.copy()
+        frame += rng.integers(0, 12, frame.shape, dtype=np.uint8)
+        for x, y in specks:                       # 小色斑 (低于面积阈值)
+            cv2.circle(frame, (int(x), int(y)), 3, (0, 180, 0), -1)
+        for k in range(6):                        # 漂浮物
+            x = int((i * (4 + k) + k * 230) % w)
+            y = int(h * 0.45 + k * h * 0.09)
+            cv2.ellipse(frame, (x, y), (30 + 3 * k, 18), 15 * k, 0, 360, (20, 200, 40), -1)
+        for k in range(2):                        # 岸边的绿色植被 (ROI 外)
+            cv2.circle(frame, (200 + 600 * k, int(h * 0.15)), 40, (30, 160, 30), -1)
+        writer.write(frame)
+    writer.release()
+    return path
+
+
+def load_frames(path, limit):
+    cap = cv2.VideoCapture(path)
+    frames = []
+    while len(frames) < limit:
+        ret, frame = cap.read()
+        if not ret:
+            break
+        frames.append(frame)
+    cap.release()
+    return frames
+
+
+def time_detector(detect, frames, repeat):
+    counts = [len(detect(f)) for f in frames]
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        for f in frames:
+            detect(f)
+        best = min(best, time.perf_counter() - t0)
+    return best / len(frames), counts
+
+
+def worker(path, scale, roi, results):
+    """单路：解码 + 识别整段录像"""
+    cv2.setNumThreads(1)
+    detector = Detector(scale=scale, roi=roi)
+    cap = cv2.VideoCapture(path)
+    n = 0
+    t0 = time.perf_counter()
+    while True:
+        ret, frame = cap.read()
+        if not ret:
+            break
+        detector(frame)
+        n += 1
+    results.put((n, time.perf_counter() - t0))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="漂浮物识别基准")
+    parser.add_argument("clips", nargs="*", help="录像文件，不指定时生成合成录像")
+    parser.add_argument("--frames", type=int, default=200, help="单帧测试使用的帧数")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--workers", default="1,2,4", help="多路测试的进程数")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="bench_vision_")
+    try:
+        clips = args.clips or [make_clip(os.path.join(workdir, "synthetic.avi"))]
+        cv2.setNumThreads(1)
+
+        variants = [
+            ("legacy (full res, contours)", legacy_detect),
+            ("Detector scale=1.0", Detector(scale=1.0)),
+            ("Detector scale=0.5", Detector(scale=0.5)),
+            ("Detector scale=0.5 + ROI", Detector(scale=0.5, roi=CHANNEL_ROI)),
+            ("Detector scale=0.25 + ROI", Detector(scale=0.25, roi=CHANNEL_ROI)),
+        ]
+        for clip in clips:
+            frames = load_frames(clip, args.frames)
+            h, w = frames[0].shape[:2]
+            print(f"\n{os.path.basename(clip)}: {len(frames)} frames {w}x{h} (single thread)")
+            print(f"{'':>28} {'ms/frame':>9} {'fps':>8} {'speedup':>8} {'mean count':>11} {'= legacy':>9}")
+            base_time, base_counts = None, None
+            for label, detect in variants:
+                per_frame, counts = time_detector(detect, frames, args.repeat)
+                if base_time is None:
+                    base_time, base_counts = per_frame, counts
+                same = np.mean(np.array(counts) == np.array(base_counts))
+                print(f"{label:>28} {per_frame * 1000:9.2f} {1 / per_frame:8.0f} {base_time / per_frame:7.1f}x "
+                      f"{np.mean(counts):11.2f} {same:8.0%}")
+            print("(ROI 之外 (岸坡) 的目标不计数，带 ROI 的结果与原算法不同是预期的)")
+
+        clip = clips[0]
+        print(f"\nmulti-camera: one process per camera, decode + detect {os.path.basename(clip)} (scale=0.5 + ROI)")
+        print(f"{'cameras':>8} {'total fps':>10} {'per camera':>11}   ({os.cpu_count()} CPU)")
+        for n in [int(v) for v in args.workers.split(",")]:
+            results = multiprocessing.Queue()
+            procs = [multiprocessing.Process(target=worker, args=(clip, 0.5, CHANNEL_ROI, results)) for _ in range(n)]
+            t0 = time.perf_counter()
+            for p in procs:
+                p.start()
+            done = [results.get() for _ in procs]
+            for p in procs:
+                p.join()
+            wall = time.perf_counter() - t0
+            frames = sum(d[0] for d in done)
+            print(f"{n:>8} {frames / wall:10.0f} {np.mean([d[0] / d[1] for d in done]):11.0f}")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+# core/broadcast.py
+import asyncio
+import threading
+from collections import deque
+
+
+class Broadcaster:
+    """
+    实时数据扇出广播：上传接口 (线程池线程) 调用 publish()，
+    每个 SSE / WebSocket 连接在事件循环里持有一个有界 asyncio.Queue。
+
+    - 消息在发布时只序列化一次，订阅者拿到的是同一个字符串
+    - 保留最近 backlog 条消息，新连接先收到这段快照
+    - 慢订阅者队列满时丢弃其最旧的消息，不影响上传接口和其他订阅者
+    - 消息按主题 (测站) 发布，订阅时可只订阅一个主题，topic=None 表示订阅全部
+    """
+
+    def __init__(self, backlog=30, queue_size=256):
+        self.backlog = backlog
+        self.queue_size = queue_size
+        self._backlog = deque(maxlen=backlog)   # 全部主题的最近消息
+        self._topic_backlog = {}                # 主题 -> 该主题的最近消息
+        self._subscribers = {}   # asyncio.Queue -> (所属事件循环, 主题)
+        self._lock = threading.Lock()
+        self.published = 0
+        self.dropped = 0
+
+    def publish(self, message: str, topic=None):
+        """发布一条已序列化的消息，可在任意线程调用"""
+        with self._lock:
+            self._backlog.append(message)
+            if topic is not None:
+                backlog = self._topic_backlog.get(topic)
+                if backlog is None:
+                    backlog = self._topic_backlog[topic] = deque(maxlen=self.backlog)
+                backlog.append(message)
+            self.published += 1
+            subscribers = [
+                (queue, loop) for queue, (loop, want) in self._subscribers.items()
+                if want is None or want == topic
+            ]
+        for queue, loop in subscribers:
+            try:
+                loop.call_soon_threadsafe(self._offer, queue, message)
+            except RuntimeError:
+                # 事件循环已关闭，连接随后会自行退订
+                pass
+
+    def _offer(self, queue, message):
+        if queue.full():
+            queue.get_nowait()
+            with self._lock:
+                self.dropped += 1
+        queue.put_nowait(message)
+
+    def subscribe(self, topic=None):
+        """
+        在事件循环中调用，返回 (队列, 快照)
+        快照与订阅在同一把锁内取得，不会漏掉或重复消息
+        """
+        queue = asyncio.Queue(maxsize=self.queue_size)
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            self._subscribers[queue] = (loop, topic)
+            backlog = self._backlog if topic is None else self._topic_backlog.get(topic, ())
+            snapshot = list(backlog)
+        return queue, snapshot
+
+    def unsubscribe(self, queue):
+        with self._lock:
+            self._subscribers.pop(queue, None)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "subscribers": len(self._subscribers),
+                "queued": sum(queue.qsize() for queue in self._subscribers),
+                "published": self.published,
+                "dropped": self.dropped,
+                "backlog": len(self._backlog),
+            }
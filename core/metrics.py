@@ -0,0 +1,237 @@
+# core/metrics.py
+# 进程内运行指标，/metrics 以 Prometheus 文本格式输出
+# - 计数器 / 直方图在热路径上只做一次加锁加法 (直方图多一次二分查找)
+# - 队列深度、丢弃数等已有统计用回调在抓取时读取，平时没有任何开销
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+
+# 秒级耗时的默认桶 (0.1ms ~ 10s)
+DEFAULT_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=()):
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)] + list(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Family:
+    """带标签的指标族：labels(...) 返回 (并缓存) 对应标签组合的子指标"""
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children = {}
+        self._lock = threading.Lock()
+        if not self.labelnames:
+            self._default = self._new_child()
+            self._children[()] = self._default
+
+    def labels(self, *values):
+        key = tuple(str(v) for v in values)
+        child = self._children.get(key)
+        if child is None:
+            if len(key) != len(self.labelnames):
+                raise ValueError(f"{self.name} 需要 {len(self.labelnames)} 个标签值")
+            with self._lock:
+                child = self._children.setdefault(key, self._new_child())
+        return child
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for key, child in sorted(self._children.items()):
+            lines.extend(child.render(self.name, self.labelnames, key))
+        return lines
+
+
+class _CounterChild:
+    __slots__ = ("value", "_lock")
+
+    def __init__(self):
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+    def render(self, name, labelnames, key):
+        return [f"{name}{_format_labels(labelnames, key)} {_format_value(self.value)}"]
+
+
+class Counter(_Family):
+    kind = "counter"
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def inc(self, amount=1):
+        self._default.inc(amount)
+
+
+class _HistogramChild:
+    __slots__ = ("buckets", "counts", "sum", "count", "_lock")
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)   # 最后一个是 +Inf
+        self.sum = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[i] += 1
+            self.sum += value
+            self.count += 1
+
+    @contextmanager
+    def time(self):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start)
+
+    def render(self, name, labelnames, key):
+        with self._lock:
+            counts, total, count = list(self.counts), self.sum, self.count
+        lines, cumulative = [], 0
+        for bound, n in zip(self.buckets + (float("inf"),), counts):
+            cumulative += n
+            le = 'le="%s"' % _format_value(bound)
+            lines.append(f"{name}_bucket{_format_labels(labelnames, key, [le])} {cumulative}")
+        lines.append(f"{name}_sum{_format_labels(labelnames, key)} {_format_value(total)}")
+        lines.append(f"{name}_count{_format_labels(labelnames, key)} {count}")
+        return lines
+
+
+class Histogram(_Family):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames)
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value):
+        self._default.observe(value)
+
+    def time(self):
+        return self._default.time()
+
+
+class CallbackMetric:
+    """
+    抓取时才求值的指标 (gauge 或单调递增的 counter)
+    func 返回一个数值，或 {标签值元组: 数值}
+    """
+
+    def __init__(self, name, documentation, func, kind="gauge", labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.func = func
+        self.kind = kind
+        self.labelnames = tuple(labelnames)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        values = self.func()
+        if not isinstance(values, dict):
+            values = {(): values}
+        for key, value in values.items():
+            lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}")
+        return lines
+
+
+class Registry:
+    """指标注册表；同名指标重复注册时返回已有的对象 (模块被重复导入时不会报错)"""
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _register(self, name, factory):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = factory()
+            return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self._register(name, lambda: Counter(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._register(name, lambda: Histogram(name, documentation, labelnames, buckets))
+
+    def callback(self, name, documentation, func, kind="gauge", labelnames=()):
+        """注册 (或替换) 抓取时求值的指标"""
+        with self._lock:
+            self._metrics[name] = CallbackMetric(name, documentation, func, kind, labelnames)
+            return self._metrics[name]
+
+    def render(self):
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+HTTP_LATENCY = REGISTRY.histogram(
+    "monitor_http_request_seconds", "HTTP 请求耗时 (按路由模板)", ["method", "route"])
+HTTP_REQUESTS = REGISTRY.counter(
+    "monitor_http_requests_total", "HTTP 请求数 (按路由模板与状态码)", ["method", "route", "status"])
+
+
+class MetricsMiddleware:
+    """
+    纯 ASGI 中间件：记录每个 HTTP 请求的耗时与状态码
+    路由标签取匹配到的路由模板 (如 /api/stations/{station_id}/section)，而不是实际路径，标签数量有界
+    流式响应 (SSE、导出) 的耗时为整个响应传输完成的时间
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            route = getattr(scope.get("route"), "path", "unmatched")
+            HTTP_LATENCY.labels(scope["method"], route).observe(time.perf_counter() - start)
+            HTTP_REQUESTS.labels(scope["method"], route, status).inc()
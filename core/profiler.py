@@ -0,0 +1,230 @@
+# core/profiler.py
+# 进程内采样分析器与请求追踪，打包后的 EXE 无法挂外部工具时通过管理接口临时开启
+# - SamplingProfiler：后台线程按固定间隔读取所有线程的调用栈 (sys._current_frames)，
+#   输出 flamegraph.pl / speedscope 可直接读取的折叠栈 (collapsed stack) 文本
+# - Tracer：按请求记录各阶段耗时 (span)，关闭时 span() 只做一次属性判断
+import contextvars
+import sys
+import threading
+import time
+from collections import Counter, deque
+from concurrent.futures import Future
+from datetime import datetime
+
+# 叶子帧位于这些标准库文件中时视为线程空闲 (等锁、等队列、等 I/O)，idle=False 时不计入
+_IDLE_FILES = ("threading.py", "queue.py", "selectors.py", "concurrent/futures/thread.py")
+
+
+def _frame_label(code):
+    """帧名：函数名 (文件名:函数起始行)；折叠栈以分号分隔帧，名字里的分号替换掉"""
+    name = getattr(code, "co_qualname", code.co_name)
+    filename = code.co_filename.replace("\\", "/")
+    short = "/".join(filename.rsplit("/", 2)[-2:]) if "/" in filename else filename
+    return f"{name} ({short}:{code.co_firstlineno})".replace(";", ":")
+
+
+class SamplingProfiler:
+    """
+    统计采样分析器，同一时刻只允许一次采样
+    每次采样持有 GIL 遍历所有线程的栈，开销与线程数和栈深成正比 (十几个线程约几十微秒)，
+    默认 10ms 一次，对业务线程的影响在 1% 左右
+    """
+
+    MAX_SECONDS = 300
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stopping = threading.Event()
+        self._labels = {}          # code 对象 -> 帧名，避免每次采样重复格式化
+        self.stacks = Counter()
+        self.samples = 0
+        self.started_at = None
+        self.duration = 0.0
+        self.interval = 0.01
+        self.idle = True
+        self.future = None
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, seconds, interval=0.01, idle=True):
+        """
+        开始采样 seconds 秒，返回在采样结束时完成的 Future (结果为折叠栈文本)
+        已在采样时抛 RuntimeError
+        """
+        seconds = min(float(seconds), self.MAX_SECONDS)
+        with self._lock:
+            if self.running:
+                raise RuntimeError("已有采样正在进行")
+            self.stacks = Counter()
+            self.samples = 0
+            self.duration = 0.0
+            self.interval = interval
+            self.idle = idle
+            self.started_at = datetime.now()
+            self.future = Future()
+            self._stopping.clear()
+            self._thread = threading.Thread(target=self._run, args=(seconds,), name="sampling-profiler", daemon=True)
+            self._thread.start()
+            return self.future
+
+    def stop(self):
+        """提前结束采样"""
+        self._stopping.set()
+
+    def _label(self, code):
+        label = self._labels.get(code)
+        if label is None:
+            label = self._labels[code] = _frame_label(code)
+        return label
+
+    def _sample(self, own, names):
+        for ident, frame in sys._current_frames().items():
+            if ident == own:
+                continue
+            if not self.idle and frame.f_code.co_filename.replace("\\", "/").endswith(_IDLE_FILES):
+                continue
+            stack = []
+            while frame is not None:
+                stack.append(self._label(frame.f_code))
+                frame = frame.f_back
+            name = names.get(ident)
+            if name is None:   # 采样期间新建的线程 (如线程池扩容)
+                names.update((t.ident, t.name) for t in threading.enumerate())
+                name = names.get(ident, f"thread-{ident}")
+            stack.append(name.replace(";", ":").replace(" ", "_"))
+            self.stacks[";".join(reversed(stack))] += 1
+
+    def _run(self, seconds):
+        own = threading.get_ident()
+        names = {t.ident: t.name for t in threading.enumerate()}
+        start = time.perf_counter()
+        deadline = start + seconds
+        try:
+            while not self._stopping.is_set():
+                now = time.perf_counter()
+                if now >= deadline:
+                    break
+                self._sample(own, names)
+                self.samples += 1
+                # 按计划时刻对齐，采样本身的耗时不累积成漂移
+                next_at = start + self.samples * self.interval
+                self._stopping.wait(max(0.0, next_at - time.perf_counter()))
+            self.duration = time.perf_counter() - start
+            self.future.set_result(self.collapsed())
+        except Exception as e:
+            self.future.set_exception(e)
+
+    def collapsed(self):
+        """折叠栈文本：每行 "线程;外层帧;...;内层帧 次数" """
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+    def status(self):
+        return {
+            "running": self.running,
+            "started_at": self.started_at,
+            "duration": round(self.duration, 3),
+            "interval": self.interval,
+            "idle": self.idle,
+            "samples": self.samples,
+            "stacks": len(self.stacks),
+        }
+
+
+class _NullSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class _Span:
+    __slots__ = ("tracer", "name", "trace", "start", "token", "attrs")
+
+    def __init__(self, tracer, name, trace=None, attrs=None):
+        self.tracer = tracer
+        self.name = name
+        self.trace = trace      # 为 None 时本 span 是一次请求的根
+        self.attrs = attrs
+        self.token = None
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        if self.trace is None:
+            self.trace = {"name": self.name, "start": datetime.now(), "attrs": self.attrs or {},
+                          "spans": [], "_t0": self.start}
+            self.token = self.tracer._current.set(self.trace)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        end = time.perf_counter()
+        trace = self.trace
+        if self.token is not None:
+            self.tracer._current.reset(self.token)
+            trace["duration_ms"] = round((end - self.start) * 1000, 3)
+            if exc_type is not None:
+                trace["error"] = exc_type.__name__
+            del trace["_t0"]
+            self.tracer._finished.append(trace)
+        else:
+            self.finish(self.start, end)
+        return False
+
+    def finish(self, start, end):
+        self.trace["spans"].append({
+            "name": self.name,
+            "offset_ms": round((start - self.trace["_t0"]) * 1000, 3),
+            "duration_ms": round((end - start) * 1000, 3),
+        })
+
+
+class Tracer:
+    """
+    请求级追踪：trace() 开启一次请求的记录，其中的 span() 记录各阶段相对请求开始的偏移与耗时
+    当前请求通过 contextvars 传递，线程池中执行的同步接口也能正确归属
+    只保留最近 max_traces 个请求
+    """
+
+    def __init__(self, max_traces=2000):
+        self.enabled = False
+        self._finished = deque(maxlen=max_traces)
+        self._current = contextvars.ContextVar("monitor_trace", default=None)
+
+    def trace(self, name, **attrs):
+        if not self.enabled:
+            return _NULL_SPAN
+        return _Span(self, name, attrs=attrs)
+
+    def span(self, name):
+        if not self.enabled:
+            return _NULL_SPAN
+        trace = self._current.get()
+        if trace is None:
+            return _NULL_SPAN
+        return _Span(self, name, trace)
+
+    def record(self, name, start):
+        """补记一个从 start (time.perf_counter() 取值) 到现在的 span，用于无法包进 with 的阶段 (如等锁)"""
+        if not self.enabled:
+            return
+        trace = self._current.get()
+        if trace is not None:
+            _Span(self, name, trace).finish(start, time.perf_counter())
+
+    def clear(self):
+        self._finished.clear()
+
+    def traces(self):
+        return list(self._finished)
+
+
+PROFILER = SamplingProfiler()
+TRACER = Tracer()
@@ -0,0 +1,253 @@
+# core/ringbuffer.py
+import threading
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from core.hydraulic import REGIME_LABELS, FLOW_TYPE_LABELS
+
+_EPOCH = datetime(1970, 1, 1)
+_US = timedelta(microseconds=1)
+_INT32_MAX = np.iinfo(np.int32).max
+_INT64_MAX = np.iinfo(np.int64).max
+
+_REGIME_CODES = {label: code for code, label in enumerate(REGIME_LABELS)}
+_FLOW_TYPE_CODES = {label: code for code, label in enumerate(FLOW_TYPE_LABELS)}
+
+# 数值列 (float64)，缺失值记为 NaN，输出时还原为 None
+FLOAT_FIELDS = ("depth", "velocity_surf", "voltage", "velocity_avg", "flow_rate", "fr_number", "sediment")
+
+# /api/history 的输出列 (与 monitor_data 表的列一致)
+HISTORY_FIELDS = ("id", "station_id", "timestamp", "depth", "velocity_surf", "voltage", "velocity_avg",
+                  "flow_rate", "fr_number", "sediment", "floating_count", "regime", "flow_type", "alert_msg")
+# /api/realtime 的输出列 (与上传接口返回的数据包一致)
+REALTIME_FIELDS = ("station_id", "timestamp", "depth", "flow_rate", "velocity_avg", "fr_number", "regime",
+                   "flow_type", "alert_msg", "sediment", "floating_count")
+# /api/history/delta 的默认列 (看板趋势图和日志列表用到的)
+DELTA_FIELDS = ("id", "timestamp", "depth", "sediment", "floating_count")
+
+
+class ReadingRing:
+    """
+    最近 N 条读数的定长环形缓冲，按列存放在 NumPy 数组中
+    - 时间戳存为 int64 微秒，流态/工况存为编码，报警文本存在 object 数组里
+    - 读写都持有同一把锁，读取时拷贝出切片后再组装输出
+    - query() 在缓冲能完整回答时返回结果 (命中)，否则返回 None 由调用方回退到数据库 (未命中)
+    """
+
+    def __init__(self, capacity=1024, station_id=None):
+        self.capacity = capacity
+        self.station_id = station_id
+        self._id = np.zeros(capacity, dtype=np.int64)
+        self._ts = np.zeros(capacity, dtype=np.int64)
+        self._floats = {name: np.full(capacity, np.nan) for name in FLOAT_FIELDS}
+        self._regime = np.zeros(capacity, dtype=np.int8)
+        self._flow_type = np.zeros(capacity, dtype=np.int8)
+        self._floating = np.full(capacity, -1, dtype=np.int32)  # -1 表示缺失 (旧数据没有该列)
+        self._alert = np.empty(capacity, dtype=object)
+
+        self._count = 0          # 累计写入条数，写指针 = _count % capacity
+        self.complete = False    # 为 True 表示缓冲里已包含全部历史数据 (库中数据不足 capacity 条)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return min(self._count, self.capacity)
+
+    # --- 写入 ---
+
+    def append(self, reading):
+        """写入一条读数 (入库字段 dict)"""
+        with self._lock:
+            self._put(reading)
+
+    def extend(self, readings):
+        with self._lock:
+            for reading in readings:
+                self._put(reading)
+
+    def seed(self, readings, complete=False):
+        """启动时用库中最近的记录 (按时间正序) 初始化"""
+        with self._lock:
+            for reading in readings:
+                self._put(reading)
+            self.complete = complete
+
+    def _put(self, r):
+        # 先把所有字段换算好再写入，任何一个字段换算失败都不会留下写了一半的槽位
+        ident = r.get("id") or 0
+        ts = (r["timestamp"] - _EPOCH) // _US
+        floats = [np.nan if r.get(name) is None else float(r[name]) for name in FLOAT_FIELDS]
+        regime = _REGIME_CODES.get(r.get("regime"), 0)
+        flow_type = _FLOW_TYPE_CODES.get(r.get("flow_type"), 0)
+        floating = r.get("floating_count")
+        floating = -1 if floating is None else int(floating)
+        if not 0 <= ident <= _INT64_MAX or not -1 <= floating <= _INT32_MAX:
+            raise ValueError(f"读数超出缓冲列的取值范围: id={ident}, floating_count={floating}")
+
+        i = self._count % self.capacity
+        if self._count >= self.capacity:
+            # 覆盖最旧的一条后缓冲不再包含全部历史，之后的查询按需回退到数据库
+            self.complete = False
+        self._id[i] = ident
+        self._ts[i] = ts
+        for name, value in zip(FLOAT_FIELDS, floats):
+            self._floats[name][i] = value
+        self._regime[i] = regime
+        self._flow_type[i] = flow_type
+        self._floating[i] = floating
+        self._alert[i] = r.get("alert_msg")
+        self._count += 1
+
+    # --- 读取 ---
+
+    def _column_lists(self, idx, fields):
+        """按下标数组拷贝出列，返回 {字段: 值列表}"""
+        cols = {}
+        for name in fields:
+            if name == "id":
+                cols[name] = self._id[idx].tolist()
+            elif name == "station_id":
+                cols[name] = [self.station_id] * len(idx)
+            elif name == "timestamp":
+                cols[name] = [_EPOCH + _US * int(v) for v in self._ts[idx]]
+            elif name == "regime":
+                cols[name] = [REGIME_LABELS[c] for c in self._regime[idx]]
+            elif name == "flow_type":
+                cols[name] = [FLOW_TYPE_LABELS[c] for c in self._flow_type[idx]]
+            elif name == "floating_count":
+                cols[name] = [None if v < 0 else v for v in self._floating[idx].tolist()]
+            elif name == "alert_msg":
+                cols[name] = self._alert[idx].tolist()
+            else:
+                values = self._floats[name][idx]
+                cols[name] = [None if v != v else v for v in values.tolist()]
+        return cols
+
+    def _columns(self, idx, fields):
+        """按下标数组拷贝出列，组装成 dict 列表"""
+        cols = self._column_lists(idx, fields)
+        return [dict(zip(fields, row)) for row in zip(*(cols[name] for name in fields))]
+
+    def _window(self):
+        """缓冲内全部数据的下标 (按写入顺序)"""
+        n = len(self)
+        return np.arange(self._count - n, self._count) % self.capacity
+
+    def last_id(self):
+        """最新一条读数的 id，缓冲为空时返回 None"""
+        with self._lock:
+            if self._count == 0:
+                return None
+            return int(self._id[(self._count - 1) % self.capacity])
+
+    def latest(self):
+        """最新一条读数 (实时数据包格式)，缓冲为空时返回 None"""
+        with self._lock:
+            if self._count == 0:
+                return None
+            idx = np.array([(self._count - 1) % self.capacity])
+            return self._columns(idx, REALTIME_FIELDS)[0]
+
+    def query(self, limit, since=None, before_id=None):
+        """
+        按 /api/history 的语义查询 (结果按时间正序)
+        :return: 行列表；缓冲不能保证结果完整时返回 None
+        """
+        with self._lock:
+            idx = self._window()
+            if since is not None and since.tzinfo is not None:
+                # 带时区的游标交给数据库处理
+                self.misses += 1
+                return None
+            if since is not None:
+                since_us = (since - _EPOCH) // _US
+                # 缓冲里最早的一条必须不晚于 since，才能保证 since 之后的数据都在缓冲内
+                if not self.complete and (len(idx) == 0 or self._ts[idx[0]] > since_us):
+                    self.misses += 1
+                    return None
+                idx = idx[self._ts[idx] > since_us]
+            if before_id is not None:
+                idx = idx[self._id[idx] < before_id]
+
+            if since is not None and before_id is None:
+                idx = idx[:limit]
+            elif len(idx) >= limit or self.complete:
+                idx = idx[-limit:]
+            else:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return self._columns(idx, HISTORY_FIELDS)
+
+    def delta(self, after_id, limit, fields=DELTA_FIELDS):
+        """
+        增量查询：id 大于 after_id 的记录中最新的 limit 条 (按时间正序)，按列返回
+        after_id 为 None 时返回最近 limit 条
+        :return: {字段: 值列表}；缓冲不能保证结果完整时返回 None
+        """
+        with self._lock:
+            idx = self._window()
+            if after_id is not None:
+                newer = idx[self._id[idx] > after_id]
+                # 游标之后的记录有一部分已被挤出缓冲，且缓冲里剩下的不足 limit 条
+                if (not self.complete and len(newer) < limit
+                        and len(idx) and self._id[idx[0]] > after_id):
+                    self.misses += 1
+                    return None
+                idx = newer
+            elif len(idx) < limit and not self.complete:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return self._column_lists(idx[-limit:], fields)
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "capacity": self.capacity,
+                "size": len(self),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / total, 4) if total else None,
+            }
+
+
+class StationRings:
+    """每个测站一个 ReadingRing，按需创建"""
+
+    def __init__(self, capacity=1024):
+        self.capacity = capacity
+        self._rings = {}
+        self._lock = threading.Lock()
+
+    def get(self, station_id):
+        """已有的环形缓冲，没有则返回 None"""
+        return self._rings.get(station_id)
+
+    def ring(self, station_id):
+        ring = self._rings.get(station_id)
+        if ring is None:
+            with self._lock:
+                ring = self._rings.get(station_id)
+                if ring is None:
+                    ring = self._rings[station_id] = ReadingRing(self.capacity, station_id)
+        return ring
+
+    def stations(self):
+        return sorted(self._rings)
+
+    def stats(self):
+        rings = list(self._rings.values())
+        per_station = {ring.station_id: ring.stats() for ring in rings}
+        hits = sum(s["hits"] for s in per_station.values())
+        misses = sum(s["misses"] for s in per_station.values())
+        return {
+            "stations": len(rings),
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": round(hits / (hits + misses), 4) if hits + misses else None,
+            "per_station": per_station,
+        }
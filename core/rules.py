@@ -0,0 +1,375 @@
+# core/rules.py
+# 报警规则引擎：规则写在配置里，加载时编译成 NumPy 向量化判断，单条上传和批量上传走同一套逻辑
+# 配置文件 (环境变量 MONITOR_RULES 指向的 JSON) 修改后自动重新加载，也可通过 /api/rules 在线替换
+import copy
+import json
+import logging
+import os
+import string
+import threading
+import time
+from datetime import datetime
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# 规则可以引用的读数字段；regime / risk / flow_type 为判别结果文本，只能做 == / != 比较
+NUMERIC_FIELDS = ("depth", "velocity_surf", "voltage", "velocity_avg", "flow_rate", "fr_number",
+                  "sediment", "floating_count")
+LABEL_FIELDS = ("regime", "risk", "flow_type")
+RULE_FIELDS = NUMERIC_FIELDS + LABEL_FIELDS
+# 编译规则时试渲染报警文本用的样例值：数值字段按 float，文本字段按 str
+_TEMPLATE_SAMPLES = {**{f: 1.0 for f in NUMERIC_FIELDS}, **{f: "正常" for f in LABEL_FIELDS}}
+
+_OPS = {
+    ">": np.greater,
+    ">=": np.greater_equal,
+    "<": np.less,
+    "<=": np.less_equal,
+    "==": np.equal,
+    "!=": np.not_equal,
+}
+
+# 默认配置与原先写死在代码里的判别、报警逻辑一致
+DEFAULT_RULES = {
+    # 流态判别的 Fr 区间：Fr 小于下限为缓流，大于上限为急流，之间为临界流
+    "regime": {"subcritical_below": 0.95, "supercritical_above": 1.05},
+    "rules": [
+        {"name": "flow_regime", "field": "risk", "op": "!=", "threshold": "正常", "message": "流态: {regime}"},
+        {"name": "floating_debris", "field": "floating_count", "op": ">", "threshold": 3,
+         "message": "漂浮物堆积({floating_count}个)"},
+        {"name": "sediment_high", "field": "sediment", "op": ">", "threshold": 1.5, "message": "泥沙含量过高"},
+    ],
+}
+
+
+class RuleState:
+    """单个测站上一条规则的状态，只在读数提交成功后整体替换"""
+    __slots__ = ("last_value", "last_time", "run_start", "active")
+
+    def __init__(self, last_value=np.nan, last_time=np.nan, run_start=None, active=False):
+        self.last_value = last_value    # 上一条读数的字段值 (变化率用)
+        self.last_time = last_time      # 上一条读数的时间 (秒)
+        self.run_start = run_start      # 条件持续成立的起始时间，未成立为 None (持续时间用)
+        self.active = active            # 上一条读数时是否处于报警状态 (回差用)
+
+
+_INITIAL = RuleState()
+
+
+def _last_index(mask):
+    """每个位置及之前最后一个 True 的下标，没有则为 -1"""
+    return np.maximum.accumulate(np.where(mask, np.arange(mask.size), -1))
+
+
+class Rule:
+    """
+    一条报警规则，配置项:
+    - name: 规则名 (同一规则集中唯一)
+    - field / op / threshold: 阈值条件，如 sediment > 1.5
+    - rate: 变化率条件 {"op": ">", "threshold": 0.1, "per": "reading" | "second"}，
+      为相邻两条读数之差 (per=second 时再除以时间间隔)；可与阈值条件同时给出 (同时满足)，也可单独使用
+    - duration: 条件需持续成立的秒数，默认 0 (立即报警)
+    - hysteresis: 回差，报警后字段值回到 threshold 另一侧超过该幅度才解除，默认 0
+    - message: 报警文本，可用 {字段名} 引用当前读数
+    """
+
+    def __init__(self, config):
+        if not isinstance(config, dict):
+            raise ValueError("规则必须是 JSON 对象")
+        self.config = config
+        self.name = config.get("name")
+        if not self.name:
+            raise ValueError("规则缺少 name")
+        self.field = config.get("field")
+        if self.field not in RULE_FIELDS:
+            raise ValueError(f"规则 {self.name}: 未知的字段 {self.field!r}")
+        self.message = config.get("message") or self.name
+        try:
+            self.template_fields = {f for _, f, _, _ in string.Formatter().parse(self.message) if f}
+        except ValueError as e:
+            raise ValueError(f"规则 {self.name}: 报警文本格式错误 ({e})")
+        unknown = self.template_fields - set(RULE_FIELDS)
+        if unknown:
+            raise ValueError(f"规则 {self.name}: 报警文本引用了未知字段 {', '.join(sorted(unknown))}")
+        # 用各字段的典型取值试渲染一次，格式说明与类型不符 (如文本字段用 :.2f) 时在加载阶段就拒绝
+        try:
+            self.message.format_map({f: _TEMPLATE_SAMPLES[f] for f in self.template_fields})
+        except (ValueError, TypeError, KeyError, IndexError, AttributeError) as e:
+            raise ValueError(f"规则 {self.name}: 报警文本无法渲染 ({e})")
+
+        self.op = config.get("op")
+        self.threshold = config.get("threshold")
+        self.rate = config.get("rate")
+        if self.threshold is None and self.rate is None:
+            raise ValueError(f"规则 {self.name}: threshold 与 rate 至少给出一个")
+        if self.threshold is not None:
+            self._check_op(self.op)
+            if self.field in LABEL_FIELDS:
+                if self.op not in ("==", "!="):
+                    raise ValueError(f"规则 {self.name}: 文本字段只能用 == 或 !=")
+            else:
+                self.threshold = self._number(self.threshold, "threshold")
+        if self.rate is not None:
+            if self.field in LABEL_FIELDS or not isinstance(self.rate, dict):
+                raise ValueError(f"规则 {self.name}: rate 只能用于数值字段，格式为 {{op, threshold, per}}")
+            self._check_op(self.rate.get("op"))
+            self.rate_threshold = self._number(self.rate.get("threshold"), "rate.threshold")
+            self.rate_per_second = self.rate.get("per", "reading") == "second"
+
+        self.duration = self._number(config.get("duration", 0), "duration")
+        self.hysteresis = self._number(config.get("hysteresis", 0), "hysteresis")
+        if self.hysteresis:
+            if self.threshold is None or self.op not in (">", ">=", "<", "<="):
+                raise ValueError(f"规则 {self.name}: hysteresis 需要 >、>=、<、<= 形式的阈值条件")
+            # 报警期间只要字段值还在解除线以内就保持报警
+            self.clear_level = self.threshold - self.hysteresis if self.op in (">", ">=") \
+                else self.threshold + self.hysteresis
+        # 有持续时间、回差或变化率时需要跨读数的状态
+        self.stateful = bool(self.duration or self.hysteresis or self.rate is not None)
+        # 配置指纹：热加载时定义未变的规则保留状态
+        self.key = json.dumps(config, sort_keys=True, ensure_ascii=False)
+
+    def _check_op(self, op):
+        if op not in _OPS:
+            raise ValueError(f"规则 {self.name}: op 必须是 {' '.join(_OPS)} 之一")
+
+    def _number(self, value, what):
+        try:
+            return float(value)
+        except (TypeError, ValueError):
+            raise ValueError(f"规则 {self.name}: {what} 必须是数值")
+
+    def evaluate(self, values, times, state):
+        """
+        对一个测站按时间排序的一组读数求值
+        :param values: 字段值数组
+        :param times: 读数时间数组 (秒)
+        :param state: 该测站上一批读数结束时的 RuleState
+        :return: (是否报警的 bool 数组, 新的 RuleState；无状态规则为 None)
+        """
+        if self.threshold is not None:
+            hit = _OPS[self.op](values, self.threshold)
+        else:
+            hit = np.ones(values.shape, dtype=bool)
+        if not self.stateful:
+            return hit, None
+
+        if self.rate is not None:
+            prev = np.concatenate(([state.last_value], values[:-1]))
+            change = values - prev
+            if self.rate_per_second:
+                elapsed = np.diff(times, prepend=state.last_time)
+                with np.errstate(divide="ignore", invalid="ignore"):
+                    change = np.where(elapsed > 0, change / elapsed, np.nan)
+            # 没有上一条读数时差值为 NaN，比较结果为 False
+            hit &= _OPS[self.rate["op"]](change, self.rate_threshold)
+
+        run_start = None
+        if self.duration:
+            # 每个位置所在的连续成立段的起始时间；段从本批第一条开始时接续上一批的起始时间
+            start_idx = _last_index(~hit) + 1
+            start = times[np.minimum(start_idx, hit.size - 1)]
+            if state.run_start is not None:
+                start = np.where(start_idx == 0, state.run_start, start)
+            run_start = float(start[-1]) if hit[-1] else None
+            hit = hit & (times - start >= self.duration)
+
+        active = hit
+        if self.hysteresis:
+            # 报警一旦触发，直到字段值越过解除线才解除：最近一次触发晚于最近一次越过解除线即为报警中
+            hold = _OPS[self.op](values, self.clear_level)
+            last_hit = _last_index(hit)
+            last_break = _last_index(~hold & ~hit)
+            active = last_hit > last_break
+            if state.active:
+                active |= last_break < 0
+
+        new_state = RuleState(float(values[-1]), float(times[-1]), run_start, bool(active[-1]))
+        return active, new_state
+
+
+class RuleSet:
+    """一次加载的完整配置：Fr 判别区间 + 编译好的规则列表"""
+
+    def __init__(self, config, version=0):
+        if not isinstance(config, dict):
+            raise ValueError("规则配置必须是 JSON 对象")
+        self.config = config
+        self.version = version
+        regime = config.get("regime", DEFAULT_RULES["regime"])
+        try:
+            low, high = float(regime["subcritical_below"]), float(regime["supercritical_above"])
+        except (KeyError, TypeError, ValueError):
+            raise ValueError("regime 需要数值 subcritical_below 与 supercritical_above")
+        if not 0 < low <= high:
+            raise ValueError("regime 需满足 0 < subcritical_below <= supercritical_above")
+        self.critical_band = (low, high)
+
+        self.rules = [Rule(rule) for rule in config.get("rules", [])]
+        names = [rule.name for rule in self.rules]
+        if len(set(names)) != len(names):
+            raise ValueError("规则名重复")
+        self.keys = {rule.key for rule in self.rules}
+        self.fields = {rule.field for rule in self.rules}
+
+
+class RuleEngine:
+    """
+    报警规则引擎
+    - evaluate() 对一个测站的一组读数 (单条即长度为 1) 向量化求值，返回报警文本和待提交的状态
+    - 读数提交成功后调用 commit() 保存状态；调用方需保证同一测站的 evaluate/commit 串行 (上传接口持有测站锁)
+    - 配置文件的修改时间每 reload_interval 秒检查一次，变化后自动重新加载；加载失败时继续使用原配置
+    - on_load 中的回调在每次加载成功后以新 RuleSet 调用 (如更新流态判别的 Fr 区间)
+    """
+
+    def __init__(self, path=None, reload_interval=2.0, on_load=()):
+        self.path = path
+        self.reload_interval = reload_interval
+        self.on_load = list(on_load)
+        self._lock = threading.Lock()
+        self._stations = {}       # 测站 -> (规则集版本, {规则指纹: RuleState})
+        self._mtime = None
+        self._next_check = 0.0
+        self.source = None
+        self.loaded_at = None
+        self.last_error = None
+        self.ruleset = None
+        if path and os.path.exists(path):
+            self.reload()
+        else:
+            self.load(DEFAULT_RULES, source="default")
+
+    def load(self, config, source="api"):
+        """加载一份配置 (dict)，配置有误时抛 ValueError，原配置保持不变"""
+        with self._lock:
+            version = self.ruleset.version + 1 if self.ruleset is not None else 0
+            ruleset = RuleSet(copy.deepcopy(config), version)
+            for callback in self.on_load:
+                callback(ruleset)
+            self.ruleset = ruleset
+            self.source = source
+            self.loaded_at = datetime.now()
+            self.last_error = None
+            return ruleset
+
+    def reload(self):
+        """从配置文件重新加载，文件不存在或有误时抛 ValueError"""
+        if not self.path:
+            raise ValueError("未配置规则文件 (MONITOR_RULES)")
+        try:
+            mtime = os.path.getmtime(self.path)
+            with open(self.path, encoding="utf-8") as f:
+                config = json.load(f)
+            ruleset = self.load(config, source=self.path)
+        except (OSError, ValueError) as e:
+            self.last_error = str(e)
+            raise ValueError(f"规则文件加载失败: {e}")
+        self._mtime = mtime
+        return ruleset
+
+    def check_reload(self):
+        """配置文件修改后重新加载；两次检查至少间隔 reload_interval 秒，平时只是一次时间比较"""
+        now = time.monotonic()
+        if not self.path or now < self._next_check:
+            return
+        self._next_check = now + self.reload_interval
+        try:
+            mtime = os.path.getmtime(self.path)
+        except OSError:
+            return
+        if mtime != self._mtime:
+            try:
+                self.reload()
+                logger.info("报警规则已重新加载: %s", self.path)
+            except ValueError as e:
+                self._mtime = mtime   # 同一个有误的文件不反复尝试
+                logger.error("%s，继续使用原规则", e)
+
+    def _state(self, station_id, ruleset):
+        version, states = self._stations.get(station_id, (None, None))
+        return states if version == ruleset.version else self._migrate(station_id, ruleset)
+
+    def _migrate(self, station_id, ruleset):
+        # 规则集变化后只保留定义未变的规则的状态
+        _, states = self._stations.get(station_id, (None, {}))
+        states = {key: state for key, state in states.items() if key in ruleset.keys}
+        self._stations[station_id] = (ruleset.version, states)
+        return states
+
+    def evaluate(self, station_id, columns, times):
+        """
+        :param columns: {字段名: 按时间排序的值序列}，至少包含规则及报警文本引用到的字段
+        :param times: 读数时间 (秒) 序列，与 columns 等长
+        :return: (每条读数的报警文本列表，无报警为 "正常"; 待 commit() 的状态)
+        """
+        self.check_reload()
+        ruleset = self.ruleset
+        times = np.asarray(times, dtype=np.float64)
+        n = times.size
+        states = self._state(station_id, ruleset)
+        pending = (ruleset, {})
+        arrays = {}
+        hits = []
+        for rule in ruleset.rules:
+            values = arrays.get(rule.field)
+            if values is None:
+                dtype = object if rule.field in LABEL_FIELDS else np.float64
+                values = arrays[rule.field] = np.asarray(columns[rule.field], dtype=dtype)
+            hit, new_state = rule.evaluate(values, times, states.get(rule.key, _INITIAL))
+            if new_state is not None:
+                pending[1][rule.key] = new_state
+            hits.append(hit)
+
+        messages = ["正常"] * n
+        if hits:
+            for i in np.flatnonzero(np.logical_or.reduce(hits)):
+                alerts = []
+                for rule, hit in zip(ruleset.rules, hits):
+                    if hit[i]:
+                        row = {f: _plain(columns[f][i]) for f in rule.template_fields}
+                        try:
+                            alerts.append(rule.message.format_map(row))
+                        except (ValueError, TypeError, KeyError, IndexError, AttributeError) as e:
+                            # 报警文本渲染失败 (如缺失值配数值格式) 不能影响读数入库，退回规则名
+                            logger.warning("规则 %s 报警文本渲染失败: %s", rule.name, e)
+                            alerts.append(rule.name)
+                messages[i] = " | ".join(alerts)
+        return messages, pending
+
+    def commit(self, station_id, pending):
+        """读数提交成功后保存 evaluate() 算出的状态"""
+        ruleset, updates = pending
+        # 求值之后规则集被替换时丢弃这批状态，下一条读数按新规则从头累计
+        if updates and ruleset is self.ruleset:
+            self._state(station_id, ruleset).update(updates)
+
+    @property
+    def critical_band(self):
+        return self.ruleset.critical_band
+
+    def active(self):
+        """当前处于报警状态的有状态规则 {测站: [规则名]}"""
+        names = {rule.key: rule.name for rule in self.ruleset.rules}
+        result = {}
+        for station_id, (_version, states) in list(self._stations.items()):
+            firing = [names[key] for key, state in list(states.items()) if state.active and key in names]
+            if firing:
+                result[station_id] = sorted(firing)
+        return result
+
+    def status(self):
+        return {
+            "version": self.ruleset.version,
+            "source": self.source,
+            "path": self.path,
+            "loaded_at": self.loaded_at,
+            "last_error": self.last_error,
+            "config": self.ruleset.config,
+            "active": self.active(),
+        }
+
+
+def _plain(value):
+    return value.item() if isinstance(value, np.generic) else value
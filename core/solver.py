@@ -0,0 +1,154 @@
+# core/solver.py
+# 曼宁公式正常水深 / 临界水深求解与水位-流量关系 (rating curve)
+# 断面几何通过 CrossSection.lookup() 查表，本模块只依赖其接口
+from functools import lru_cache
+
+import numpy as np
+
+# 底坡类型 (正常水深与临界水深比较)
+SLOPE_MILD, SLOPE_CRITICAL, SLOPE_STEEP = "缓坡 (Mild)", "临界坡 (Critical)", "陡坡 (Steep)"
+
+
+def solve_increasing(func, target, lo, hi, xtol=1e-7, max_iter=60):
+    """
+    向量化求根：对每个元素求 func(h) = target，func 在 [lo, hi] 上单调递增
+    采用 Illinois 改进试位法，区间始终有界 (不会发散)，通常几步即可收敛
+    :param func: 接受并返回 float64 数组的函数
+    :param target: 目标值，标量或数组
+    :param lo, hi: 初始区间，标量或与 target 同形的数组
+    :return: 解数组；target 低于 func(lo) 时返回 lo，高于 func(hi) 时返回 NaN
+    """
+    target = np.atleast_1d(np.asarray(target, dtype=np.float64))
+    a = np.broadcast_to(np.asarray(lo, dtype=np.float64), target.shape).copy()
+    b = np.broadcast_to(np.asarray(hi, dtype=np.float64), target.shape).copy()
+    fa = func(a) - target
+    fb = func(b) - target
+
+    x = np.full(target.shape, np.nan)
+    x[fa >= 0] = a[fa >= 0]
+    x[(fa < 0) & (fb == 0)] = b[(fa < 0) & (fb == 0)]
+    active = np.flatnonzero((fa < 0) & (fb > 0))
+    side = np.zeros(target.shape, dtype=np.int8)   # 上一步更新的是哪一端：-1 左端，1 右端
+    ftol = 1e-12 * np.maximum(np.abs(target), 1.0)
+
+    for _ in range(max_iter):
+        if active.size == 0:
+            break
+        ai, bi, fai, fbi = a[active], b[active], fa[active], fb[active]
+        c = (ai * fbi - bi * fai) / (fbi - fai)
+        fc = func(c) - target[active]
+
+        left = fc < 0
+        # 同一端连续两次被替换时，把另一端的函数值减半，避免试位法单侧收敛过慢
+        fb[active[left & (side[active] == -1)]] *= 0.5
+        fa[active[~left & (side[active] == 1)]] *= 0.5
+        a[active[left]], fa[active[left]] = c[left], fc[left]
+        b[active[~left]], fb[active[~left]] = c[~left], fc[~left]
+        side[active] = np.where(left, -1, 1)
+
+        done = (np.abs(fc) <= ftol[active]) | (b[active] - a[active] <= xtol)
+        x[active[done]] = c[done]
+        active = active[~done]
+
+    if active.size:
+        x[active] = (a[active] + b[active]) / 2
+    return x
+
+
+class RatingCurve:
+    """
+    某断面在给定糙率 n 与底坡 S 下的水力关系，在断面查找表的同一组水深上预先计算：
+    - 曼宁流量 Q = A R^(2/3) S^(1/2) / n (水位-流量关系)
+    - 临界流量 Qc = sqrt(g A^3 / T)
+    水位推流量为一次插值；流量反求正常水深 / 临界水深先查表定出区间，再用 solve_increasing 精化
+    """
+
+    def __init__(self, section, manning_n, slope, g=9.81):
+        if manning_n <= 0 or slope <= 0:
+            raise ValueError("糙率和底坡必须为正数")
+        self.section = section
+        self.manning_n = manning_n
+        self.slope = slope
+        self.g = g
+        self.depths = section.depths
+        self.discharges = self.manning_discharge(self.depths)
+        self.critical_discharges = self.critical_discharge(self.depths)
+        # 封闭断面 (圆管) 的曼宁流量在接近满管前达到最大，反求正常水深只用单调上升段
+        self._peak = int(np.argmax(self.discharges)) if section.closed else len(self.depths) - 1
+        self._q_rising = np.maximum.accumulate(self.discharges[:self._peak + 1])
+        self._qc_rising = np.maximum.accumulate(self.critical_discharges)
+
+    # --- 直接计算 (用于建表与精化) ---
+
+    def manning_discharge(self, depth):
+        area, perimeter, _top = self.section.lookup(depth)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            radius = np.where(perimeter > 0, area / np.where(perimeter > 0, perimeter, 1.0), 0.0)
+        return area * radius ** (2 / 3) * np.sqrt(self.slope) / self.manning_n
+
+    def critical_discharge(self, depth):
+        area, _perimeter, top = self.section.lookup(depth)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return np.where(top > 0, np.sqrt(self.g * area ** 3 / np.where(top > 0, top, 1.0)),
+                            np.where(area > 0, np.inf, 0.0))
+
+    # --- 查表 ---
+
+    def discharge(self, depth):
+        """水位推流量 (流速缺测时估算流量)：表内插值，超出表的范围时直接按曼宁公式计算"""
+        h = np.asarray(depth, dtype=np.float64)
+        q = np.interp(h, self.depths, self.discharges)
+        beyond = h > self.section.max_depth
+        if np.any(beyond):
+            q = np.where(beyond, self.manning_discharge(h), q)
+        return q
+
+    def _solve(self, func, table, flow_rate, hi_limit):
+        q = np.atleast_1d(np.asarray(flow_rate, dtype=np.float64))
+        n = len(table)
+        idx = np.clip(np.searchsorted(table, q), 1, n - 1)
+        lo = self.depths[idx - 1]
+        hi = self.depths[idx]
+        # 超出表的范围 (开口断面的大流量)：把上界逐次加倍直到包住目标
+        over = q > table[-1]
+        if np.any(over) and hi_limit is None:
+            top = self.section.max_depth
+            while func(np.array([top]))[0] < q[over].max() and top < 1e4:
+                top *= 2
+            lo = np.where(over, self.depths[-1], lo)
+            hi = np.where(over, top, hi)
+        return solve_increasing(func, q, lo, hi)
+
+    def normal_depth(self, flow_rate):
+        """正常水深 (均匀流水深)：曼宁流量等于 flow_rate 的水深；超过圆管最大过流能力时为 NaN"""
+        hi_limit = self.depths[self._peak] if self.section.closed else None
+        return self._solve(self.manning_discharge, self._q_rising, flow_rate, hi_limit)
+
+    def critical_depth(self, flow_rate):
+        """临界水深：Fr = 1 (Q^2 T / g A^3 = 1) 的水深"""
+        hi_limit = self.section.max_depth if self.section.closed else None
+        return self._solve(self.critical_discharge, self._qc_rising, flow_rate, hi_limit)
+
+    def slope_type(self, flow_rate):
+        """按正常水深与临界水深的关系判别底坡类型"""
+        yn, yc = self.normal_depth(flow_rate), self.critical_depth(flow_rate)
+        return np.where(np.isclose(yn, yc, rtol=1e-3), SLOPE_CRITICAL, np.where(yn > yc, SLOPE_MILD, SLOPE_STEEP))
+
+    def describe(self, points=50):
+        """按水深等间距抽取若干点，供接口输出"""
+        idx = np.linspace(0, len(self.depths) - 1, points).round().astype(int)
+        return {
+            "manning_n": self.manning_n,
+            "slope": self.slope,
+            "max_discharge": round(float(self.discharges[self._peak]), 4),
+            "depth": np.round(self.depths[idx], 4).tolist(),
+            "discharge": np.round(self.discharges[idx], 4).tolist(),
+            "critical_discharge": [None if not np.isfinite(v) else round(float(v), 4)
+                                   for v in self.critical_discharges[idx]],
+        }
+
+
+@lru_cache(maxsize=256)
+def rating_curve(section, manning_n, slope):
+    """按 (断面, 糙率, 底坡) 缓存的水位-流量关系 (断面对象本身按配置缓存，可直接作为键)"""
+    return RatingCurve(section, manning_n, slope)
@@ -0,0 +1,54 @@
+# core/state.py
+import threading
+from contextlib import contextmanager
+
+# 单站部署 / 旧数据使用的测站编号
+DEFAULT_STATION = "default"
+
+
+class ChannelState:
+    """单个渠道的最近状态 (目前只需要上一条水深)"""
+    __slots__ = ("lock", "last_depth")
+
+    def __init__(self, last_depth=None):
+        self.lock = threading.Lock()
+        self.last_depth = last_depth
+
+
+class LastStateCache:
+    """
+    按渠道 (测站 station_id) 缓存最近一条读数，替代每次上传前的 "查最后一条记录"
+    - 启动时用 seed() 从数据库灌入初始值
+    - 写入路径通过 hold() 拿到渠道状态：计算 -> 提交 -> 更新 在同一把锁内完成，
+      uvicorn 线程池里并发的 upload_v2 / upload_sensor_data 不会读到过期的 last_depth
+    """
+
+    def __init__(self):
+        self._states = {}
+        self._guard = threading.Lock()
+
+    def _state(self, channel):
+        state = self._states.get(channel)
+        if state is None:
+            with self._guard:
+                state = self._states.setdefault(channel, ChannelState())
+        return state
+
+    def seed(self, channel, last_depth):
+        """用数据库中的最后一条记录初始化渠道状态"""
+        state = self._state(channel)
+        with state.lock:
+            state.last_depth = last_depth
+
+    def get(self, channel=DEFAULT_STATION):
+        return self._state(channel).last_depth
+
+    @contextmanager
+    def hold(self, channel=DEFAULT_STATION):
+        """
+        独占某个渠道的状态，调用方在提交成功后自行更新 state.last_depth
+        提交失败抛异常时状态保持不变
+        """
+        state = self._state(channel)
+        with state.lock:
+            yield state
@@ -2,6 +2,7 @@
 import streamlit as st
 import streamlit.components.v1 as components
 import requests
+import json
 import subprocess
 import sys
 import os
@@ -120,24 +121,28 @@ if st.session_state['cam_pid'] is None and st.session_state['sim_pid'] is None:
 # ==============================================================================
 # 3. 3D 渲染
 # ==============================================================================
-def render_3d_channel(depth, width=5, length=50):
-    X = np.linspace(0, length, 30)
-    Y = np.linspace(-width / 2, width / 2, 10)
-    X, Y = np.meshgrid(X, Y)
-    Z_bed = -0.005 * X 
-    
-    water_level = Z_bed.max() + depth
-    Z_water = np.full_like(Z_bed, water_level) 
-    max_display_h = Z_bed.max() + 4.0
-    Z_water[Z_water > max_display_h] = max_display_h
+WATER_STEP = 0.01   # 水面高程量化步长 (m)，相近水位共用同一份水面缓存
+CHANNEL_ROWS = 10   # 横向网格数
+
+@st.cache_resource(max_entries=16)
+def channel_base(width, length, bed=None):
+    """
+    3D 图的静态部分：河床曲面 + 布局，按几何参数缓存并在各会话间共享 (只读，勿修改)
+    bed 为 /api/profile 给出的沿程河床高程 (沿渠长等间距)，无则按底坡 0.005 绘制
+    返回 (图的字典形式, 河床最高点高程, 沿程点数)
+    """
+    x = np.linspace(0, length, len(bed) if bed else 30)
+    Y = np.linspace(-width / 2, width / 2, CHANNEL_ROWS)
+    X, Y = np.meshgrid(x, Y)
+    Z_bed = np.broadcast_to(np.array(bed), X.shape) if bed else -0.005 * X
     
     fig = go.Figure(data=[
         go.Surface(x=X, y=Y, z=Z_bed, colorscale=[[0, '#3d3d3d'], [1, '#5c4d3c']], name='河床', showscale=False, opacity=1.0),
-        go.Surface(x=X, y=Y, z=Z_water, colorscale=[[0, 'rgba(0, 191, 255, 0.6)'], [1, 'rgba(30, 144, 255, 0.8)']], name='水面', showscale=False, opacity=0.8)
+        go.Surface(x=X, y=Y, colorscale=[[0, 'rgba(0, 191, 255, 0.6)'], [1, 'rgba(30, 144, 255, 0.8)']], name='水面', showscale=False, opacity=0.8)
     ])
     
     fig.update_layout(
-        title=dict(text=f'🌊 3D 数字孪生渠道 (实时水位: {depth:.2f}m)', font=dict(color='white', size=20)), 
+        title=dict(text='', font=dict(color='white', size=20)), 
         margin=dict(l=10, r=10, b=10, t=40),
         scene=dict(
             xaxis=dict(title='', showticklabels=False, backgroundcolor='#0e1117'),
@@ -150,7 +155,31 @@ def render_3d_channel(depth, width=5, length=50):
         paper_bgcolor='rgba(0,0,0,0)',
         font=dict(color='white')
     )
-    return fig
+    return fig.to_dict(), float(Z_bed.max()), len(x)
+
+@st.cache_data(max_entries=512)
+def water_surface(levels, cap):
+    """量化后的沿程水面高程 (WATER_STEP 的整数倍) -> 水面曲面 z，超过显示上限的部分截断"""
+    z = np.minimum(np.array(levels) * WATER_STEP, cap)
+    return np.broadcast_to(z, (CHANNEL_ROWS, len(z))).tolist()
+
+def render_3d_channel(depth, width=5, length=50, profile=None):
+    """
+    profile 为 /api/profile 返回的渐变流水面线，无则按水平水面绘制
+    河床与布局取自缓存，每次刷新只替换水面 z 与标题 (浅拷贝，不修改共享的缓存对象)
+    """
+    if profile:
+        base, bed_top, n = channel_base(width, length, tuple(profile["bed"]))
+        surface = np.array(profile["surface"])
+        title = f'🌊 3D 数字孪生渠道 (实时水位: {depth:.2f}m · 水面线 {profile["profile_type"]})'
+    else:
+        base, bed_top, n = channel_base(width, length)
+        surface = np.full(n, bed_top + depth)
+        title = f'🌊 3D 数字孪生渠道 (实时水位: {depth:.2f}m)'
+    levels = tuple(np.round(surface / WATER_STEP).astype(int).tolist())
+    bed, water = base["data"]
+    layout = dict(base["layout"], title=dict(base["layout"]["title"], text=title))
+    return {"data": [bed, dict(water, z=water_surface(levels, bed_top + 4.0))], "layout": layout}
 
 # ==============================================================================
 # 4. 侧边栏
@@ -162,6 +191,9 @@ with st.sidebar:
     if st.session_state['cam_pid']: st.success("📷 摄像头在线")
     elif st.session_state['sim_pid']: st.info("💻 模拟器运行中")
     else: st.warning("⚠️ 无数据源")
+    try: station_list = [s['station_id'] for s in requests.get(f"{API_URL}/stations", timeout=0.5).json()] or ["default"]
+    except: station_list = ["default"]
+    STATION = st.selectbox("📍 测站", station_list, key="station_id")
     st.markdown("---")
     if not st.session_state['auth']:
         st.markdown("#### 🔒 管理员登录")
@@ -175,7 +207,7 @@ with st.sidebar:
         st.success("👤 管理员已认证")
         if st.button("📥 导出报表"):
             try:
-                resp = requests.get(f"{API_URL}/export")
+                resp = requests.get(f"{API_URL}/export", params={"station_id": STATION})
                 if resp.status_code == 200: st.download_button("📄 点击下载", resp.content, f"Report_{time.strftime('%H%M')}.csv", "text/csv")
             except: st.error("导出失败")
         if st.button("🚪 退出系统"): st.session_state['auth'] = False; st.rerun()
@@ -190,10 +222,16 @@ with tab1:
     c_3d, c_cam = st.columns([3, 1])
     with c_3d:
         try:
-            res = requests.get(f"{API_URL}/realtime", timeout=0.5).json()
+            res = requests.get(f"{API_URL}/realtime", params={"station_id": STATION}, timeout=0.5).json()
             d_val = res.get('depth', 2.0)
         except: d_val = 2.0
-        st.plotly_chart(render_3d_channel(d_val), use_container_width=True)
+        try:
+            prof = requests.get(f"{API_URL}/profile", params={"station_id": STATION, "length": 50, "points": 30}, timeout=0.5)
+            profile = prof.json() if prof.status_code == 200 else None
+        except: profile = None
+        t_render = time.perf_counter()
+        st.plotly_chart(render_3d_channel(d_val, profile=profile), use_container_width=True)
+        st.caption(f"3D 渲染耗时 {(time.perf_counter() - t_render) * 1000:.1f} ms")
 
     with c_cam:
         st.markdown("##### 🕹️ 视觉传感器")
@@ -216,6 +254,9 @@ with tab1:
     cam_text = "🟢 真实影像 (Live)" if st.session_state['cam_pid'] else "🔵 模拟仿真 (Sim)"
     cam_color = "#00fa9a" if st.session_state['cam_pid'] else "#00BFFF"
 
+    # 测站编号来自后端 (任意上传方都能写入)，以 JSON 字符串嵌入脚本；转义 "<" 防止提前闭合 <script>
+    station_js = json.dumps(STATION).replace("<", "\\u003c")
+
     html_code = f"""
     <!DOCTYPE html>
     <html>
@@ -268,6 +309,7 @@ with tab1:
             <div id="log-list"><div style="padding:10px; text-align:center; color:#666;">系统初始化中...</div></div>
         </div>
         <script>
+            var STATION = {station_js};
             var myChart = echarts.init(document.getElementById('chart-main'));
             var option = {{
                 backgroundColor: 'transparent', tooltip: {{ trigger: 'axis' }}, legend: {{ data: ['水深', '含沙量'], textStyle: {{ color: '#aaa', fontSize: 10 }}, top: 0 }},
@@ -277,55 +319,109 @@ with tab1:
                 series: [{{ name: '水深', type: 'line', smooth: true, showSymbol: false, data: [], itemStyle: {{ color: '#00BFFF' }}, areaStyle: {{ opacity: 0.2 }} }}, {{ name: '含沙量', type: 'line', smooth: true, showSymbol: false, yAxisIndex: 1, data: [], itemStyle: {{ color: '#FFA500' }} }}]
             }};
             myChart.setOption(option);
+            function renderRealtime(data) {{
+                if(!data.depth) {{
+                    document.getElementById('log-list').innerHTML = '<div style="padding:10px; text-align:center; color:#666;">等待模拟器数据接入...</div>';
+                    return false;
+                }}
+                
+                document.getElementById('d-depth').innerText = data.depth; document.getElementById('d-flow').innerText = data.flow_rate; document.getElementById('d-vel').innerText = data.velocity_avg; document.getElementById('d-sed').innerText = data.sediment; document.getElementById('d-float').innerText = data.floating_count;
+                let frInfo = data.fr_number + " | " + data.regime.replace("Subcritical","缓").replace("Supercritical","急").replace("Critical", "临界");
+                document.getElementById('d-fr').innerText = frInfo;
+                
+                let aiBox = document.getElementById('ai-box');
+                if (data.floating_count > 0) {{ 
+                    aiBox.style.display = 'block'; 
+                    let randX = 20 + Math.sin(new Date().getTime()/500)*10;
+                    let randY = 30 + Math.cos(new Date().getTime()/500)*10;
+                    aiBox.style.top = randY + "%"; aiBox.style.left = randX + "%"; 
+                    aiBox.innerText = "Obj: " + data.floating_count; 
+                }} else {{ aiBox.style.display = 'none'; }}
+                
+                let frCard = document.getElementById('card-fr'); let frColor = (data.regime.indexOf("Subcritical") >= 0) ? "#00fa9a" : "#ff4b4b"; frCard.style.borderLeftColor = frColor; document.getElementById('d-fr').style.color = frColor;
+                let pct = (data.depth / 4.0) * 100; if(pct>100) pct=100; document.getElementById('water-bar').style.height = pct + "%"; document.getElementById('water-label').style.bottom = pct + "%"; document.getElementById('water-label').innerText = data.depth + " m";
+                return true;
+            }}
+            // 趋势图与日志的客户端缓冲：推送来的读数直接追加，截断到 HIST_MAX 条；
+            // 推送不连续 (消息里的 prev_id 与本地游标 last_id 对不上) 或断线重连后，才按游标拉取增量补齐
+            var HIST_MAX = 30, lastId = null, histBusy = false, histAgain = false;
+            // 报警状态直接使用后端规则引擎给出的 alert_msg，看板不再自行判断阈值
+            var hist = {{ id: [], timestamp: [], depth: [], sediment: [], floating_count: [], alert_msg: [] }};
+            function fmtTime(ts) {{ let d = new Date(ts); return d.getHours()+":"+d.getMinutes()+":"+d.getSeconds(); }}
+            function appendHistory(cols) {{
+                for (let k in hist) {{ hist[k] = hist[k].concat(cols[k]).slice(-HIST_MAX); }}
+                myChart.setOption({{ xAxis: {{ data: hist.timestamp.map(fmtTime) }}, series: [{{ data: hist.depth.map(v => v || 0) }}, {{ data: hist.sediment.map(v => v || 0) }}] }});
+
+                // 报警文本来自可在线编辑的规则模板，日志行用 textContent 填充，不按 HTML 解析
+                let list = document.getElementById('log-list');
+                list.replaceChildren();
+                for (let i = hist.id.length - 1; i >= Math.max(0, hist.id.length - 6); i--) {{
+                    let count = hist.floating_count[i] || 0; let alert = hist.alert_msg[i];
+                    let warn = alert && alert !== "正常";
+                    let badge = document.createElement('span');
+                    badge.className = warn ? 'badge-warn' : 'badge-ok'; badge.textContent = warn ? '报警' : '正常';
+                    let row = document.createElement('div'); row.className = 'log-row';
+                    let cells = [
+                        ['col-time', new Date(hist.timestamp[i]).toLocaleTimeString()],
+                        ['col-event', warn ? "⚠️ " + alert : (count > 0 ? "发现漂浮物" : "常规监测")],
+                        ['col-val', count + " 个 / " + hist.sediment[i] + " kg/m³"],
+                        ['col-status', badge],
+                    ];
+                    for (let [cls, content] of cells) {{
+                        let cell = document.createElement('div'); cell.className = cls;
+                        if (typeof content === 'string') cell.textContent = content; else cell.appendChild(content);
+                        row.appendChild(cell);
+                    }}
+                    list.appendChild(row);
+                }}
+            }}
+            async function refreshHistory() {{
+                // 拉取进行中又需要补齐时，等这次完成后按新游标再拉一次
+                if (histBusy) {{ histAgain = true; return; }}
+                histBusy = true;
+                try {{
+                    let url = "{API_URL}/history/delta?limit=" + HIST_MAX + "&station_id=" + encodeURIComponent(STATION) + "&fields=" + Object.keys(hist).join(",") + (lastId === null ? "" : "&after_id=" + lastId);
+                    let res = await (await fetch(url)).json();
+                    let cols = res.columns;
+                    if (!cols || cols.id.length === 0) return;
+                    lastId = res.last_id;
+                    appendHistory(cols);
+                }} catch(e) {{ }} finally {{
+                    histBusy = false;
+                    if (histAgain) {{ histAgain = false; refreshHistory(); }}
+                }}
+            }}
+            function onReading(data) {{
+                if (data.id === undefined || data.id === null) return;
+                if (lastId !== null && data.id <= lastId) return;  // 重连后快照里已经显示过的读数
+                if (histBusy || lastId === null || data.prev_id !== lastId) {{ refreshHistory(); return; }}
+                lastId = data.id;
+                appendHistory({{ id: [data.id], timestamp: [data.timestamp], depth: [data.depth], sediment: [data.sediment],
+                                 floating_count: [data.floating_count], alert_msg: [data.alert_msg] }});
+            }}
             async function refreshData() {{
                 try {{
-                    let res = await fetch("{API_URL}/realtime");
-                    let data = await res.json();
-                    
-                    if(!data.depth) {{
-                        document.getElementById('log-list').innerHTML = '<div style="padding:10px; text-align:center; color:#666;">等待模拟器数据接入...</div>';
-                        return;
-                    }}
-                    
-                    document.getElementById('d-depth').innerText = data.depth; document.getElementById('d-flow').innerText = data.flow_rate; document.getElementById('d-vel').innerText = data.velocity_avg; document.getElementById('d-sed').innerText = data.sediment; document.getElementById('d-float').innerText = data.floating_count;
-                    let frInfo = data.fr_number + " | " + data.regime.replace("Subcritical","缓").replace("Supercritical","急").replace("Critical", "临界");
-                    document.getElementById('d-fr').innerText = frInfo;
-                    
-                    let aiBox = document.getElementById('ai-box');
-                    if (data.floating_count > 0) {{ 
-                        aiBox.style.display = 'block'; 
-                        let randX = 20 + Math.sin(new Date().getTime()/500)*10;
-                        let randY = 30 + Math.cos(new Date().getTime()/500)*10;
-                        aiBox.style.top = randY + "%"; aiBox.style.left = randX + "%"; 
-                        aiBox.innerText = "Obj: " + data.floating_count; 
-                    }} else {{ aiBox.style.display = 'none'; }}
-                    
-                    let frCard = document.getElementById('card-fr'); frCard.style.borderLeftColor = (data.fr_number > 1) ? "#ff4b4b" : "#00fa9a"; document.getElementById('d-fr').style.color = (data.fr_number > 1) ? "#ff4b4b" : "#00fa9a";
-                    let pct = (data.depth / 4.0) * 100; if(pct>100) pct=100; document.getElementById('water-bar').style.height = pct + "%"; document.getElementById('water-label').style.bottom = pct + "%"; document.getElementById('water-label').innerText = data.depth + " m";
-                    
-                    let resHist = await fetch("{API_URL}/history?limit=30"); 
-                    let hist_res = await resHist.json(); 
-                    let xData=[], yDepth=[], ySed=[]; 
-                    let chartData = [...hist_res].reverse();
-                    if (chartData.length > 0) {{
-                        chartData.forEach(item => {{ 
-                            let d = new Date(item.timestamp); xData.push(d.getHours()+":"+d.getMinutes()+":"+d.getSeconds()); yDepth.push(item.depth || 0); ySed.push(item.sediment || 0); 
-                        }});
-                    }}
-                    myChart.setOption({{ xAxis: {{ data: xData }}, series: [{{ data: yDepth }}, {{ data: ySed }}] }});
-                    
-                    let listHtml = ""; hist_res.slice(0, 6).forEach(item => {{
-                        let d = new Date(item.timestamp); let timeStr = d.toLocaleTimeString(); let count = item.floating_count || 0;
-                        let statusHtml = '<span class="badge-ok">正常</span>'; let eventText = "常规监测";
-                        let valText = count + " 个";
-                        if (count > 0) {{ statusHtml = '<span class="badge-warn">异常</span>'; eventText = "⚠️ 发现漂浮物"; }} 
-                        else if (item.sediment > 1.0) {{ statusHtml = '<span class="badge-warn">淤积风险</span>'; eventText = "泥沙含量过高"; valText=item.sediment+" kg/m³"; }}
-                        listHtml += `<div class="log-row"><div class="col-time">${{timeStr}}</div><div class="col-event">${{eventText}}</div><div class="col-val">${{valText}}</div><div class="col-status">${{statusHtml}}</div></div>`;
-                    }});
-                    document.getElementById('log-list').innerHTML = listHtml;
+                    let res = await fetch("{API_URL}/realtime?station_id=" + encodeURIComponent(STATION));
+                    if (renderRealtime(await res.json())) refreshHistory();
                 }} catch(e) {{ }}
             }}
-            setInterval(refreshData, 1000); window.onresize = function() {{ myChart.resize(); }};
+            if (window.EventSource) {{
+                // 服务端推送：有新读数才更新，断线后浏览器自动重连
+                var source = new EventSource("{API_URL}/stream?station_id=" + encodeURIComponent(STATION)), opened = false;
+                source.onopen = function() {{
+                    // 断线期间的读数不会补推 (快照只有最近几十条)，重连后按游标补拉一次
+                    if (opened) refreshHistory();
+                    opened = true;
+                }};
+                source.onmessage = function(e) {{
+                    let data = JSON.parse(e.data);
+                    if (renderRealtime(data)) onReading(data);
+                }};
+                refreshData();
+            }} else {{
+                setInterval(refreshData, 1000);
+            }}
+            window.onresize = function() {{ myChart.resize(); }};
         </script>
     </body>
     </html>
@@ -336,7 +432,7 @@ with tab1:
 with tab2:
     st.subheader("📈 历史数据全集")
     try:
-        hist_resp = requests.get(f"{API_URL}/history?limit=100")
+        hist_resp = requests.get(f"{API_URL}/history", params={"limit": 100, "station_id": STATION})
         if hist_resp.status_code == 200:
             df = pd.DataFrame(hist_resp.json())
             if not df.empty:
@@ -345,6 +441,19 @@ with tab2:
             else: st.info("无数据")
     except: st.error("无法连接数据库")
 
+    st.markdown("#### 📉 长周期趋势 (降采样)")
+    bucket_label = st.radio("时间粒度", ["1 分钟", "1 小时", "1 天"], horizontal=True, key="agg_bucket")
+    bucket = {"1 分钟": "1m", "1 小时": "1h", "1 天": "1d"}[bucket_label]
+    try:
+        agg = requests.get(f"{API_URL}/history/aggregate", params={"bucket": bucket, "limit": 1440, "station_id": STATION}, timeout=2).json()
+        df_agg = pd.DataFrame(agg)
+        if not df_agg.empty:
+            df_agg['bucket_start'] = pd.to_datetime(df_agg['bucket_start'])
+            fig_agg = px.line(df_agg, x='bucket_start', y=['depth_min', 'depth_mean', 'depth_max'], labels={"bucket_start": "时间", "value": "水深 (m)", "variable": ""})
+            st.plotly_chart(fig_agg, use_container_width=True)
+        else: st.info("暂无汇总数据")
+    except: st.error("汇总数据获取失败")
+
 # --- Tab 3 ---
 with tab3:
     st.subheader("🧠 管理决策中心")
@@ -372,7 +481,7 @@ with tab3:
         st.markdown("---")
         st.markdown("#### 2. 深度数据挖掘")
         try:
-            data = requests.get(f"{API_URL}/history?limit=300").json()
+            data = requests.get(f"{API_URL}/history", params={"limit": 300, "station_id": STATION}).json()
             df = pd.DataFrame(data)
             for col in ['sediment', 'velocity_surf', 'regime', 'depth']:
                 if col not in df.columns: df[col] = 0
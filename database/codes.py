@@ -0,0 +1,71 @@
+# database/codes.py
+# 判别结果的紧凑存储：流态/工况存为小整数编码 (core.hydraulic 中标签的下标)，
+# 报警文本存一次到 alert_text 表，monitor_data 只存其 id
+# 接口输出不变：读取时在 SQL 里把编码还原为原来的文本
+import threading
+
+from sqlalchemy import case, select
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from core.hydraulic import REGIME_LABELS, FLOW_TYPE_LABELS
+from database.models import MonitorData, AlertText
+
+REGIME_CODES = {label: code for code, label in enumerate(REGIME_LABELS)}
+FLOW_TYPE_CODES = {label: code for code, label in enumerate(FLOW_TYPE_LABELS)}
+
+# 还原为文本的列表达式，列名与原表结构一致
+DECODED_COLUMNS = {
+    "regime": case(dict(enumerate(REGIME_LABELS)), value=MonitorData.regime_code).label("regime"),
+    "flow_type": case(dict(enumerate(FLOW_TYPE_LABELS)), value=MonitorData.flow_type_code).label("flow_type"),
+    "alert_msg": (
+        select(AlertText.text).where(AlertText.id == MonitorData.alert_id).scalar_subquery().label("alert_msg")
+    ),
+}
+
+
+def column(name):
+    """接口字段名 -> 查询用的列表达式"""
+    return DECODED_COLUMNS.get(name, MonitorData.__table__.c.get(name))
+
+
+class RowEncoder:
+    """
+    入库前把读数行 (文本形式) 转换为表结构 (编码形式)，作为 WriteBehindWriter 的 encode 使用
+    - 报警文本的 id 在进程内分配并缓存 (本进程是该库唯一的写入方)
+    - 每批都把本批用到的报警文本以 INSERT OR IGNORE 写入，事务回滚重试后引用依然完整
+    """
+
+    def __init__(self):
+        self._alert_ids = None
+        self._next_id = 1
+        self._lock = threading.Lock()
+
+    def _load(self, db):
+        self._alert_ids = {t: i for i, t in db.execute(select(AlertText.id, AlertText.text))}
+        self._next_id = max(self._alert_ids.values(), default=0) + 1
+
+    def _alert_id(self, text):
+        alert_id = self._alert_ids.get(text)
+        if alert_id is None:
+            alert_id = self._alert_ids[text] = self._next_id
+            self._next_id += 1
+        return alert_id
+
+    def __call__(self, db, rows):
+        with self._lock:
+            if self._alert_ids is None:
+                self._load(db)
+            used = {}
+            encoded = []
+            for row in rows:
+                out = {k: v for k, v in row.items() if k not in DECODED_COLUMNS}
+                out["regime_code"] = REGIME_CODES.get(row.get("regime"))
+                out["flow_type_code"] = FLOW_TYPE_CODES.get(row.get("flow_type"))
+                text = row.get("alert_msg")
+                if text is not None:
+                    out["alert_id"] = used[text] = self._alert_id(text)
+                encoded.append(out)
+        if used:
+            stmt = sqlite_insert(AlertText).on_conflict_do_nothing()
+            db.execute(stmt, [{"id": i, "text": t} for t, i in used.items()])
+        return encoded
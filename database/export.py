@@ -0,0 +1,224 @@
+# database/export.py
+# 数据导出：按批从数据库游标读取，边读边编码边输出，内存占用与表大小无关
+import csv
+import io
+import time
+import zlib
+
+from sqlalchemy import select
+
+from core.metrics import REGISTRY
+from database.codes import column
+from database.models import MonitorData
+
+# 可导出的列：参数名 -> (表头, 列)
+EXPORT_COLUMNS = {
+    "id": ("ID", column("id")),
+    "station_id": ("测站", column("station_id")),
+    "timestamp": ("时间", column("timestamp")),
+    "depth": ("水深", column("depth")),
+    "velocity_surf": ("流速", column("velocity_surf")),
+    "voltage": ("电压", column("voltage")),
+    "velocity_avg": ("平均流速", column("velocity_avg")),
+    "flow_rate": ("流量", column("flow_rate")),
+    "fr_number": ("Fr数", column("fr_number")),
+    "sediment": ("含沙量", column("sediment")),
+    "floating_count": ("漂浮物", column("floating_count")),
+    "regime": ("流态", column("regime")),
+    "flow_type": ("工况", column("flow_type")),
+    "alert_msg": ("报警", column("alert_msg")),
+}
+# 列式导出的类型；判别结果这类重复度高的文本列使用字典编码
+_ARROW_TYPES = {
+    "id": "int64",
+    "station_id": "dictionary",
+    "timestamp": "timestamp",
+    "depth": "float64",
+    "velocity_surf": "float64",
+    "voltage": "float64",
+    "velocity_avg": "float64",
+    "flow_rate": "float64",
+    "fr_number": "float64",
+    "sediment": "float64",
+    "floating_count": "int64",
+    "regime": "dictionary",
+    "flow_type": "dictionary",
+    "alert_msg": "dictionary",
+}
+# 列式格式 -> (文件扩展名, MIME 类型)
+COLUMNAR_FORMATS = {
+    "parquet": ("parquet", "application/vnd.apache.parquet"),
+    "arrow": ("arrow", "application/vnd.apache.arrow.file"),
+}
+# 默认列与原导出格式保持一致
+DEFAULT_EXPORT_COLUMNS = ["id", "timestamp", "depth", "velocity_surf", "flow_rate", "fr_number", "regime", "alert_msg"]
+
+EXPORT_ROWS = REGISTRY.counter("monitor_export_rows_total", "已导出的行数")
+EXPORT_SECONDS = REGISTRY.counter("monitor_export_seconds_total", "导出耗时累计 (秒，含客户端接收)；与行数相除即导出速度")
+_last_export = {"rows_per_second": 0.0}
+REGISTRY.callback("monitor_export_last_rows_per_second", "最近一次导出的速度 (行/秒)",
+                  lambda: _last_export["rows_per_second"])
+
+
+def parse_columns(columns):
+    """解析逗号分隔的列名，未指定时返回默认列；有未知列名时抛 ValueError"""
+    if not columns:
+        return list(DEFAULT_EXPORT_COLUMNS)
+    names = [name.strip() for name in columns.split(",") if name.strip()]
+    unknown = [name for name in names if name not in EXPORT_COLUMNS]
+    if unknown:
+        raise ValueError(f"未知的列: {', '.join(unknown)}")
+    return names
+
+
+def iter_batches(session_factory, columns, start=None, end=None, batch_size=2000, station_id=None):
+    """
+    分批读取导出数据，每批为若干行元组
+    指定测站时按 (测站, 时间) 索引顺序读取，否则按 id 顺序
+    会话在生成器内部创建和关闭，StreamingResponse 迭代期间保持有效
+    """
+    stmt = select(*[EXPORT_COLUMNS[name][1] for name in columns])
+    if station_id is not None:
+        stmt = stmt.where(MonitorData.station_id == station_id)
+    if start is not None:
+        stmt = stmt.where(MonitorData.timestamp >= start)
+    if end is not None:
+        stmt = stmt.where(MonitorData.timestamp <= end)
+    order = (MonitorData.timestamp, MonitorData.id) if station_id is not None else (MonitorData.id,)
+    stmt = stmt.order_by(*order).execution_options(yield_per=batch_size)
+
+    db = session_factory()
+    rows, started = 0, time.perf_counter()
+    try:
+        for partition in db.execute(stmt).partitions():
+            rows += len(partition)
+            EXPORT_ROWS.inc(len(partition))
+            yield partition
+    finally:
+        db.close()
+        elapsed = time.perf_counter() - started
+        EXPORT_SECONDS.inc(elapsed)
+        if rows and elapsed > 0:
+            _last_export["rows_per_second"] = rows / elapsed
+
+
+def iter_csv(batches, columns, gzip=False):
+    """把分批数据编码成 CSV 字节块，gzip=True 时同时流式压缩"""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31) if gzip else None  # wbits=31 输出 gzip 格式
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+
+    def take():
+        data = buf.getvalue().encode("utf-8")
+        buf.seek(0)
+        buf.truncate(0)
+        return compressor.compress(data) if compressor else data
+
+    writer.writerow([EXPORT_COLUMNS[name][0] for name in columns])
+    yield take()
+    for batch in batches:
+        writer.writerows(batch)
+        chunk = take()
+        if chunk:
+            yield chunk
+    if compressor:
+        yield compressor.flush()
+
+
+class _ChunkSink:
+    """供 pyarrow 写入的只写文件对象，写入的数据攒在内存里，由 take() 取走"""
+
+    def __init__(self):
+        self._chunks = []
+        self._pos = 0
+        self.closed = False
+
+    def write(self, data):
+        data = bytes(data)
+        self._chunks.append(data)
+        self._pos += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._pos
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def take(self):
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def _arrow_schema(pa, columns):
+    types = {
+        "int64": pa.int64(),
+        "float64": pa.float64(),
+        "timestamp": pa.timestamp("us"),
+        "dictionary": pa.dictionary(pa.int32(), pa.string()),
+    }
+    return pa.schema([pa.field(name, types[_ARROW_TYPES[name]]) for name in columns])
+
+
+class _DictionaryEncoder:
+    """
+    跨批次保持稳定的字典编码：新值只追加到字典末尾，
+    后一批的字典总是前一批的扩展，Arrow IPC 文件可以用字典增量 (delta) 写入
+    """
+
+    def __init__(self):
+        self._index = {}
+        self._values = []
+
+    def encode(self, pa, values):
+        indices = []
+        for value in values:
+            if value is None:
+                indices.append(None)
+                continue
+            idx = self._index.get(value)
+            if idx is None:
+                idx = self._index[value] = len(self._values)
+                self._values.append(value)
+            indices.append(idx)
+        return pa.DictionaryArray.from_arrays(
+            pa.array(indices, type=pa.int32()), pa.array(self._values, type=pa.string())
+        )
+
+
+def iter_columnar(batches, columns, fmt):
+    """
+    把分批数据按记录批写成 Parquet (每批一个 row group) 或 Arrow IPC 文件 (Feather v2) 字节块
+    依赖 pyarrow，未安装时抛 ImportError
+    """
+    import pyarrow as pa
+
+    schema = _arrow_schema(pa, columns)
+    encoders = {field.name: _DictionaryEncoder() for field in schema if pa.types.is_dictionary(field.type)}
+    sink = _ChunkSink()
+    out = pa.PythonFile(sink, mode="w")
+    if fmt == "parquet":
+        import pyarrow.parquet as pq
+        writer = pq.ParquetWriter(out, schema)
+        write = lambda batch: writer.write_table(pa.Table.from_batches([batch]))  # noqa: E731
+    else:
+        writer = pa.ipc.new_file(out, schema, options=pa.ipc.IpcWriteOptions(emit_dictionary_deltas=True))
+        write = writer.write_batch
+
+    for batch in batches:
+        arrays = []
+        for field, values in zip(schema, zip(*batch)):
+            if field.name in encoders:
+                arrays.append(encoders[field.name].encode(pa, values))
+            else:
+                arrays.append(pa.array(values, type=field.type))
+        write(pa.RecordBatch.from_arrays(arrays, schema=schema))
+        chunk = sink.take()
+        if chunk:
+            yield chunk
+    writer.close()
+    yield sink.take()
@@ -0,0 +1,152 @@
+# database/migrations.py
+# 已有数据库的结构升级：create_all 只会建新表，不会给旧表补索引/补列，
+# 这里按 PRAGMA user_version 记录的版本号顺序执行尚未应用的迁移
+# 需要整表转换的迁移不在服务启动时执行，停服后用 python -m database.migrations 离线升级
+import argparse
+import time
+
+from sqlalchemy import text
+
+
+def _add_timestamp_index(conn):
+    # /api/history 按时间倒序取最近 N 条，没有索引时每次都要全表排序
+    conn.execute(text("CREATE INDEX IF NOT EXISTS ix_monitor_data_timestamp ON monitor_data (timestamp)"))
+
+
+def _columns(conn, table):
+    return {row[1] for row in conn.execute(text(f"PRAGMA table_info({table})"))}
+
+
+def _backfill_rollups(conn):
+    # 汇总表由写入路径增量维护，旧数据需要一次性回填 (从版本 1 升级的库随后还会按版本 4 带测站维度重建)
+    from database.rollup import rebuild_rollups
+    rebuild_rollups(conn)
+
+
+def _add_station_column(conn):
+    # 多测站：旧数据全部归入默认测站，并建立 (测站, 时间) 复合索引
+    from core.state import DEFAULT_STATION
+    if "station_id" not in _columns(conn, "monitor_data"):
+        conn.execute(text(
+            f"ALTER TABLE monitor_data ADD COLUMN station_id VARCHAR NOT NULL DEFAULT '{DEFAULT_STATION}'"
+        ))
+    conn.execute(text(
+        "CREATE INDEX IF NOT EXISTS ix_monitor_data_station_ts ON monitor_data (station_id, timestamp)"
+    ))
+
+
+def _rebuild_station_rollups(conn):
+    # 汇总表主键增加测站维度：按新结构重建后从原始数据回填
+    from database.models import MonitorRollup
+    from database.rollup import rebuild_rollups
+    MonitorRollup.__table__.drop(conn, checkfirst=True)
+    MonitorRollup.__table__.create(conn)
+    rebuild_rollups(conn)
+
+
+def _compact_codes(conn):
+    """
+    判别结果改为紧凑编码，并补上含沙量 / 漂浮物两列
+    SQLite 不能修改列类型，按新结构建表后整表拷贝 (新建的库已是新结构，直接跳过)
+    """
+    from core.hydraulic import REGIME_LABELS, FLOW_TYPE_LABELS
+    from database.models import MonitorData
+
+    columns = _columns(conn, "monitor_data")
+    if "regime_code" in columns:
+        return
+    conn.execute(text(
+        "INSERT OR IGNORE INTO alert_text (text)"
+        " SELECT DISTINCT alert_msg FROM monitor_data WHERE alert_msg IS NOT NULL"
+    ))
+    # 索引名在库内全局唯一，改名前先删掉旧表上的索引
+    for (name,) in conn.execute(text(
+        "SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = 'monitor_data' AND sql IS NOT NULL"
+    )).fetchall():
+        conn.execute(text(f'DROP INDEX "{name}"'))
+    conn.execute(text("ALTER TABLE monitor_data RENAME TO monitor_data_old"))
+    MonitorData.__table__.create(conn)
+
+    def decode(column, labels, prefix):
+        whens = " ".join(f"WHEN :{prefix}_{code} THEN {code}" for code in range(len(labels)))
+        return f"CASE o.{column} {whens} END", {f"{prefix}_{code}": label for code, label in enumerate(labels)}
+
+    regime_sql, params = decode("regime", REGIME_LABELS, "regime")
+    flow_sql, flow_params = decode("flow_type", FLOW_TYPE_LABELS, "flow")
+    params.update(flow_params)
+    conn.execute(text(f"""
+        INSERT INTO monitor_data (id, station_id, timestamp, depth, velocity_surf, voltage,
+                                  velocity_avg, flow_rate, fr_number, regime_code, flow_type_code, alert_id)
+        SELECT o.id, o.station_id, o.timestamp, o.depth, o.velocity_surf, o.voltage,
+               o.velocity_avg, o.flow_rate, o.fr_number, {regime_sql}, {flow_sql}, a.id
+        FROM monitor_data_old o LEFT JOIN alert_text a ON a.text = o.alert_msg
+    """), params)
+    conn.execute(text("DROP TABLE monitor_data_old"))
+
+
+def _compact_codes_pending(conn):
+    return "regime_code" not in _columns(conn, "monitor_data")
+
+
+# (版本号, 说明, 迁移函数)，只允许在末尾追加
+MIGRATIONS = [
+    (1, "monitor_data.timestamp 索引", _add_timestamp_index),
+    (2, "monitor_rollup 汇总表回填", _backfill_rollups),
+    (3, "monitor_data.station_id 列与 (station_id, timestamp) 索引", _add_station_column),
+    (4, "monitor_rollup 按测站重建并回填", _rebuild_station_rollups),
+    (5, "monitor_data 判别结果紧凑编码、alert_text 查找表、sediment / floating_count 列", _compact_codes),
+]
+
+# 离线迁移：版本号 -> 判断该库是否真的需要转换 (新建的库已是新结构，在线直接记为已应用)
+# 整表拷贝期间独占写锁、库文件临时翻倍，百万行级的库需要数十秒，不能放在服务启动时执行
+OFFLINE = {5: _compact_codes_pending}
+
+
+def migrate(engine, offline=False):
+    """
+    把数据库升级到最新版本，已是最新时不做任何事
+    offline=False (服务启动) 时遇到需要离线执行的迁移就停下，只应用它之前的版本
+    :return: 尚待离线执行的迁移 (版本号, 说明)，没有时返回 None
+    """
+    with engine.begin() as conn:
+        version = conn.execute(text("PRAGMA user_version")).scalar() or 0
+        for target, desc, upgrade in MIGRATIONS:
+            if target <= version:
+                continue
+            pending = OFFLINE.get(target)
+            if not offline and pending is not None and pending(conn):
+                return target, desc
+            upgrade(conn)
+            conn.execute(text(f"PRAGMA user_version = {int(target)}"))
+    return None
+
+
+def main(argv=None):
+    """离线升级命令，须在停止服务后执行：应用全部迁移后 VACUUM，回收整表拷贝留下的空闲页"""
+    parser = argparse.ArgumentParser(description="数据库离线升级 (请先停止监测服务)")
+    parser.add_argument("--no-vacuum", action="store_true", help="升级后不做 VACUUM (库文件会保留旧表占用的空间)")
+    args = parser.parse_args(argv)
+
+    from database import models
+    engine, pending = models.engine, models.PENDING_MIGRATION
+    if pending is None:
+        print("数据库已是最新结构，无需升级")
+        return
+    print(f"离线升级: 版本 {pending[0]} ({pending[1]}) 及之后的迁移")
+    t0 = time.perf_counter()
+    # 同一进程随后还要启动服务时 (如基准脚本)，启动检查看到的是升级后的状态
+    models.PENDING_MIGRATION = migrate(engine, offline=True)
+    print(f"迁移完成 ({time.perf_counter() - t0:.1f}s)")
+    if not args.no_vacuum:
+        t0 = time.perf_counter()
+        raw = engine.raw_connection()
+        try:
+            raw.isolation_level = None  # VACUUM 不能在事务内执行
+            raw.execute("VACUUM")
+        finally:
+            raw.close()
+        print(f"VACUUM 完成 ({time.perf_counter() - t0:.1f}s)")
+
+
+if __name__ == "__main__":
+    main()
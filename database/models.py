@@ -1,20 +1,77 @@
 # database/models.py
-from sqlalchemy import create_engine, Column, Integer, Float, String, DateTime
+import os
+from sqlalchemy import create_engine, event, Column, Integer, SmallInteger, Float, String, DateTime, Index
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import QueuePool
 from datetime import datetime
 
+from core.state import DEFAULT_STATION
+
 # 创建本地数据库文件
-SQLALCHEMY_DATABASE_URL = "sqlite:///./channel_monitor.db"
-engine = create_engine(SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False})
+SQLALCHEMY_DATABASE_URL = os.environ.get("MONITOR_DB_URL", "sqlite:///./channel_monitor.db")
+
+# 存储配置档 (环境变量 MONITOR_DB_PROFILE 选择)
+# - legacy: 原始配置，默认回滚日志，读写互相阻塞
+# - wal:    WAL 日志 + synchronous=NORMAL，看板读取与写入可以并发进行
+STORAGE_PROFILES = {
+    "legacy": {
+        "pragmas": {},
+        "pool_size": 5,
+        "max_overflow": 10,
+    },
+    "wal": {
+        "pragmas": {
+            "auto_vacuum": "INCREMENTAL",  # 须在建表前设置；旧库需停服后用 python -m database.retention 离线转换
+            "journal_mode": "WAL",
+            "synchronous": "NORMAL",      # WAL 下只在检查点时 fsync，掉电最多丢最后几个事务
+            "mmap_size": 256 * 1024 * 1024,
+            "cache_size": -64 * 1024,     # 负数单位为 KiB，即 64MB 页缓存
+            "busy_timeout": 5000,         # 写锁冲突时等待 5s 而不是立即报 database is locked
+            "temp_store": "MEMORY",
+        },
+        # uvicorn 线程池默认 40 个线程，连接池需要能覆盖并发的读请求
+        "pool_size": 10,
+        "max_overflow": 30,
+    },
+}
+STORAGE_PROFILE = os.environ.get("MONITOR_DB_PROFILE", "wal")
+
+def build_engine(url=SQLALCHEMY_DATABASE_URL, profile=STORAGE_PROFILE):
+    """按存储配置档创建引擎，PRAGMA 在每个新连接建立时设置"""
+    conf = STORAGE_PROFILES[profile]
+    eng = create_engine(
+        url,
+        connect_args={"check_same_thread": False},
+        poolclass=QueuePool,
+        pool_size=conf["pool_size"],
+        max_overflow=conf["max_overflow"],
+    )
+    pragmas = conf["pragmas"]
+    if pragmas:
+        @event.listens_for(eng, "connect")
+        def _apply_pragmas(dbapi_conn, _record):
+            cursor = dbapi_conn.cursor()
+            for key, value in pragmas.items():
+                cursor.execute(f"PRAGMA {key}={value}")
+            cursor.close()
+    return eng
+
+engine = build_engine()
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
 class MonitorData(Base):
     __tablename__ = "monitor_data"
+    # 多测站共用一张表，按 (测站, 时间) 建复合索引，单站查询只扫描本站的索引区间
+    __table_args__ = (
+        Index("ix_monitor_data_station_ts", "station_id", "timestamp"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
-    timestamp = Column(DateTime, default=datetime.now)
+    station_id = Column(String, nullable=False, default=DEFAULT_STATION, server_default=DEFAULT_STATION)
+    # 单列时间索引不能被复合索引替代：数据保留按时间跨测站删除、不指定测站的导出按时间范围扫描都靠它
+    timestamp = Column(DateTime, default=datetime.now, index=True)
     
     # 采集原始数据
     depth = Column(Float)           # 水深
@@ -26,10 +83,50 @@ class MonitorData(Base):
     flow_rate = Column(Float)       # 流量 Q
     fr_number = Column(Float)       # Fr 数
     
-    # 判别结果
-    regime = Column(String)         # 流态：缓流/急流
-    flow_type = Column(String)      # 工况：均匀/非均匀
-    alert_msg = Column(String)      # 报警信息
+    # 现场观测
+    sediment = Column(Float)        # 含沙量 (kg/m3)
+    floating_count = Column(Integer)  # 漂浮物数量 (个)
+
+    # 判别结果 (紧凑编码，文本与编码的转换见 database/codes.py)
+    regime_code = Column(SmallInteger)     # 流态：REGIME_LABELS 的下标
+    flow_type_code = Column(SmallInteger)  # 工况：FLOW_TYPE_LABELS 的下标
+    alert_id = Column(Integer)             # 报警信息：alert_text.id
+
+class AlertText(Base):
+    """报警文本查找表：同样的报警信息只存一份 (绝大多数为 "正常")"""
+    __tablename__ = "alert_text"
+
+    id = Column(Integer, primary_key=True)
+    text = Column(String, nullable=False, unique=True)
+
+class MonitorRollup(Base):
+    """
+    按时间桶汇总的统计表 (1m / 1h / 1d)，写入原始数据时增量维护
+    均值不直接存，存和值，查询时除以样本数，方便增量累加
+    """
+    __tablename__ = "monitor_rollup"
+
+    station_id = Column(String, primary_key=True)      # 测站
+    bucket = Column(String, primary_key=True)          # 粒度：1m / 1h / 1d
+    bucket_start = Column(DateTime, primary_key=True)  # 桶起始时间
+    samples = Column(Integer, default=0)               # 样本数
+
+    depth_min = Column(Float)
+    depth_max = Column(Float)
+    depth_sum = Column(Float)
+    flow_sum = Column(Float)
+    fr_max = Column(Float)
+
+    # 流态计数
+    regime_dry = Column(Integer, default=0)
+    regime_sub = Column(Integer, default=0)
+    regime_critical = Column(Integer, default=0)
+    regime_super = Column(Integer, default=0)
+
+    alert_count = Column(Integer, default=0)           # alert_msg 不为 "正常" 的条数
 
-# 自动创建表
-Base.metadata.create_all(bind=engine)
\ No newline at end of file
+# 自动创建表，并把旧库升级到当前结构；需要整表转换的迁移留给离线命令 (python -m database.migrations)，
+# 此时 PENDING_MIGRATION 为 (版本号, 说明)，服务启动时据此拒绝运行
+from database.migrations import migrate  # noqa: E402
+Base.metadata.create_all(bind=engine)
+PENDING_MIGRATION = migrate(engine)
\ No newline at end of file
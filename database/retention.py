@@ -0,0 +1,225 @@
+# database/retention.py
+# 数据保留策略：原始数据超过保留期后分批删除，并定期做增量 VACUUM 回收文件空间
+import argparse
+import logging
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import text
+
+logger = logging.getLogger(__name__)
+
+
+def _env_days(name, default):
+    """读取天数配置，0 或空表示永久保留 (返回 None)"""
+    value = os.environ.get(name, str(default)).strip()
+    days = float(value) if value else 0
+    return days if days > 0 else None
+
+
+class RetentionPolicy:
+    """
+    保留期配置 (环境变量设置，默认全部永久保留，删除数据需运维人员显式开启)
+    - 原始数据 monitor_data：MONITOR_RETENTION_RAW_DAYS，例如 90
+    - 汇总表 monitor_rollup：MONITOR_RETENTION_1M_DAYS / _1H_DAYS / _1D_DAYS，例如 365 / 0 / 0
+    原始数据在写入时已经累加进汇总表 (见 database/rollup.py)，删除原始数据不影响长周期统计
+    """
+
+    def __init__(self):
+        self.raw_days = _env_days("MONITOR_RETENTION_RAW_DAYS", 0)
+        self.rollup_days = {
+            "1m": _env_days("MONITOR_RETENTION_1M_DAYS", 0),
+            "1h": _env_days("MONITOR_RETENTION_1H_DAYS", 0),
+            "1d": _env_days("MONITOR_RETENTION_1D_DAYS", 0),
+        }
+        self.interval = float(os.environ.get("MONITOR_RETENTION_INTERVAL", 3600))  # 两次清理间隔 (秒)
+        self.batch_size = 500      # 每个删除事务的行数，保证写锁只被短暂占用
+        self.pause = 0.05          # 批次之间让出写锁的时间 (秒)
+        self.vacuum_pages = 512    # 每轮增量 VACUUM 回收的页数
+
+    def to_dict(self):
+        return {
+            "raw_days": self.raw_days,
+            "rollup_days": dict(self.rollup_days),
+            "interval": self.interval,
+            "batch_size": self.batch_size,
+            "vacuum_pages": self.vacuum_pages,
+        }
+
+
+class RetentionManager:
+    """
+    后台清理线程：每隔 policy.interval 秒执行一次 run_once()
+    删除按小批次提交，批次间暂停，采集写入不会被长时间阻塞
+    """
+
+    def __init__(self, engine, policy=None):
+        self.engine = engine
+        self.policy = policy or RetentionPolicy()
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+        self._run_lock = threading.Lock()
+        self._thread = None
+        self.running = False
+        self.runs = 0
+        self.last_run = None
+        self.last_error = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._loop, name="retention", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self, timeout=5.0):
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def trigger(self):
+        """立即在后台线程执行一轮清理"""
+        self._wake.set()
+
+    def status(self):
+        return {
+            "policy": self.policy.to_dict(),
+            # 为 False 时删除数据后文件不会缩小，需停止服务后执行一次离线转换 (见 ensure_incremental_vacuum)
+            "incremental_vacuum": self.incremental_vacuum_enabled(),
+            "running": self.running,
+            "runs": self.runs,
+            "last_run": self.last_run,
+            "last_error": self.last_error,
+        }
+
+    # ------------------------------------------------------------------
+
+    def _loop(self):
+        while not self._stop.is_set():
+            try:
+                self.run_once()
+            except Exception as e:
+                logger.exception("数据保留清理失败")
+                self.last_error = str(e)
+            self._wake.wait(self.policy.interval)
+            self._wake.clear()
+
+    def incremental_vacuum_enabled(self):
+        with self.engine.connect() as conn:
+            return conn.execute(text("PRAGMA auto_vacuum")).scalar() == 2
+
+    def ensure_incremental_vacuum(self):
+        """
+        旧库默认 auto_vacuum=NONE，删除数据后文件不会缩小；切换为 INCREMENTAL 需要做一次完整 VACUUM
+        VACUUM 期间整库持有写锁 (百万行级的库需要数秒到数十秒)，会让写后队列写库超时而丢数据，
+        因此不在服务运行时自动执行，只能在停止服务后离线调用 (python -m database.retention --enable-incremental-vacuum)
+        :return: 是否做了转换 (已是增量模式时返回 False)
+        """
+        if self.incremental_vacuum_enabled():
+            return False
+        raw = self.engine.raw_connection()
+        try:
+            raw.isolation_level = None  # VACUUM 不能在事务内执行
+            raw.execute("PRAGMA auto_vacuum = INCREMENTAL")
+            raw.execute("VACUUM")
+        finally:
+            raw.close()
+        return True
+
+    def _purge(self, sql, params):
+        """分批执行删除，返回删除的总行数"""
+        total = 0
+        while not self._stop.is_set():
+            with self.engine.begin() as conn:
+                deleted = conn.execute(text(sql), {**params, "n": self.policy.batch_size}).rowcount
+            total += deleted
+            if deleted < self.policy.batch_size:
+                break
+            time.sleep(self.policy.pause)
+        return total
+
+    def run_once(self):
+        """执行一轮清理：删除过期原始数据和汇总数据，然后增量回收空闲页"""
+        with self._run_lock:
+            self.running = True
+            started = datetime.now()
+            t0 = time.perf_counter()
+            stats = {"started": started, "raw_deleted": 0, "rollup_deleted": {}, "pages_freed": 0,
+                     "db_bytes": None}
+            try:
+                if self.policy.raw_days:
+                    cutoff = started - timedelta(days=self.policy.raw_days)
+                    stats["raw_deleted"] = self._purge(
+                        "DELETE FROM monitor_data WHERE id IN ("
+                        " SELECT id FROM monitor_data WHERE timestamp < :cutoff ORDER BY timestamp LIMIT :n)",
+                        {"cutoff": cutoff},
+                    )
+                for bucket, days in self.policy.rollup_days.items():
+                    if not days:
+                        continue
+                    cutoff = started - timedelta(days=days)
+                    stats["rollup_deleted"][bucket] = self._purge(
+                        "DELETE FROM monitor_rollup WHERE rowid IN ("
+                        " SELECT rowid FROM monitor_rollup WHERE bucket = :bucket AND bucket_start < :cutoff"
+                        " LIMIT :n)",
+                        {"bucket": bucket, "cutoff": cutoff},
+                    )
+                stats["pages_freed"] = self._incremental_vacuum()
+                stats["db_bytes"] = self._db_bytes()
+                self.last_error = None
+            finally:
+                stats["duration"] = round(time.perf_counter() - t0, 3)
+                self.last_run = stats
+                self.runs += 1
+                self.running = False
+            return stats
+
+    def _db_bytes(self):
+        with self.engine.connect() as conn:
+            pages = conn.execute(text("PRAGMA page_count")).scalar()
+            return pages * conn.execute(text("PRAGMA page_size")).scalar()
+
+    def _incremental_vacuum(self):
+        """回收空闲页，并做一次被动检查点让主库文件随之缩小，返回回收的页数"""
+        with self.engine.connect() as conn:
+            if conn.execute(text("PRAGMA auto_vacuum")).scalar() != 2:
+                return 0
+            before = conn.execute(text("PRAGMA freelist_count")).scalar()
+            conn.commit()
+            # sqlite3 的 execute() 对无结果列的 PRAGMA 只步进一次 (只回收一页)，
+            # executescript() 会把语句执行完
+            conn.connection.driver_connection.executescript(
+                f"PRAGMA incremental_vacuum({int(self.policy.vacuum_pages)});"
+            )
+            after = conn.execute(text("PRAGMA freelist_count")).scalar()
+            if conn.execute(text("PRAGMA journal_mode")).scalar() == "wal":
+                conn.execute(text("PRAGMA wal_checkpoint(PASSIVE)"))
+            conn.commit()
+        return before - after
+
+
+def main(argv=None):
+    """离线维护命令，须在停止服务后执行"""
+    parser = argparse.ArgumentParser(description="数据保留离线维护 (请先停止监测服务)")
+    parser.add_argument("--enable-incremental-vacuum", action="store_true",
+                        help="把旧库转换为 auto_vacuum=INCREMENTAL (完整 VACUUM 一次，期间独占数据库)")
+    parser.add_argument("--run", action="store_true", help="按当前保留期配置执行一轮清理")
+    args = parser.parse_args(argv)
+    if not (args.enable_incremental_vacuum or args.run):
+        parser.error("请至少指定一个操作")
+
+    from database.models import engine
+    manager = RetentionManager(engine)
+    if args.enable_incremental_vacuum:
+        t0 = time.perf_counter()
+        converted = manager.ensure_incremental_vacuum()
+        print("已转换为增量 VACUUM 模式" if converted else "已是增量 VACUUM 模式，无需转换",
+              f"({time.perf_counter() - t0:.1f}s)")
+    if args.run:
+        print(manager.run_once())
+
+
+if __name__ == "__main__":
+    main()
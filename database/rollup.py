@@ -0,0 +1,135 @@
+# database/rollup.py
+# 时间桶汇总 (monitor_rollup) 的增量维护与回填
+from sqlalchemy import func, text
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from core.hydraulic import REGIME_LABELS, REGIME_DRY, REGIME_SUB, REGIME_CRITICAL, REGIME_SUPER
+from core.state import DEFAULT_STATION
+from database.models import MonitorRollup
+
+# 粒度 -> (截断函数, SQLite strftime 格式)
+# 桶起始时间的文本格式必须与 SQLAlchemy 写入 DateTime 的格式一致 (带 6 位微秒)，主键才能对上
+BUCKETS = {
+    "1m": (lambda ts: ts.replace(second=0, microsecond=0), "%Y-%m-%d %H:%M:00.000000"),
+    "1h": (lambda ts: ts.replace(minute=0, second=0, microsecond=0), "%Y-%m-%d %H:00:00.000000"),
+    "1d": (lambda ts: ts.replace(hour=0, minute=0, second=0, microsecond=0), "%Y-%m-%d 00:00:00.000000"),
+}
+
+_REGIME_COLUMNS = {
+    REGIME_DRY: "regime_dry",
+    REGIME_SUB: "regime_sub",
+    REGIME_CRITICAL: "regime_critical",
+    REGIME_SUPER: "regime_super",
+}
+_REGIME_BY_LABEL = {label: _REGIME_COLUMNS[code] for code, label in enumerate(REGIME_LABELS)}
+
+_COUNT_COLUMNS = ("samples", "regime_dry", "regime_sub", "regime_critical", "regime_super", "alert_count")
+
+
+def _empty_bucket(station_id, bucket, start):
+    agg = {name: 0 for name in _COUNT_COLUMNS}
+    agg.update(station_id=station_id, bucket=bucket, bucket_start=start, depth_min=None, depth_max=None,
+               depth_sum=0.0, flow_sum=0.0, fr_max=None)
+    return agg
+
+
+def accumulate(rows):
+    """把一批原始行按 (测站, 粒度, 桶) 聚合成 monitor_rollup 的增量"""
+    buckets = {}
+    for row in rows:
+        ts = row["timestamp"]
+        depth, flow, fr = row["depth"] or 0.0, row["flow_rate"] or 0.0, row["fr_number"] or 0.0
+        regime_col = _REGIME_BY_LABEL.get(row["regime"])
+        alert = row["alert_msg"] not in (None, "正常")
+        for bucket, (truncate, _fmt) in BUCKETS.items():
+            key = (row["station_id"], bucket, truncate(ts))
+            agg = buckets.get(key)
+            if agg is None:
+                agg = buckets[key] = _empty_bucket(*key)
+            agg["samples"] += 1
+            agg["depth_min"] = depth if agg["depth_min"] is None else min(agg["depth_min"], depth)
+            agg["depth_max"] = depth if agg["depth_max"] is None else max(agg["depth_max"], depth)
+            agg["depth_sum"] += depth
+            agg["flow_sum"] += flow
+            agg["fr_max"] = fr if agg["fr_max"] is None else max(agg["fr_max"], fr)
+            if regime_col:
+                agg[regime_col] += 1
+            if alert:
+                agg["alert_count"] += 1
+    return list(buckets.values())
+
+
+def apply_rollups(db, rows):
+    """
+    在写入原始数据的同一事务里累加汇总表 (作为 WriteBehindWriter 的 hook 使用)
+    """
+    deltas = accumulate(rows)
+    if not deltas:
+        return
+    table = MonitorRollup.__table__
+    stmt = sqlite_insert(table)
+    ex = stmt.excluded
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[table.c.station_id, table.c.bucket, table.c.bucket_start],
+        set_={
+            **{name: table.c[name] + ex[name] for name in _COUNT_COLUMNS},
+            "depth_sum": table.c.depth_sum + ex.depth_sum,
+            "flow_sum": table.c.flow_sum + ex.flow_sum,
+            # SQLite 的多参数 min()/max() 是标量函数
+            "depth_min": func.min(table.c.depth_min, ex.depth_min),
+            "depth_max": func.max(table.c.depth_max, ex.depth_max),
+            "fr_max": func.max(table.c.fr_max, ex.fr_max),
+        },
+    )
+    db.execute(stmt, deltas)
+
+
+def rebuild_rollups(conn):
+    """
+    从 monitor_data 全量重建汇总表 (用于迁移时给旧数据回填)
+    迁移过程中 monitor_data 可能还是旧结构 (判别结果为文本列、没有测站列)，按实际的列选择表达式
+    """
+    columns = {row[1] for row in conn.execute(text("PRAGMA table_info(monitor_data)"))}
+    station = "station_id" if "station_id" in columns else f"'{DEFAULT_STATION}'"
+    if "regime_code" in columns:
+        regime, alert = "regime_code", "(SELECT text FROM alert_text WHERE alert_text.id = alert_id)"
+        params = {f"regime_{code}": code for code in _REGIME_COLUMNS}
+    else:
+        regime, alert = "regime", "alert_msg"
+        params = {f"regime_{code}": REGIME_LABELS[code] for code in _REGIME_COLUMNS}
+    regime_cases = ",\n".join(
+        f"SUM(CASE WHEN {regime} = :regime_{code} THEN 1 ELSE 0 END)" for code in _REGIME_COLUMNS
+    )
+    conn.execute(text("DELETE FROM monitor_rollup"))
+    for bucket, (_truncate, fmt) in BUCKETS.items():
+        conn.execute(text(f"""
+            INSERT INTO monitor_rollup (
+                station_id, bucket, bucket_start, samples, depth_min, depth_max, depth_sum, flow_sum, fr_max,
+                {", ".join(_REGIME_COLUMNS.values())}, alert_count)
+            SELECT {station}, '{bucket}', strftime('{fmt}', timestamp), COUNT(*),
+                   MIN(depth), MAX(depth), TOTAL(depth), TOTAL(flow_rate), MAX(fr_number),
+                   {regime_cases},
+                   SUM(CASE WHEN {alert} IS NOT NULL AND {alert} != '正常' THEN 1 ELSE 0 END)
+            FROM monitor_data
+            WHERE timestamp IS NOT NULL
+            GROUP BY {station}, strftime('{fmt}', timestamp)
+        """), params)
+
+
+def rollup_to_dict(row):
+    """汇总行 -> 接口输出 (均值在这里计算)"""
+    n = row.samples or 0
+    return {
+        "station_id": row.station_id,
+        "bucket_start": row.bucket_start,
+        "samples": n,
+        "depth_min": row.depth_min,
+        "depth_max": row.depth_max,
+        "depth_mean": round(row.depth_sum / n, 4) if n else None,
+        "flow_mean": round(row.flow_sum / n, 4) if n else None,
+        "fr_max": row.fr_max,
+        "regime_counts": {
+            REGIME_LABELS[code]: getattr(row, col) for code, col in _REGIME_COLUMNS.items()
+        },
+        "alert_count": row.alert_count,
+    }
@@ -0,0 +1,236 @@
+# database/writer.py
+import logging
+import queue
+import threading
+import time
+
+from sqlalchemy.exc import OperationalError
+
+from core.metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+COMMIT_SECONDS = REGISTRY.histogram("monitor_db_commit_seconds", "写后队列每个事务 commit 的耗时")
+WRITE_SECONDS = REGISTRY.histogram("monitor_db_write_seconds", "写后队列每批写库总耗时 (编码、插入、汇总与提交)")
+
+_STOP = object()
+
+
+class IdAllocator:
+    """
+    在进程内预先分配 monitor_data 的主键：
+    写后队列落库之前，读数就已经有了最终的 id，环形缓冲和推送消息可以直接引用
+    (本进程是该库唯一的写入方)
+    """
+
+    def __init__(self, last_id=0):
+        self._next = (last_id or 0) + 1
+        self._lock = threading.Lock()
+
+    def seed(self, last_id):
+        """从库中当前最大 id 之后开始分配"""
+        with self._lock:
+            self._next = (last_id or 0) + 1
+
+    def take(self, n=1):
+        """分配 n 个连续 id，返回第一个"""
+        with self._lock:
+            first = self._next
+            self._next += n
+        return first
+
+
+class WriteBehindWriter:
+    """
+    写后队列：上传接口只负责计算并把待入库行放进有界队列，
+    后台线程按 "攒够 batch_size 条" 或 "距首条超过 flush_interval 秒" 批量写库，
+    HTTP 请求不再等待 SQLite 提交。
+
+    - 队列满时 submit() 最多阻塞 put_timeout 秒 (背压)，仍放不进去则丢弃并计数
+    - 合并后的一批重试仍失败时，逐组 (再二分到单行) 重写，只丢弃真正写不进去的行；
+      数据库锁定、磁盘错误等与数据无关的失败 (OperationalError) 不拆分，整批计入 failed
+    - stop() 会把队列里剩余的数据全部写完，进程退出前调用即可保证不丢数据
+    - hooks 为 hook(db, rows) 回调，在插入原始数据的同一事务内执行 (例如维护汇总表)
+    - encode 为 encode(db, rows) -> rows，在插入前把行转换为表结构 (例如文本转编码)，
+      hooks 拿到的仍是转换前的行
+    """
+
+    def __init__(self, session_factory, model, max_queue=5000, batch_size=200,
+                 flush_interval=0.2, put_timeout=0.05, max_retries=3, hooks=(), encode=None):
+        self.session_factory = session_factory
+        self.model = model
+        self.encode = encode
+        self.hooks = list(hooks)
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.put_timeout = put_timeout
+        self.max_retries = max_retries
+
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._thread = None
+        self._lock = threading.Lock()
+        self._stopped = False
+
+        # 统计计数
+        self.accepted = 0      # 已入队行数
+        self.dropped = 0       # 队列满被丢弃的行数
+        self.written = 0       # 已写入数据库的行数
+        self.failed = 0        # 重试后仍写库失败的行数
+        self.batches = 0       # 已提交的事务数
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="write-behind", daemon=True)
+            self._thread.start()
+        return self
+
+    def submit(self, rows):
+        """
+        提交一组待入库行 (一组 = 一个队列元素，同组数据在同一个事务内写入；写库失败拆分隔离时除外)
+        :param rows: 入库字段 dict 的列表
+        :return: True 已入队；False 队列已满被丢弃或写入器已停止
+        """
+        if self._stopped:
+            with self._lock:
+                self.dropped += len(rows)
+            return False
+        try:
+            self._queue.put(rows, timeout=self.put_timeout)
+        except queue.Full:
+            with self._lock:
+                self.dropped += len(rows)
+            return False
+        with self._lock:
+            self.accepted += len(rows)
+        return True
+
+    def flush(self):
+        """阻塞直到当前已入队的数据全部落库"""
+        self._queue.join()
+
+    def stop(self, timeout=10.0):
+        """停止后台线程并写完剩余数据，可重复调用"""
+        if self._stopped:
+            return
+        self._stopped = True
+        if self._thread is not None and self._thread.is_alive():
+            self._queue.put(_STOP)
+            self._thread.join(timeout)
+        # 线程未启动或未能及时退出时，在当前线程把剩余数据写完
+        self._drain_remaining()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "queue_depth": self._queue.qsize(),
+                "queue_capacity": self._queue.maxsize,
+                "accepted": self.accepted,
+                "dropped": self.dropped,
+                "written": self.written,
+                "failed": self.failed,
+                "batches": self.batches,
+                "running": self._thread is not None and self._thread.is_alive(),
+            }
+
+    # ------------------------------------------------------------------
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is _STOP:
+                self._queue.task_done()
+                return
+            groups, size, taken = [item], len(item), 1
+            deadline = time.monotonic() + self.flush_interval
+            stop = False
+            # 攒批：够 batch_size 或到时间就写
+            while size < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                taken += 1
+                if item is _STOP:
+                    stop = True
+                    break
+                groups.append(item)
+                size += len(item)
+            self._write(groups)
+            for _ in range(taken):
+                self._queue.task_done()
+            if stop:
+                return
+
+    def _drain_remaining(self):
+        groups, taken = [], 0
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            taken += 1
+            if item is not _STOP:
+                groups.append(item)
+        if groups:
+            self._write(groups)
+        for _ in range(taken):
+            self._queue.task_done()
+
+    def _write(self, groups):
+        """写入一批 (多个 submit() 的组合并)，重试后仍失败时拆开隔离出错的行"""
+        rows = [row for group in groups for row in group]
+        if not rows:
+            return
+        for attempt in range(1, self.max_retries + 1):
+            try:
+                self._commit(rows)
+                return
+            except Exception as e:
+                error = e
+                if attempt < self.max_retries:
+                    time.sleep(0.1 * attempt)
+        if isinstance(error, OperationalError) or len(rows) == 1:
+            logger.error("写库失败，丢弃 %d 条数据", len(rows), exc_info=error)
+            with self._lock:
+                self.failed += len(rows)
+            return
+        # 多半是个别行的数据写不进去 (如整数超出 SQLite 范围)，逐组再二分，其余行照常写入
+        logger.warning("整批 %d 条写库失败 (%s)，拆分后逐组重写", len(rows), error)
+        for group in groups:
+            self._isolate(group)
+
+    def _isolate(self, rows):
+        try:
+            self._commit(rows)
+        except Exception as e:
+            if len(rows) == 1 or isinstance(e, OperationalError):
+                logger.error("写库失败，丢弃 %d 条数据 (首条 id=%s)", len(rows), rows[0].get("id"), exc_info=e)
+                with self._lock:
+                    self.failed += len(rows)
+                return
+            mid = len(rows) // 2
+            self._isolate(rows[:mid])
+            self._isolate(rows[mid:])
+
+    def _commit(self, rows):
+        """在一个事务内插入 rows 并执行 hooks，失败时回滚并抛出异常"""
+        db = self.session_factory()
+        started = time.perf_counter()
+        try:
+            db.bulk_insert_mappings(self.model, self.encode(db, rows) if self.encode else rows)
+            for hook in self.hooks:
+                hook(db, rows)
+            with COMMIT_SECONDS.time():
+                db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+        WRITE_SECONDS.observe(time.perf_counter() - started)
+        with self._lock:
+            self.written += len(rows)
+            self.batches += 1
@@ -1,20 +1,145 @@
 # main.py (V2.0 - 含泥沙、漂浮物、导出功能)
-from fastapi import FastAPI, Depends
+from fastapi import FastAPI, Depends, Request, HTTPException, Query, WebSocket, WebSocketDisconnect, Header
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import StreamingResponse
-from pydantic import BaseModel
+from fastapi.responses import StreamingResponse, PlainTextResponse, JSONResponse
+from fastapi.exceptions import RequestValidationError
+from fastapi.encoders import jsonable_encoder
+from starlette.concurrency import run_in_threadpool
+from pydantic import BaseModel, Field
+from sqlalchemy import select, func
 from sqlalchemy.orm import Session
+from typing import Optional
+from contextlib import asynccontextmanager, ExitStack
 from datetime import datetime
-import io
-import csv
+import asyncio
+import atexit
+import json
+import math
+import os
+import secrets
+import time
 
-from database.models import SessionLocal, MonitorData, Base, engine
-from core.hydraulic import HydraulicCalculator
+from database.models import SessionLocal, MonitorData, MonitorRollup, Base, engine, PENDING_MIGRATION
+from database.writer import WriteBehindWriter, IdAllocator
+from database.codes import RowEncoder, column
+from database.rollup import BUCKETS, apply_rollups, rollup_to_dict
+from database.retention import RetentionManager
+from database.export import parse_columns, iter_batches, iter_csv, iter_columnar, COLUMNAR_FORMATS
+from core.hydraulic import HydraulicCalculator, CrossSection, StationSections, REGIME_LABELS, RISK_LABELS, FLOW_TYPE_LABELS
+from core.solver import rating_curve
+from core.state import LastStateCache, DEFAULT_STATION
+from core.broadcast import Broadcaster
+from core.metrics import REGISTRY, MetricsMiddleware
+from core.profiler import PROFILER, TRACER, SamplingProfiler
+from core.rules import RuleEngine
+from core.ringbuffer import StationRings, HISTORY_FIELDS, DELTA_FIELDS
+import numpy as np
 
 # 重新创建表结构
 Base.metadata.create_all(bind=engine)
 
-app = FastAPI(title="明渠监测系统 V2.0")
+# 历史查询只取列，不构造 ORM 对象；判别结果在 SQL 中由编码还原为文本
+HISTORY_COLUMNS = [column(name) for name in HISTORY_FIELDS]
+# 批量计算得到的编码数组按下标取判别文本 (报警规则求值用)
+REGIME_NAMES = np.array(REGIME_LABELS, dtype=object)
+RISK_NAMES = np.array(RISK_LABELS, dtype=object)
+FLOW_TYPE_NAMES = np.array(FLOW_TYPE_LABELS, dtype=object)
+
+# 运行指标 (/metrics)：热路径上的耗时直方图与计数器，子指标预先取好，记录时不再查标签
+CALC_SECONDS = REGISTRY.histogram(
+    "monitor_calculator_seconds", "HydraulicCalculator 水力计算耗时 (single 为单条，batch 为整批中每个测站一次)", ["mode"])
+CALC_SINGLE, CALC_BATCH = CALC_SECONDS.labels("single"), CALC_SECONDS.labels("batch")
+LAST_RECORD_SECONDS = REGISTRY.histogram(
+    "monitor_last_record_seconds", "取上一条记录的耗时 (cache 为最近状态缓存，含等待测站锁；db 为启动时查库)", ["source"])
+LAST_RECORD_CACHE, LAST_RECORD_DB = LAST_RECORD_SECONDS.labels("cache"), LAST_RECORD_SECONDS.labels("db")
+READINGS_REJECTED = REGISTRY.counter(
+    "monitor_readings_rejected_total", "被拒绝的读数条数 (malformed 为无法解析的批量请求数)", ["reason"])
+
+# 各测站最近状态缓存：启动时从库里取一次最后一条记录，之后随每次提交更新
+last_state = LastStateCache()
+# 主键在进程内预分配，读数入队前就有最终 id
+id_allocator = IdAllocator()
+# 每个测站最近读数的环形缓冲：/api/realtime 和小范围的 /api/history 直接从这里返回
+recent = StationRings(capacity=1024)
+
+def seed_last_state():
+    db = SessionLocal()
+    try:
+        id_allocator.seed(db.query(func.max(MonitorData.id)).scalar())
+        stations = [row[0] for row in db.query(MonitorData.station_id).distinct()]
+        for station_id in stations:
+            stmt = (
+                select(*HISTORY_COLUMNS)
+                .where(MonitorData.station_id == station_id)
+                .order_by(MonitorData.timestamp.desc(), MonitorData.id.desc())
+                .limit(recent.capacity)
+            )
+            with LAST_RECORD_DB.time():
+                rows = [dict(row) for row in db.execute(stmt).mappings()][::-1]
+            last_state.seed(station_id, rows[-1]["depth"] if rows else None)
+            recent.ring(station_id).seed(rows, complete=len(rows) < recent.capacity)
+    finally:
+        db.close()
+
+# 库还需要离线升级时不读取旧结构的数据，服务启动时 (lifespan) 报错退出
+if PENDING_MIGRATION is None:
+    seed_last_state()
+
+# 写后队列：上传接口只入队，由后台线程批量落库，并在同一事务内累加时间桶汇总
+writer = WriteBehindWriter(
+    SessionLocal, MonitorData, max_queue=5000, batch_size=200, flush_interval=0.2,
+    hooks=[apply_rollups], encode=RowEncoder(),
+).start()
+# run.py 里 uvicorn 跑在守护线程中，进程退出时不会触发 shutdown，靠 atexit 兜底写完剩余数据
+atexit.register(writer.stop)
+
+# 数据保留：过期数据在后台分批删除 (保留期见 database/retention.py 中的环境变量，默认永久保留)
+# 后台线程随应用启动 (lifespan)，只导入 main 的进程 (如 run.py 的模拟器、视觉子进程) 不会清理数据
+retention = RetentionManager(engine)
+atexit.register(retention.stop)
+
+# 实时推送：每条新计算出的读数广播给所有 SSE / WebSocket 订阅者
+broadcaster = Broadcaster(backlog=30)
+
+REGISTRY.callback("monitor_writer_queue_depth", "写后队列中等待落库的元素数", lambda: writer.stats()["queue_depth"])
+REGISTRY.callback(
+    "monitor_writer_rows_total", "写后队列累计行数 (accepted 入队 / written 落库 / dropped 队列满丢弃 / failed 写库失败)",
+    lambda: {(key,): value for key, value in writer.stats().items() if key in ("accepted", "written", "dropped", "failed")},
+    kind="counter", labelnames=["result"])
+REGISTRY.callback("monitor_stream_subscribers", "实时推送订阅连接数", lambda: broadcaster.stats()["subscribers"])
+REGISTRY.callback("monitor_stream_queued_messages", "各订阅连接队列中待发送的消息总数", lambda: broadcaster.stats()["queued"])
+REGISTRY.callback("monitor_stream_dropped_total", "慢订阅者被丢弃的消息数",
+                  lambda: broadcaster.stats()["dropped"], kind="counter")
+
+def encode_message(payload):
+    return json.dumps(payload, ensure_ascii=False, default=lambda o: o.isoformat())
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if PENDING_MIGRATION is not None:
+        version, desc = PENDING_MIGRATION
+        raise RuntimeError(f"数据库需要离线升级 (版本 {version}: {desc})，"
+                           "请先执行 python -m database.migrations (打包版: SmartChannelMonitor migrate)")
+    retention.start()
+    yield
+    retention.stop()
+    writer.stop()
+
+app = FastAPI(title="明渠监测系统 V2.0", lifespan=lifespan)
+
+def _json_safe(value):
+    if isinstance(value, float) and not math.isfinite(value):
+        return str(value)
+    if isinstance(value, dict):
+        return {k: _json_safe(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_json_safe(v) for v in value]
+    return value
+
+@app.exception_handler(RequestValidationError)
+async def validation_error_handler(request: Request, exc: RequestValidationError):
+    # 默认处理器会回显输入值，NaN / Infinity 无法编码为 JSON 而变成 500，这里转成字符串后照常返回 422
+    return JSONResponse(status_code=422, content={"detail": _json_safe(jsonable_encoder(exc.errors()))})
 
 # --- main.py 追加内容 ---
 
@@ -41,6 +166,7 @@ def send_control_command(cmd: ControlCommand):
 def get_control_logs():
     return control_logs
 
+app.add_middleware(MetricsMiddleware)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
@@ -50,6 +176,15 @@ app.add_middleware(
 )
 
 calculator = HydraulicCalculator()
+# 报警规则与流态判别的 Fr 区间 (环境变量 MONITOR_RULES 指向规则配置 JSON，修改后自动生效；
+# 未配置时使用 core/rules.py 中的默认规则)
+rules = RuleEngine(os.environ.get("MONITOR_RULES"),
+                   on_load=[lambda ruleset: setattr(calculator, "critical_band", ruleset.critical_band)])
+# 各测站断面配置 (环境变量 MONITOR_SECTIONS 指向 {测站编号: 断面配置} 的 JSON 文件)
+# 未配置的测站按矩形断面、上传的 channel_width 计算
+sections = StationSections.from_file(os.environ.get("MONITOR_SECTIONS"))
+# 未配置糙率/底坡的测站计算水面线时使用的假定渠道 (5m 宽矩形土渠，底坡与看板原先绘制的河床一致)
+ASSUMED_RATING = rating_curve(CrossSection.rectangle(5.0), 0.025, 0.005)
 
 def get_db():
     db = SessionLocal()
@@ -57,99 +192,638 @@ def get_db():
     finally: db.close()
 
 # 升级后的数据输入模型
+# 读数在写后队列里才落库，入库前就必须保证能存下：浮点数须为有限值，计数不超过 32 位整数
+# (JSON 解析接受 NaN / Infinity，超出范围的值在这里直接返回 422)
+MAX_COUNT = 2 ** 31 - 1
+
 class SensorInput(BaseModel):
-    depth: float
-    velocity_surf: float
-    voltage: float
-    channel_width: float = 5.0
-    sediment: float = 0.0        # 新增：含沙量 (kg/m3)
-    floating_count: int = 0      # 新增：漂浮物数量 (个)
+    station_id: str = DEFAULT_STATION  # 测站编号
+    depth: float = Field(ge=0, allow_inf_nan=False)
+    velocity_surf: Optional[float] = Field(None, allow_inf_nan=False)  # 缺测时不填，由测站的水位-流量关系估算流量
+    voltage: float = Field(allow_inf_nan=False)
+    channel_width: float = Field(5.0, gt=0, allow_inf_nan=False)   # 矩形断面宽度，测站配置了断面时忽略
+    sediment: float = Field(0.0, ge=0, allow_inf_nan=False)        # 新增：含沙量 (kg/m3)
+    floating_count: int = Field(0, ge=0, le=MAX_COUNT)             # 新增：漂浮物数量 (个)
 
-@app.post("/api/upload_data")
-def upload_sensor_data(data: SensorInput, db: Session = Depends(get_db)):
-    last_record = db.query(MonitorData).order_by(MonitorData.id.desc()).first()
-    last_depth = last_record.depth if last_record else None
-    
-    area, v_avg, Q = calculator.calculate_flow(data.depth, data.channel_width, data.velocity_surf)
-    fr, regime, risk = calculator.determine_regime(v_avg, data.depth)
-    flow_type = calculator.check_non_uniform(data.depth, last_depth)
-
-    alerts = []
-    if risk != "正常": alerts.append(f"流态: {regime}")
-    if data.floating_count > 3: alerts.append(f"漂浮物堆积({data.floating_count}个)") # 智能预警
-    if data.sediment > 1.5: alerts.append("泥沙含量过高")
-    
-    alert_str = " | ".join(alerts) if alerts else "正常"
-
-    new_record = MonitorData(
-        timestamp=datetime.now(),
-        depth=data.depth,
-        velocity_surf=data.velocity_surf,
-        voltage=data.voltage,
-        velocity_avg=round(v_avg, 3),
-        flow_rate=round(Q, 3),
-        fr_number=fr,
-        regime=regime,
-        flow_type=flow_type,
-        alert_msg=alert_str,
-        # 新增字段存储（注意：需确保 models.py 里也加了这两列，这里为了简便直接存入通用结构，
-        # 如果报错，请在 models.py 添加 sediment 和 floating_count 列。
-        # 本次演示为了不修改 models.py，我们在 dashboard 直接取 API 数据，
-        # 实际项目中建议去 models.py 加列。）
-    )
-    # 临时处理：为了方便，我们将这两个新数据存入 alert_msg 的附加信息里，
-    # 或者你需要去 database/models.py 真正添加这两列。
-    # 这里我们采用 "并在返回结果里" 的策略，模拟器发什么，前端就显示什么。
-    
-    db.add(new_record)
-    db.commit()
-    
+def build_reading(data: SensorInput, last_depth, section=None, rating=None):
+    """
+    对单条读数做水力计算并生成入库字段与返回数据包
+    :param data: 传感器输入
+    :param last_depth: 上一条记录的水深 (用于均匀流判别)，无则为 None
+    :param section: 测站断面几何，无则按矩形断面计算
+    :param rating: 测站水位-流量关系，流速缺测时使用
+    :return: (入库字段 dict, 返回给前端的数据包 dict, 报警规则的待提交状态)
+    缺少流速且无法估算时抛 ValueError
+    """
+    with CALC_SINGLE.time():
+        area, v_avg, Q = calculator.calculate_flow(data.depth, data.channel_width, data.velocity_surf,
+                                                   section=section, rating=rating)
+        fr, regime, risk = calculator.determine_regime(v_avg, data.depth, section=section)
+        flow_type = calculator.check_non_uniform(data.depth, last_depth)
+    v_avg, Q = round(float(v_avg), 3), round(float(Q), 3)
+    alerts, pending = rules.evaluate(data.station_id, {
+        "depth": [data.depth], "velocity_surf": [data.velocity_surf], "voltage": [data.voltage],
+        "velocity_avg": [v_avg], "flow_rate": [Q], "fr_number": [fr], "sediment": [data.sediment],
+        "floating_count": [data.floating_count], "regime": [regime], "risk": [risk], "flow_type": [flow_type],
+    }, [time.time()])
+    row, payload = assemble_reading(data, v_avg, Q, fr, regime, flow_type, alerts[0])
+    return row, payload, pending
+
+def assemble_reading(data: SensorInput, v_avg, Q, fr, regime, flow_type, alert_str):
+    """根据计算结果和报警规则给出的报警文本生成入库字段和返回数据包"""
+    row = {
+        "station_id": data.station_id,
+        "timestamp": datetime.now(),
+        "depth": data.depth,
+        "velocity_surf": data.velocity_surf,
+        "voltage": data.voltage,
+        "velocity_avg": round(float(v_avg), 3),
+        "flow_rate": round(float(Q), 3),
+        "fr_number": fr,
+        "sediment": data.sediment,
+        "floating_count": data.floating_count,
+        "regime": regime,
+        "flow_type": flow_type,
+        "alert_msg": alert_str,
+    }
     # 返回给前端的实时数据包
-    return {
-        "status": "success",
-        "data": {
-            "depth": data.depth,
-            "flow_rate": round(Q, 3),
-            "velocity_avg": round(v_avg, 3),
-            "fr_number": fr,
-            "regime": regime,
-            "flow_type": flow_type,
-            "alert_msg": alert_str,
-            "sediment": data.sediment,        # 返回泥沙
-            "floating_count": data.floating_count # 返回漂浮物
-        }
+    payload = {
+        "station_id": data.station_id,
+        "timestamp": row["timestamp"],
+        "depth": data.depth,
+        "flow_rate": row["flow_rate"],
+        "velocity_avg": row["velocity_avg"],
+        "fr_number": fr,
+        "regime": regime,
+        "flow_type": flow_type,
+        "alert_msg": alert_str,
+        "sediment": data.sediment,        # 返回泥沙
+        "floating_count": data.floating_count # 返回漂浮物
     }
+    return row, payload
+
+@app.post("/api/upload_data")
+def upload_sensor_data(data: SensorInput):
+    # 各阶段的 span 只在通过管理接口开启追踪时记录 (见 /api/admin/profile)
+    with TRACER.trace("upload_sensor_data", station_id=data.station_id):
+        waited = time.perf_counter()
+        with last_state.hold(data.station_id) as state:
+            LAST_RECORD_CACHE.observe(time.perf_counter() - waited)
+            TRACER.record("state_wait", waited)
+            try:
+                with TRACER.span("calculate"):
+                    row, payload, pending = build_reading(data, state.last_depth, sections.get(data.station_id),
+                                                 sections.rating(data.station_id))
+            except ValueError as e:
+                READINGS_REJECTED.labels("invalid").inc()
+                raise HTTPException(status_code=422, detail=str(e))
+            row["id"] = id_allocator.take()
+            # 入队成功即视为接收，落库由写后队列异步完成
+            with TRACER.span("enqueue"):
+                accepted = writer.submit([row])
+            if not accepted:
+                READINGS_REJECTED.labels("queue_full").inc()
+                raise HTTPException(status_code=503, detail="写入队列已满，读数被丢弃")
+            state.last_depth = data.depth
+            rules.commit(data.station_id, pending)
+            ring = recent.ring(data.station_id)
+            # 推送消息带上本站上一条读数的 id，看板据此判断推送是否连续，不连续时才按游标补拉
+            payload["id"], payload["prev_id"] = row["id"], ring.last_id()
+            with TRACER.span("ring_append"):
+                ring.append(row)
+            with TRACER.span("publish"):
+                broadcaster.publish(encode_message(payload), topic=data.station_id)
+
+    return {"status": "success", "data": payload}
+
+# --- 批量上传：网关断线缓存后一次性补传 ---
+
+def parse_batch_body(body: bytes, content_type: str):
+    """
+    解析批量上传的请求体
+    支持 JSON 数组 (application/json) 与 NDJSON (application/x-ndjson，每行一个对象)
+    """
+    text = body.decode("utf-8")
+    if "ndjson" in content_type or "jsonlines" in content_type:
+        items = [json.loads(line) for line in text.splitlines() if line.strip()]
+    else:
+        items = json.loads(text) if text.strip() else []
+        if not isinstance(items, list):
+            raise ValueError("请求体必须是 SensorInput 数组")
+    for i, item in enumerate(items):
+        if not isinstance(item, dict):
+            raise ValueError(f"第 {i + 1} 条不是 JSON 对象")
+    return [SensorInput(**item) for item in items]
+
+def ingest_batch(items, summary: bool = False):
+    """
+    整批计算，作为写后队列中的一个元素提交，保证整批在同一个事务内写入
+    一批数据可以包含多个测站，均匀流判别在各测站内部按顺序进行
+    """
+    by_station = {}
+    for i, data in enumerate(items):
+        by_station.setdefault(data.station_id, []).append(i)
+
+    with ExitStack() as stack:
+        # 按测站编号排序依次加锁，多个批量请求并发时不会互相死锁
+        waited = time.perf_counter()
+        states = {sid: stack.enter_context(last_state.hold(sid)) for sid in sorted(by_station)}
+        LAST_RECORD_CACHE.observe(time.perf_counter() - waited)
 
-# 专门为前端提供的数据接口，不再查库，直接用全局变量缓存最新值（简化版）
-# 在生产环境中应该查库，这里为了演示方便：
-latest_cache = {}
+        # 向量化计算：各测站一组 (断面不同)，均匀流判别时各测站首条与缓存中的上一条比较
+        depth = np.array([d.depth for d in items], dtype=np.float64)
+        width = np.array([d.channel_width for d in items], dtype=np.float64)
+        v_surf = np.array([d.velocity_surf for d in items], dtype=np.float64)
+        v_avg, Q, fr = np.zeros(len(items)), np.zeros(len(items)), np.zeros(len(items))
+        regime_codes = np.zeros(len(items), dtype=np.int8)
+        flow_codes = np.zeros(len(items), dtype=np.int8)
+        for sid, idx in by_station.items():
+            section = sections.get(sid)
+            with CALC_BATCH.time():
+                try:
+                    _area, v_avg[idx], Q[idx] = calculator.calculate_flow_array(
+                        depth[idx], width[idx], v_surf[idx], section=section, rating=sections.rating(sid)
+                    )
+                except ValueError as e:
+                    READINGS_REJECTED.labels("invalid").inc(len(items))
+                    raise HTTPException(status_code=422, detail=f"测站 {sid}: {e}")
+                fr[idx], regime_codes[idx] = calculator.determine_regime_array(v_avg[idx], depth[idx], section=section)
+                flow_codes[idx] = calculator.check_non_uniform_array(depth[idx], states[sid].last_depth)
+
+        # 报警规则按测站对整组读数求值 (与单条上传同一套规则和状态)
+        v_avg, Q, fr = np.round(v_avg, 3), np.round(Q, 3), np.round(fr, 3)
+        columns = {
+            "depth": depth, "velocity_surf": v_surf, "voltage": [d.voltage for d in items],
+            "velocity_avg": v_avg, "flow_rate": Q, "fr_number": fr,
+            "sediment": [d.sediment for d in items], "floating_count": [d.floating_count for d in items],
+            "regime": REGIME_NAMES[regime_codes], "risk": RISK_NAMES[regime_codes],
+            "flow_type": FLOW_TYPE_NAMES[flow_codes],
+        }
+        alert_msgs, pending = [None] * len(items), {}
+        now = time.time()
+        for sid, idx in by_station.items():
+            msgs, pending[sid] = rules.evaluate(sid, {k: np.asarray(v)[idx] for k, v in columns.items()},
+                                                np.full(len(idx), now))
+            for i, msg in zip(idx, msgs):
+                alert_msgs[i] = msg
+
+        rows, payloads = [], []
+        for i, data in enumerate(items):
+            code = regime_codes[i]
+            row, payload = assemble_reading(
+                data, float(v_avg[i]), float(Q[i]), float(fr[i]),
+                REGIME_LABELS[code], FLOW_TYPE_LABELS[flow_codes[i]], alert_msgs[i],
+            )
+            rows.append(row)
+            payloads.append(payload)
+
+        if rows:
+            first_id = id_allocator.take(len(rows))
+            for i, row in enumerate(rows):
+                row["id"] = first_id + i
+            if not writer.submit(rows):
+                READINGS_REJECTED.labels("queue_full").inc(len(rows))
+                raise HTTPException(status_code=503, detail="写入队列已满，批量数据被丢弃")
+            for sid, idx in by_station.items():
+                states[sid].last_depth = items[idx[-1]].depth
+                rules.commit(sid, pending[sid])
+                ring = recent.ring(sid)
+                prev_id = ring.last_id()
+                for i in idx:
+                    payloads[i]["id"], payloads[i]["prev_id"] = rows[i]["id"], prev_id
+                    prev_id = rows[i]["id"]
+                ring.extend(rows[i] for i in idx)
+            for data, payload in zip(items, payloads):
+                broadcaster.publish(encode_message(payload), topic=data.station_id)
+
+    if summary:
+        return {
+            "status": "success",
+            "count": len(payloads),
+            "alerts": sum(1 for p in payloads if p["alert_msg"] != "正常"),
+            "last": payloads[-1] if payloads else None,
+        }
+    return {"status": "success", "count": len(payloads), "data": payloads}
+
+@app.post("/api/upload_batch")
+async def upload_batch(request: Request, summary: bool = False):
+    """
+    批量上传接口
+    :param summary: True 时只返回汇总 (条数/报警数/最后一条)，否则逐条返回计算结果
+    """
+    try:
+        items = parse_batch_body(await request.body(), request.headers.get("content-type", ""))
+    except ValueError as e:
+        READINGS_REJECTED.labels("malformed").inc()
+        raise HTTPException(status_code=422, detail=f"批量数据格式错误: {e}")
+    # 计算与写库是阻塞操作，放到线程池里执行，避免阻塞事件循环
+    return await run_in_threadpool(ingest_batch, items, summary)
 
 @app.post("/api/upload_data_v2")
-def upload_v2(data: SensorInput, db: Session = Depends(get_db)):
-    # 复用上面的逻辑，但更新全局缓存
-    res = upload_sensor_data(data, db)
-    global latest_cache
-    latest_cache = res["data"]
-    return res
+def upload_v2(data: SensorInput):
+    # 与 upload_data 相同；实时数据统一由环形缓冲提供
+    return upload_sensor_data(data)
+
+@app.get("/metrics")
+def get_metrics():
+    """运行指标，Prometheus 文本格式 (请求耗时、水力计算耗时、提交耗时、导出速度、队列深度、丢弃/拒绝数)"""
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+# --- 管理接口：进程内采样分析 (打包后的 EXE 无法挂外部分析工具)、报警规则修改 ---
+# 管理接口需在请求头 X-Admin-Token 中携带环境变量 MONITOR_ADMIN_TOKEN 的值；
+# 未设置 MONITOR_ADMIN_TOKEN 时一律拒绝 (CORS 允许任意来源，不能让任意网页关掉报警或开启采样)
+ADMIN_TOKEN = os.environ.get("MONITOR_ADMIN_TOKEN") or None
+
+def require_admin(x_admin_token: Optional[str] = Header(None)):
+    if ADMIN_TOKEN is None:
+        raise HTTPException(status_code=403, detail="未配置管理口令 (MONITOR_ADMIN_TOKEN)，管理接口已禁用")
+    if x_admin_token is None or not secrets.compare_digest(x_admin_token, ADMIN_TOKEN):
+        raise HTTPException(status_code=403, detail="管理口令错误")
+
+def collapsed_response(text):
+    filename = f"profile-{PROFILER.started_at:%Y%m%d-%H%M%S}.collapsed"
+    return PlainTextResponse(text, headers={"Content-Disposition": f'attachment; filename="{filename}"'})
+
+@app.post("/api/admin/profile", dependencies=[Depends(require_admin)])
+async def run_profile(
+    seconds: float = Query(10.0, gt=0, le=SamplingProfiler.MAX_SECONDS),
+    interval_ms: float = Query(10.0, ge=1, le=1000),
+    idle: bool = Query(True, description="是否计入空闲线程 (叶子帧在等锁、等队列、等 I/O)"),
+    trace: bool = Query(False, description="同时记录 upload_sensor_data 的分阶段耗时"),
+):
+    """
+    对所有线程 (uvicorn 事件循环、线程池、写后队列等) 采样 seconds 秒，返回折叠栈文本，
+    可直接交给 flamegraph.pl 或拖入 speedscope 生成火焰图
+    trace=true 时同时开启请求追踪，结果见 /api/admin/profile/traces
+    需管理口令 (X-Admin-Token)，未设置 MONITOR_ADMIN_TOKEN 时返回 403
+    """
+    try:
+        future = PROFILER.start(seconds, interval=interval_ms / 1000, idle=idle)
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    if trace:
+        TRACER.clear()
+        TRACER.enabled = True
+    try:
+        # 采样在独立线程中进行，这里只等待结果，不占用事件循环和线程池
+        text = await asyncio.wrap_future(future)
+    finally:
+        TRACER.enabled = False
+    return collapsed_response(text)
+
+@app.post("/api/admin/profile/stop", dependencies=[Depends(require_admin)])
+def stop_profile():
+    """提前结束正在进行的采样，等待中的 /api/admin/profile 随即返回已采到的结果 (需管理口令)"""
+    PROFILER.stop()
+    return PROFILER.status()
+
+@app.get("/api/admin/profile", dependencies=[Depends(require_admin)])
+def get_profile_status():
+    """采样状态 (需管理口令)"""
+    return {**PROFILER.status(), "tracing": TRACER.enabled, "traces": len(TRACER.traces())}
+
+@app.get("/api/admin/profile/collapsed", dependencies=[Depends(require_admin)])
+def get_last_profile():
+    """最近一次采样的折叠栈 (发起采样的请求中途断开时从这里取；需管理口令)"""
+    if PROFILER.started_at is None:
+        raise HTTPException(status_code=404, detail="尚未进行过采样")
+    return collapsed_response(PROFILER.collapsed())
+
+@app.get("/api/admin/profile/traces", dependencies=[Depends(require_admin)])
+def get_profile_traces(limit: int = Query(200, ge=1, le=2000), slowest: bool = False):
+    """
+    最近一次追踪记录的请求及其各阶段耗时 (offset_ms 为相对请求开始的时间)
+    slowest=true 时按总耗时从大到小返回
+    需管理口令
+    """
+    traces = TRACER.traces()
+    if slowest:
+        traces.sort(key=lambda t: t["duration_ms"], reverse=True)
+    else:
+        traces = traces[::-1]
+    return {"count": len(TRACER.traces()), "traces": traces[:limit]}
+
+@app.get("/api/rules")
+def get_rules():
+    """当前报警规则：配置、版本、来源、最近一次加载错误、各测站处于报警中的有状态规则"""
+    return rules.status()
+
+@app.put("/api/rules", dependencies=[Depends(require_admin)])
+def put_rules(config: dict):
+    """
+    替换报警规则 (立即生效，仅保存在内存中；配置文件 MONITOR_RULES 之后被修改时以文件为准)
+    定义未变的规则保留各测站的持续时间 / 回差状态
+    需管理口令 (X-Admin-Token)，未设置 MONITOR_ADMIN_TOKEN 时返回 403，防止任意网页清空规则关掉报警
+    """
+    try:
+        rules.load(config)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    return rules.status()
+
+@app.post("/api/rules/reload", dependencies=[Depends(require_admin)])
+def reload_rules():
+    """立即从 MONITOR_RULES 文件重新加载报警规则 (需管理口令，未设置 MONITOR_ADMIN_TOKEN 时返回 403)"""
+    try:
+        rules.reload()
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    return rules.status()
+
+@app.get("/api/writer/stats")
+def get_writer_stats():
+    """写后队列状态：队列深度、丢弃数、已写入数等"""
+    return writer.stats()
+
+@app.get("/api/retention/status")
+def get_retention_status():
+    """数据保留策略与最近一次清理的结果"""
+    return retention.status()
+
+@app.post("/api/retention/run")
+def run_retention():
+    """立即触发一轮清理 (在后台线程执行)"""
+    retention.trigger()
+    return {"status": "scheduled"}
 
 @app.get("/api/realtime")
-def get_realtime_data():
-    return latest_cache if latest_cache else {}
+def get_realtime_data(station_id: str = DEFAULT_STATION):
+    ring = recent.get(station_id)
+    return (ring.latest() if ring else None) or {}
+
+@app.get("/api/stations")
+def get_stations():
+    """已接入的测站及各自的最新读数"""
+    return [
+        {"station_id": sid, "latest": recent.get(sid).latest()}
+        for sid in recent.stations()
+    ]
+
+@app.get("/api/sections")
+def get_sections():
+    """已配置断面的测站及断面参数"""
+    return sections.describe()
+
+@app.get("/api/stations/{station_id}/section")
+def get_station_section(station_id: str):
+    if sections.get(station_id) is None:
+        raise HTTPException(status_code=404, detail="该测站未配置断面，按矩形断面计算")
+    return sections.describe_station(station_id)
+
+@app.put("/api/stations/{station_id}/section", dependencies=[Depends(require_admin)])
+def put_station_section(station_id: str, config: dict):
+    """
+    设置测站断面 (立即生效，仅保存在内存中；需要持久化请写入 MONITOR_SECTIONS 文件)
+    需要管理令牌 (X-Admin-Token)
+    配置格式见 CrossSection.from_config，可另加 manning_n (糙率) 与 slope (底坡) 以启用水位-流量关系
+    """
+    try:
+        sections.configure(station_id, config)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    return sections.describe_station(station_id)
+
+@app.get("/api/stations/{station_id}/rating")
+def get_station_rating(station_id: str, flow_rate: Optional[float] = Query(None, gt=0),
+                       points: int = Query(50, ge=2, le=1024)):
+    """
+    测站的水位-流量关系曲线
+    :param flow_rate: 指定流量时另外返回该流量下的正常水深、临界水深和底坡类型
+    """
+    rating = sections.rating(station_id)
+    if rating is None:
+        raise HTTPException(status_code=404, detail="该测站未配置断面、糙率和底坡")
+    result = rating.describe(points)
+    if flow_rate is not None:
+        yn, yc = float(rating.normal_depth(flow_rate)[0]), float(rating.critical_depth(flow_rate)[0])
+        result.update(
+            flow_rate=flow_rate,
+            normal_depth=round(yn, 4) if np.isfinite(yn) else None,
+            critical_depth=round(yc, 4) if np.isfinite(yc) else None,
+            slope_type=str(rating.slope_type(flow_rate)[0]) if np.isfinite(yn) else None,
+        )
+    return result
+
+@app.get("/api/profile")
+def get_profile(
+    station_id: str = DEFAULT_STATION,
+    depth: Optional[float] = Query(None, gt=0),
+    flow_rate: Optional[float] = Query(None, gt=0),
+    length: float = Query(50.0, gt=0, le=10000),
+    points: int = Query(30, ge=2, le=1000),
+):
+    """
+    测站所在渠段的渐变流水面线，供看板 3D 数字孪生绘制
+    :param depth/flow_rate: 控制断面水深与流量，不填则使用测站最新读数
+    结果按量化后的 (流量, 水深) 缓存，看板反复刷新不会重复计算
+    """
+    if depth is None or flow_rate is None:
+        ring = recent.get(station_id)
+        latest = ring.latest() if ring else None
+        if latest is None:
+            raise HTTPException(status_code=404, detail="该测站暂无读数")
+        depth = depth if depth is not None else latest["depth"]
+        flow_rate = flow_rate if flow_rate is not None else latest["flow_rate"]
+    rating = sections.rating(station_id)
+    profile = calculator.gvf_profile_cached(rating or ASSUMED_RATING, flow_rate, depth, length, points)
+    return {**profile, "station_id": station_id, "assumed_channel": rating is None}
+
+@app.get("/api/cache/stats")
+def get_cache_stats():
+    """环形缓冲命中统计"""
+    return recent.stats()
+
+# --- 实时推送：取代看板每秒轮询 /api/realtime ---
+
+@app.get("/api/stream")
+async def stream_realtime(request: Request, station_id: Optional[str] = None):
+    """
+    Server-Sent Events 推送，连接建立后先发送最近的快照，之后每条新读数推送一次
+    每 15 秒没有新数据时发送一条注释作为心跳
+    :param station_id: 只订阅一个测站，不填则订阅全部测站
+    """
+    queue, snapshot = broadcaster.subscribe(station_id)
+
+    async def events():
+        try:
+            for message in snapshot:
+                yield f"data: {message}\n\n"
+            while True:
+                try:
+                    message = await asyncio.wait_for(queue.get(), timeout=15)
+                    yield f"data: {message}\n\n"
+                except asyncio.TimeoutError:
+                    if await request.is_disconnected():
+                        break
+                    yield ": keepalive\n\n"
+        finally:
+            broadcaster.unsubscribe(queue)
+
+    headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    return StreamingResponse(events(), media_type="text/event-stream", headers=headers)
+
+@app.websocket("/ws/realtime")
+async def ws_realtime(websocket: WebSocket, station_id: Optional[str] = None):
+    """WebSocket 推送，消息内容与 /api/stream 相同"""
+    await websocket.accept()
+    queue, snapshot = broadcaster.subscribe(station_id)
+    try:
+        for message in snapshot:
+            await websocket.send_text(message)
+        while True:
+            await websocket.send_text(await queue.get())
+    except WebSocketDisconnect:
+        pass
+    finally:
+        broadcaster.unsubscribe(queue)
+
+@app.get("/api/stream/stats")
+def get_stream_stats():
+    return broadcaster.stats()
 
 @app.get("/api/history")
-def get_history(limit: int = 50, db: Session = Depends(get_db)):
-    data = db.query(MonitorData).order_by(MonitorData.timestamp.desc()).limit(limit).all()
-    return data[::-1]
+def get_history(
+    station_id: str = DEFAULT_STATION,
+    limit: int = Query(50, ge=1, le=10000),
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    before_id: Optional[int] = None,
+    db: Session = Depends(get_db),
+):
+    """
+    历史数据查询 (结果按时间正序)，每次只查一个测站
+    :param since: 只返回晚于该时间的记录，用于增量拉取新数据 (从 since 往后取 limit 条)
+    :param until: 只返回不晚于该时间的记录
+    :param before_id: 键集分页游标，只返回 id 小于该值的记录 (向前翻页)
+    不带 since 时返回满足条件的最近 limit 条
+    最近的数据优先从环形缓冲返回，缓冲不能完整回答时再查库
+    """
+    ring = recent.get(station_id)
+    if until is None and ring is not None:
+        rows = ring.query(limit, since=since, before_id=before_id)
+        if rows is not None:
+            return rows
+
+    stmt = select(*HISTORY_COLUMNS).where(MonitorData.station_id == station_id)
+    if since is not None:
+        stmt = stmt.where(MonitorData.timestamp > since)
+    if until is not None:
+        stmt = stmt.where(MonitorData.timestamp <= until)
+    if before_id is not None:
+        stmt = stmt.where(MonitorData.id < before_id)
+
+    if since is not None and before_id is None:
+        # 增量拉取：从游标往后按时间正序取
+        stmt = stmt.order_by(MonitorData.timestamp.asc(), MonitorData.id.asc()).limit(limit)
+        return [dict(row) for row in db.execute(stmt).mappings()]
+
+    stmt = stmt.order_by(MonitorData.timestamp.desc(), MonitorData.id.desc()).limit(limit)
+    rows = [dict(row) for row in db.execute(stmt).mappings()]
+    return rows[::-1]
+
+@app.get("/api/history/delta")
+def get_history_delta(
+    station_id: str = DEFAULT_STATION,
+    after_id: Optional[int] = None,
+    limit: int = Query(30, ge=1, le=1000),
+    fields: Optional[str] = None,
+    db: Session = Depends(get_db),
+):
+    """
+    增量历史 (看板趋势图/日志列表轮询用)：只返回 id 大于 after_id 的新记录，按列组织
+    :param after_id: 上一次返回的 last_id；不填时返回最近 limit 条
+    :param limit: 最多返回的条数，新记录超过 limit 条时只返回最新的 limit 条
+    :param fields: 逗号分隔的列名，默认只含看板用到的列 (id 总会返回)
+    返回 {"last_id": 新游标, "fields": [...], "columns": {列名: [值, ...]}}，没有新数据时各列为空
+    """
+    names = [name.strip() for name in fields.split(",") if name.strip()] if fields else list(DELTA_FIELDS)
+    unknown = [name for name in names if name not in HISTORY_FIELDS]
+    if unknown:
+        raise HTTPException(status_code=422, detail=f"未知的列: {', '.join(unknown)}")
+    names = ["id"] + [name for name in names if name != "id"]
+
+    ring = recent.get(station_id)
+    cols = ring.delta(after_id, limit, names) if ring is not None else None
+    if cols is None:
+        stmt = select(*[column(name) for name in names]).where(MonitorData.station_id == station_id)
+        if after_id is not None:
+            stmt = stmt.where(MonitorData.id > after_id)
+        stmt = stmt.order_by(MonitorData.id.desc()).limit(limit)
+        rows = db.execute(stmt).all()[::-1]
+        cols = {name: [row[i] for row in rows] for i, name in enumerate(names)}
+    last_id = cols["id"][-1] if cols["id"] else after_id
+    return {"station_id": station_id, "last_id": last_id, "fields": names, "columns": cols}
+
+@app.get("/api/history/aggregate")
+def get_history_aggregate(
+    station_id: str = DEFAULT_STATION,
+    bucket: str = "1m",
+    start: Optional[datetime] = Query(None, alias="from"),
+    end: Optional[datetime] = Query(None, alias="to"),
+    limit: int = Query(2000, ge=1, le=100000),
+    db: Session = Depends(get_db),
+):
+    """
+    降采样历史查询，直接读时间桶汇总表
+    :param bucket: 粒度 1m / 1h / 1d
+    :param from/to: 时间范围 (按桶起始时间过滤)；不带 from 时返回最近 limit 个桶
+    """
+    if bucket not in BUCKETS:
+        raise HTTPException(status_code=422, detail=f"bucket 只支持 {', '.join(BUCKETS)}")
+    query = db.query(MonitorRollup).filter(
+        MonitorRollup.station_id == station_id, MonitorRollup.bucket == bucket
+    )
+    if start is not None:
+        query = query.filter(MonitorRollup.bucket_start >= start)
+    if end is not None:
+        query = query.filter(MonitorRollup.bucket_start <= end)
+
+    if start is not None:
+        rows = query.order_by(MonitorRollup.bucket_start.asc()).limit(limit).all()
+    else:
+        rows = query.order_by(MonitorRollup.bucket_start.desc()).limit(limit).all()[::-1]
+    return [rollup_to_dict(row) for row in rows]
 
 # 新增：导出接口
 @app.get("/api/export")
-def export_data(db: Session = Depends(get_db)):
-    data = db.query(MonitorData).all()
-    stream = io.StringIO()
-    writer = csv.writer(stream)
-    writer.writerow(["ID", "时间", "水深", "流速", "流量", "Fr数", "流态", "报警"])
-    for row in data:
-        writer.writerow([row.id, row.timestamp, row.depth, row.velocity_surf, row.flow_rate, row.fr_number, row.regime, row.alert_msg])
-    response = StreamingResponse(iter([stream.getvalue()]), media_type="text/csv")
-    response.headers["Content-Disposition"] = "attachment; filename=monitor_data.csv"
-    return response
\ No newline at end of file
+def export_data(
+    station_id: Optional[str] = None,
+    start: Optional[datetime] = Query(None, alias="from"),
+    end: Optional[datetime] = Query(None, alias="to"),
+    columns: Optional[str] = None,
+    gzip: bool = False,
+    format: str = "csv",
+):
+    """
+    流式导出：按批读取数据库、边编码边发送，内存占用不随表大小增长
+    :param station_id: 只导出一个测站，不填则导出全部测站
+    :param from/to: 时间范围 (可选)
+    :param columns: 逗号分隔的列名，默认 id,timestamp,depth,velocity_surf,flow_rate,fr_number,regime,alert_msg
+    :param gzip: True 时输出 gzip 压缩的 CSV (仅 csv 格式)
+    :param format: csv / parquet / arrow (Arrow IPC 文件，即 Feather v2)，列式格式保留类型，
+                   regime/flow_type/alert_msg 为字典编码，需要安装 pyarrow
+    """
+    try:
+        names = parse_columns(columns)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+
+    if format in COLUMNAR_FORMATS:
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            raise HTTPException(status_code=501, detail=f"{format} 导出需要安装 pyarrow")
+        ext, media_type = COLUMNAR_FORMATS[format]
+        # 列式格式按较大的批次读取，每批对应一个 row group / record batch
+        chunks = iter_columnar(iter_batches(SessionLocal, names, start, end, batch_size=65536, station_id=station_id), names, format)
+        filename = f"monitor_data.{ext}"
+    elif format == "csv":
+        chunks = iter_csv(iter_batches(SessionLocal, names, start, end, station_id=station_id), names, gzip=gzip)
+        filename = "monitor_data.csv.gz" if gzip else "monitor_data.csv"
+        media_type = "application/gzip" if gzip else "text/csv"
+    else:
+        raise HTTPException(status_code=422, detail="format 只支持 csv / parquet / arrow")
+
+    response = StreamingResponse(chunks, media_type=media_type)
+    response.headers["Content-Disposition"] = f"attachment; filename={filename}"
+    return response
@@ -5,7 +5,9 @@ import sys
 import os
 import time
 from streamlit.web import cli as stcli
-from main import app
+from main import app, writer
+from database.retention import main as retention_main
+from database.migrations import main as migrate_main
 import simulator
 import vision_sensor
 
@@ -23,6 +25,14 @@ def main():
         elif cmd == "vision":
             vision_sensor.run_vision()
             return
+        elif cmd == "retention":
+            # 离线数据维护 (需先退出监测系统)，如: SmartChannelMonitor retention --enable-incremental-vacuum
+            retention_main(sys.argv[2:])
+            return
+        elif cmd == "migrate":
+            # 数据库离线升级 (需先退出监测系统)，如: SmartChannelMonitor migrate
+            migrate_main(sys.argv[2:])
+            return
 
     print("🚀 正在启动一体化监测系统...")
 
@@ -52,7 +62,11 @@ def main():
     ]
     
     print("✅ 前端正在加载，请稍候...")
-    sys.exit(stcli.main())
+    try:
+        sys.exit(stcli.main())
+    finally:
+        # 退出前把写后队列中尚未落库的读数写完
+        writer.stop()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
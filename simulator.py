@@ -1,30 +1,203 @@
 import requests
 import time
 import random
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import tempfile
+from datetime import datetime
 
 URL = "http://127.0.0.1:8000/api/upload_data_v2"
+BASE_URL = "http://127.0.0.1:8000"
+ENDPOINTS = ("upload_data", "upload_data_v2", "upload_batch")
 
-def run_simulation():
-    print(">>> 模拟器子进程已启动...")
-    depth = 2.0
-    while True:
-        depth += random.uniform(-0.05, 0.05)
-        if depth < 0.5: depth = 0.5
-        velocity = 4.0 / depth + random.uniform(-0.1, 0.1)
-        sediment = (velocity * 0.3) + random.uniform(0, 0.1)
-        floating = random.randint(1, 5) if random.random() > 0.85 else 0
-
-        payload = {
-            "depth": round(depth, 3),
+class Station:
+    """一个模拟测站：水深随机游走，流速、含沙量随水深变化，偶尔出现漂浮物"""
+
+    def __init__(self, station_id="default", seed=None):
+        self.station_id = station_id
+        self.depth = 2.0
+        self.rng = random.Random(seed)
+
+    def reading(self):
+        rng = self.rng
+        self.depth += rng.uniform(-0.05, 0.05)
+        if self.depth < 0.5: self.depth = 0.5
+        velocity = 4.0 / self.depth + rng.uniform(-0.1, 0.1)
+        sediment = (velocity * 0.3) + rng.uniform(0, 0.1)
+        floating = rng.randint(1, 5) if rng.random() > 0.85 else 0
+        return {
+            "station_id": self.station_id,
+            "depth": round(self.depth, 3),
             "velocity_surf": round(velocity, 3),
             "voltage": 12.5,
             "channel_width": 5.0,
             "sediment": round(sediment, 2),
             "floating_count": floating
         }
-        try: requests.post(URL, json=payload)
+
+def run_simulation():
+    print(">>> 模拟器子进程已启动...")
+    station = Station()
+    session = requests.Session()
+    while True:
+        try: session.post(URL, json=station.reading(), timeout=2)
         except: pass
         time.sleep(1)
 
+# ==============================================================================
+# 压测模式：K 个测站按设定速率并发上传，统计各上传接口的延迟分位数与持续吞吐
+# - http：通过连接池 (httpx.AsyncClient) 压已启动的服务
+# - inprocess：在本进程内直接调用 FastAPI 应用 (ASGI)，默认使用临时数据库，不碰正式库
+# 速率大于 0 时按计划时刻发送 (开环)，延迟从计划时刻算起，服务端变慢时排队时间也计入延迟
+# ==============================================================================
+
+def percentiles(values):
+    if not values:
+        return {"p50": None, "p95": None, "p99": None, "max": None}
+    values = sorted(values)
+    pick = lambda q: round(values[min(len(values) - 1, int(q * len(values)))] * 1000, 3)  # noqa: E731
+    return {"p50": pick(0.50), "p95": pick(0.95), "p99": pick(0.99), "max": round(values[-1] * 1000, 3)}
+
+async def station_worker(client, endpoint, station, rate, batch_size, deadline, stats):
+    """单个测站：按 rate (条/秒) 生成读数；批量接口每 batch_size 条发一次请求"""
+    rows_per_request = batch_size if endpoint == "upload_batch" else 1
+    interval = rows_per_request / rate if rate > 0 else 0.0
+    loop = asyncio.get_running_loop()
+    scheduled = loop.time()
+    while True:
+        if interval:
+            scheduled += interval
+            delay = scheduled - loop.time()
+            if delay > 0: await asyncio.sleep(delay)
+            start = scheduled
+        else:
+            start = loop.time()
+        if start >= deadline: return
+        if endpoint == "upload_batch":
+            body = [station.reading() for _ in range(batch_size)]
+            request = client.post("/api/upload_batch", params={"summary": "true"}, json=body)
+        else:
+            request = client.post(f"/api/{endpoint}", json=station.reading())
+        try:
+            resp = await request
+            ok = resp.status_code == 200
+        except Exception:
+            ok = False
+        now = loop.time()
+        if ok:
+            stats["latency"].append(now - start)
+            stats["rows"] += rows_per_request
+            stats["requests"] += 1
+        else:
+            stats["errors"] += 1
+
+async def bench_endpoint(client, endpoint, args):
+    writer_before = (await client.get("/api/writer/stats")).json()
+    stats = {"latency": [], "rows": 0, "requests": 0, "errors": 0}
+    stations = [Station(f"bench-{i + 1}", seed=i) for i in range(args.stations)]
+    loop = asyncio.get_running_loop()
+    t0 = loop.time()
+    deadline = t0 + args.duration
+    await asyncio.gather(*(station_worker(client, endpoint, s, args.rate, args.batch_size, deadline, stats)
+                           for s in stations))
+    elapsed = loop.time() - t0
+    writer_after = (await client.get("/api/writer/stats")).json()
+    return {
+        "requests": stats["requests"],
+        "rows": stats["rows"],
+        "errors": stats["errors"],
+        "seconds": round(elapsed, 3),
+        "rows_per_sec": round(stats["rows"] / elapsed, 1),
+        "requests_per_sec": round(stats["requests"] / elapsed, 1),
+        "latency_ms": percentiles(stats["latency"]),
+        # 写后队列在本轮中的变化：dropped 增加说明入队速度超过了落库速度
+        "writer": {key: writer_after[key] - writer_before[key] for key in ("accepted", "written", "dropped", "failed")},
+        "writer_queue_depth": writer_after["queue_depth"],
+    }
+
+async def run_bench(args, transport=None):
+    import httpx
+    limits = httpx.Limits(max_connections=args.connections, max_keepalive_connections=args.connections)
+    async with httpx.AsyncClient(base_url=args.base_url if transport is None else "http://testserver",
+                                 transport=transport, limits=limits, timeout=30.0) as client:
+        results = {}
+        for endpoint in args.endpoints:
+            results[endpoint] = await bench_endpoint(client, endpoint, args)
+            r = results[endpoint]
+            lat = r["latency_ms"]
+            print(f"{endpoint:>15}: {r['rows_per_sec']:10.1f} rows/s {r['requests_per_sec']:9.1f} req/s | "
+                  f"p50 {lat['p50']} / p95 {lat['p95']} / p99 {lat['p99']} ms | "
+                  f"errors {r['errors']}, writer dropped {r['writer']['dropped']}", flush=True)
+        return results
+
+def run_inprocess(args):
+    """进程内压测：导入 main 前把数据库指向临时文件 (--db 指定时使用该库)"""
+    workdir = None
+    if args.db:
+        os.environ["MONITOR_DB_URL"] = f"sqlite:///{args.db}"
+    elif "MONITOR_DB_URL" not in os.environ:
+        workdir = tempfile.mkdtemp(prefix="bench_ingest_")
+        os.environ["MONITOR_DB_URL"] = f"sqlite:///{os.path.join(workdir, 'bench.db')}"
+    import httpx
+    import main
+    try:
+        return asyncio.run(run_bench(args, transport=httpx.ASGITransport(app=main.app)))
+    finally:
+        main.retention.stop()
+        main.writer.stop()
+        main.engine.dispose()
+        if workdir:
+            import shutil
+            shutil.rmtree(workdir, ignore_errors=True)
+
+def git_revision():
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, timeout=5,
+                             cwd=os.path.dirname(os.path.abspath(__file__)))
+        return out.stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+def main():
+    parser = argparse.ArgumentParser(description="传感器模拟器；--bench 时作为上传接口压测工具")
+    parser.add_argument("--bench", action="store_true", help="压测模式")
+    parser.add_argument("--mode", choices=("http", "inprocess"), default="http", help="压已启动的服务或进程内调用")
+    parser.add_argument("--base-url", default=BASE_URL)
+    parser.add_argument("--stations", type=int, default=10, help="模拟测站数 K")
+    parser.add_argument("--rate", type=float, default=10.0, help="每个测站每秒的读数条数，0 表示不限速 (闭环)")
+    parser.add_argument("--duration", type=float, default=10.0, help="每个接口的压测时长 (秒)")
+    parser.add_argument("--connections", type=int, default=50, help="连接池大小")
+    parser.add_argument("--batch-size", type=int, default=50, help="批量接口每个请求的条数")
+    parser.add_argument("--endpoints", default=",".join(ENDPOINTS), help="逗号分隔，可选 " + ", ".join(ENDPOINTS))
+    parser.add_argument("--db", help="inprocess 模式使用的 SQLite 文件，默认为临时库")
+    parser.add_argument("--output", default="bench_results.json", help="结果文件 (JSON)")
+    args = parser.parse_args()
+
+    if not args.bench:
+        run_simulation()
+        return
+
+    args.endpoints = [e.strip() for e in args.endpoints.split(",") if e.strip()]
+    unknown = [e for e in args.endpoints if e not in ENDPOINTS]
+    if unknown:
+        parser.error(f"未知的接口: {', '.join(unknown)}")
+    print(f">>> 压测 ({args.mode}): {args.stations} 个测站 x {args.rate or '不限速'} 条/秒, 每个接口 {args.duration} 秒")
+    results = run_inprocess(args) if args.mode == "inprocess" else asyncio.run(run_bench(args))
+    report = {
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "revision": git_revision(),
+        "python": sys.version.split()[0],
+        "config": {key: getattr(args, key) for key in
+                   ("mode", "stations", "rate", "duration", "connections", "batch_size", "endpoints")},
+        "results": results,
+    }
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f">>> 结果已写入 {args.output}")
+
 if __name__ == "__main__":
-    run_simulation()
\ No newline at end of file
+    main()
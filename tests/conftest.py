@@ -0,0 +1,14 @@
+# tests/conftest.py
+# 导入 database.models 时会按 MONITOR_DB_URL 建库并执行迁移，必须在任何业务模块导入之前指向临时库，
+# 避免改动仓库里的 channel_monitor.db
+import os
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+_TMP = tempfile.mkdtemp(prefix="monitor_tests_")
+os.environ["MONITOR_DB_URL"] = f"sqlite:///{os.path.join(_TMP, 'channel_monitor.db')}"
+os.environ.pop("MONITOR_ADMIN_TOKEN", None)
+os.environ.pop("MONITOR_RULES", None)
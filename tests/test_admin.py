@@ -0,0 +1,38 @@
+# tests/test_admin.py
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+
+SECTION = {"type": "rectangle", "width": 4}
+
+
+@pytest.fixture
+def client():
+    return TestClient(main.app)
+
+
+def test_admin_endpoints_fail_closed_without_token(client, monkeypatch):
+    monkeypatch.setattr(main, "ADMIN_TOKEN", None)
+    assert client.get("/api/admin/profile").status_code == 403
+    assert client.get("/api/admin/profile", headers={"X-Admin-Token": ""}).status_code == 403
+    assert client.put("/api/stations/s1/section", json=SECTION).status_code == 403
+
+
+def test_admin_endpoints_check_the_token(client, monkeypatch):
+    monkeypatch.setattr(main, "ADMIN_TOKEN", "secret")
+    assert client.get("/api/admin/profile", headers={"X-Admin-Token": "wrong"}).status_code == 403
+    assert client.get("/api/admin/profile", headers={"X-Admin-Token": "secret"}).status_code == 200
+    assert client.put("/api/stations/s1/section", json=SECTION).status_code == 403
+    r = client.put("/api/stations/s1/section", json=SECTION, headers={"X-Admin-Token": "secret"})
+    assert r.status_code == 200
+
+
+def test_invalid_reading_is_rejected_before_queuing(client):
+    accepted = main.writer.stats()["accepted"]
+    for body in ({"depth": -1, "voltage": 12}, {"depth": 1, "voltage": 12, "floating_count": 2 ** 40}):
+        assert client.post("/api/upload_data", json=body).status_code == 422
+    r = client.post("/api/upload_data", content='{"depth": NaN, "voltage": 12}',
+                    headers={"content-type": "application/json"})
+    assert r.status_code == 422
+    assert main.writer.stats()["accepted"] == accepted
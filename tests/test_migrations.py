@@ -0,0 +1,69 @@
+# tests/test_migrations.py
+import sqlite3
+
+from sqlalchemy import select
+
+from database.codes import column
+from database.migrations import MIGRATIONS, migrate
+from database.models import Base, build_engine
+
+# 版本 0 的库 (最早发布的结构，判别结果为文本列)
+LEGACY_SCHEMA = """
+CREATE TABLE monitor_data (
+    id INTEGER NOT NULL, timestamp DATETIME, depth FLOAT, velocity_surf FLOAT, voltage FLOAT,
+    velocity_avg FLOAT, flow_rate FLOAT, fr_number FLOAT, regime VARCHAR, flow_type VARCHAR, alert_msg VARCHAR,
+    PRIMARY KEY (id)
+);
+CREATE INDEX ix_monitor_data_id ON monitor_data (id);
+"""
+LEGACY_ROWS = [
+    (1, "2026-01-01 00:00:00.000000", 2.0, 1.9, 12.5, 1.6, 16.0, 0.38, "缓流 (Subcritical)", "初始化", "正常"),
+    (2, "2026-01-01 00:00:02.000000", 2.1, 2.0, 12.5, 1.7, 17.0, 0.40, "缓流 (Subcritical)", "非均匀流 (雍水)", "正常"),
+    (3, "2026-01-01 00:01:00.000000", 0.4, 3.9, 12.4, 3.3, 6.6, 1.66, "急流 (Supercritical)", "均匀流", "含沙量过高"),
+]
+
+
+def legacy_db(path):
+    con = sqlite3.connect(path)
+    con.executescript(LEGACY_SCHEMA)
+    con.executemany("INSERT INTO monitor_data VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", LEGACY_ROWS)
+    con.commit()
+    con.close()
+
+
+def user_version(engine):
+    with engine.connect() as conn:
+        return conn.exec_driver_sql("PRAGMA user_version").scalar()
+
+
+def test_compact_codes_waits_for_the_offline_command(tmp_path):
+    path = tmp_path / "legacy.db"
+    legacy_db(path)
+    engine = build_engine(f"sqlite:///{path}")
+    Base.metadata.create_all(bind=engine)
+
+    # 服务启动：只做在线迁移，整表转换留给离线命令
+    pending = migrate(engine)
+    assert pending is not None and pending[0] == 5
+    assert user_version(engine) == 4
+    with engine.connect() as conn:
+        assert conn.exec_driver_sql("SELECT COUNT(*) FROM monitor_rollup WHERE bucket = '1m'").scalar() == 2
+    assert migrate(engine) == pending
+
+    assert migrate(engine, offline=True) is None
+    assert user_version(engine) == MIGRATIONS[-1][0]
+    names = ["id", "station_id", "depth", "regime", "flow_type", "alert_msg"]
+    with engine.connect() as conn:
+        restored = [tuple(row) for row in conn.execute(select(*[column(n) for n in names]).order_by(column("id")))]
+        indexes = {row[1] for row in conn.exec_driver_sql("PRAGMA index_list(monitor_data)")}
+    assert restored == [(r[0], "default", r[2], r[8], r[9], r[10]) for r in LEGACY_ROWS]
+    assert {"ix_monitor_data_station_ts", "ix_monitor_data_timestamp"} <= indexes
+    engine.dispose()
+
+
+def test_new_database_needs_no_offline_step(tmp_path):
+    engine = build_engine(f"sqlite:///{tmp_path / 'new.db'}")
+    Base.metadata.create_all(bind=engine)
+    assert migrate(engine) is None
+    assert user_version(engine) == MIGRATIONS[-1][0]
+    engine.dispose()
@@ -0,0 +1,48 @@
+# tests/test_ringbuffer.py
+from datetime import datetime, timedelta
+
+import pytest
+
+from core.ringbuffer import ReadingRing
+
+T0 = datetime(2026, 1, 1)
+
+
+def reading(i, **extra):
+    return {"id": i, "timestamp": T0 + timedelta(seconds=i), "depth": float(i), "regime": "缓流 (Subcritical)",
+            "flow_type": "均匀流", "alert_msg": "正常", "floating_count": 0, **extra}
+
+
+def test_seeded_ring_answers_everything_until_it_wraps():
+    ring = ReadingRing(capacity=4)
+    ring.seed([reading(i) for i in range(1, 4)], complete=True)
+    assert [r["id"] for r in ring.query(limit=10)] == [1, 2, 3]
+
+    ring.append(reading(4))
+    assert [r["id"] for r in ring.query(limit=10)] == [1, 2, 3, 4]
+
+    # 覆盖最旧的一条后，超出缓冲范围的查询必须回退到数据库
+    ring.append(reading(5))
+    assert not ring.complete
+    assert ring.query(limit=10) is None
+    assert [r["id"] for r in ring.query(limit=4)] == [2, 3, 4, 5]
+
+
+def test_latest_and_last_id_follow_the_write_pointer():
+    ring = ReadingRing(capacity=3, station_id="s1")
+    assert ring.latest() is None and ring.last_id() is None
+    for i in range(1, 8):
+        ring.append(reading(i))
+    assert ring.last_id() == 7
+    assert ring.latest()["depth"] == 7.0
+    assert ring.latest()["station_id"] == "s1"
+
+
+def test_out_of_range_reading_leaves_no_partial_slot():
+    ring = ReadingRing(capacity=4)
+    ring.append(reading(1, floating_count=3))
+    with pytest.raises(ValueError):
+        ring.append(reading(2, floating_count=2 ** 40))
+    assert len(ring) == 1
+    assert ring.latest()["floating_count"] == 3
+    assert ring.last_id() == 1
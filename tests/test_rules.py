@@ -0,0 +1,59 @@
+# tests/test_rules.py
+import pytest
+
+from core.rules import Rule, RuleEngine
+
+
+def rule(**config):
+    return {"name": "r", "field": "depth", "op": ">", "threshold": 1.0, **config}
+
+
+@pytest.mark.parametrize("message", [
+    "{regime:.2f}",        # 文本字段配数值格式
+    "{floating_count:d}",  # 数值字段按 float 渲染
+    "{depth",              # 括号不配对
+    "{depth.real}",        # 属性访问
+    "{0}",                 # 位置参数
+    "{unknown}",
+])
+def test_compile_rejects_unrenderable_templates(message):
+    with pytest.raises(ValueError):
+        Rule(rule(message=message))
+
+
+def test_compile_accepts_typed_template():
+    Rule(rule(message="水深 {depth:.2f} m，{regime}"))
+
+
+def test_threshold_rule_vectorised():
+    engine = RuleEngine()
+    engine.load({"rules": [rule(message="水深 {depth:.1f}")]})
+    messages, _ = engine.evaluate("s", {"depth": [0.5, 1.5, 2.0]}, [0.0, 1.0, 2.0])
+    assert messages == ["正常", "水深 1.5", "水深 2.0"]
+
+
+def test_duration_state_carries_over_after_commit():
+    engine = RuleEngine()
+    engine.load({"rules": [rule(duration=10)]})
+    messages, pending = engine.evaluate("s", {"depth": [2.0, 2.0]}, [0.0, 5.0])
+    assert messages == ["正常", "正常"]
+    engine.commit("s", pending)
+    messages, pending = engine.evaluate("s", {"depth": [2.0]}, [11.0])
+    assert messages == ["r"]
+    # 未 commit 的状态不影响其他测站
+    messages, _ = engine.evaluate("other", {"depth": [2.0]}, [11.0])
+    assert messages == ["正常"]
+
+
+def test_hysteresis_holds_alarm_until_cleared():
+    engine = RuleEngine()
+    engine.load({"rules": [rule(hysteresis=0.5)]})
+    messages, _ = engine.evaluate("s", {"depth": [1.2, 0.8, 0.4]}, [0.0, 1.0, 2.0])
+    assert messages == ["r", "r", "正常"]
+
+
+def test_render_failure_falls_back_to_rule_name():
+    engine = RuleEngine()
+    engine.load({"rules": [rule(message="流速 {velocity_surf:.2f}")]})
+    messages, _ = engine.evaluate("s", {"depth": [2.0], "velocity_surf": [None]}, [0.0])
+    assert messages == ["r"]
@@ -0,0 +1,66 @@
+# tests/test_writer.py
+from datetime import datetime
+
+import pytest
+from sqlalchemy import func
+from sqlalchemy.orm import sessionmaker
+
+from database.codes import RowEncoder
+from database.models import Base, MonitorData, build_engine
+from database.writer import WriteBehindWriter
+
+
+@pytest.fixture
+def session_factory(tmp_path):
+    engine = build_engine(f"sqlite:///{tmp_path / 'writer.db'}")
+    Base.metadata.create_all(bind=engine)
+    yield sessionmaker(bind=engine)
+    engine.dispose()
+
+
+def rows(first, n, **extra):
+    return [{"id": first + i, "station_id": "default", "timestamp": datetime(2026, 1, 1, 0, 0, i),
+             "depth": 1.0, "regime": "缓流 (Subcritical)", "flow_type": "均匀流", "alert_msg": "正常", **extra}
+            for i in range(n)]
+
+
+def stored_ids(session_factory):
+    db = session_factory()
+    try:
+        return sorted(i for (i,) in db.query(MonitorData.id))
+    finally:
+        db.close()
+
+
+def test_bad_row_is_isolated_from_the_merged_batch(session_factory):
+    writer = WriteBehindWriter(session_factory, MonitorData, max_retries=1, encode=RowEncoder())
+    writer.submit(rows(1, 3))
+    writer.submit(rows(4, 2) + rows(6, 1, floating_count=2 ** 70))   # 超出 SQLite 整数范围
+    writer.submit(rows(7, 2))
+    writer.stop()   # 未启动后台线程：在当前线程把三组合并成一批写入
+
+    stats = writer.stats()
+    assert stats["written"] == 7
+    assert stats["failed"] == 1
+    assert stored_ids(session_factory) == [1, 2, 3, 4, 5, 7, 8]
+
+
+def test_hooks_run_in_the_same_transaction(session_factory):
+    seen = []
+
+    def hook(db, batch):
+        seen.append(db.query(func.count(MonitorData.id)).scalar())
+
+    writer = WriteBehindWriter(session_factory, MonitorData, hooks=[hook], encode=RowEncoder()).start()
+    writer.submit(rows(1, 4))
+    writer.flush()
+    writer.stop()
+    assert seen == [4]
+    assert writer.stats()["written"] == 4
+
+
+def test_submit_after_stop_is_dropped(session_factory):
+    writer = WriteBehindWriter(session_factory, MonitorData, encode=RowEncoder())
+    writer.stop()
+    assert writer.submit(rows(1, 2)) is False
+    assert writer.stats()["dropped"] == 2
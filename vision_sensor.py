@@ -3,45 +3,359 @@ import requests
 import time
 import numpy as np
 import sys
+import argparse
+import json
+import multiprocessing
+import os
+import queue
+import signal
+import threading
+from collections import deque
 
-API_URL = "http://127.0.0.1:8000/api/upload_data_v2"
+API_URL = "http://127.0.0.1:8000/api/upload_batch"
 LOWER_GREEN = np.array([40, 40, 40])
 UPPER_GREEN = np.array([80, 255, 255])
+MIN_AREA = 500
 
-def run_vision():
-    print(">>> 视觉识别子进程已启动...")
-    cap = cv2.VideoCapture(0)
+# 采集 -> 识别 -> 上报 三段流水线：
+# - 采集线程只保留最新一帧，识别跟不上时旧帧直接丢弃，不会越积越多
+# - 上报线程用持久连接 (requests.Session) 批量 POST 到 /api/upload_batch，网络慢不会卡住摄像头
+# - 主线程做识别与显示；--headless 时不开窗口，可在无显示器的设备上运行
+# 多路摄像头 (或视频文件) 每路一个子进程，各自按测站编号上报
+
+
+class FrameGrabber(threading.Thread):
+    """
+    采集线程：不停读帧，只保留最新的一帧 (帧, 采集时刻, 序号)
+    :param pace: 视频文件按其原始帧率读取 (摄像头本身按帧率出帧，不需要)
+    """
+
+    def __init__(self, cap, pace=None):
+        super().__init__(daemon=True, name="vision-capture")
+        self.cap = cap
+        self.pace = pace
+        self.captured = 0
+        self.ended = False
+        self._latest = None
+        self._cond = threading.Condition()
+        self._stopping = threading.Event()
+
+    def run(self):
+        next_at = time.monotonic()
+        while not self._stopping.is_set():
+            if self.pace:
+                next_at += 1.0 / self.pace
+                self._stopping.wait(max(0.0, next_at - time.monotonic()))
+            ret, frame = self.cap.read()
+            if not ret:
+                break
+            with self._cond:
+                self.captured += 1
+                self._latest = (frame, time.perf_counter(), self.captured)
+                self._cond.notify_all()
+        with self._cond:
+            self.ended = True
+            self._cond.notify_all()
+
+    def latest(self, after_seq, timeout=1.0):
+        """等待并返回序号大于 after_seq 的最新一帧；采集结束或超时返回 None"""
+        with self._cond:
+            self._cond.wait_for(lambda: self.ended or (self._latest and self._latest[2] > after_seq), timeout)
+            if self._latest and self._latest[2] > after_seq:
+                return self._latest
+            return None
+
+    def stop(self):
+        self._stopping.set()
+
+
+class Uplink(threading.Thread):
+    """
+    上报线程：读数先进队列，攒够 batch_size 条或等满 flush_interval 秒后一次 POST
+    队列满时丢弃最旧的读数 (服务端长时间不可达时只保留最近的数据)
+    """
+
+    def __init__(self, url, stats, batch_size=20, flush_interval=0.2, max_queue=1000, timeout=2.0):
+        super().__init__(daemon=True, name="vision-uplink")
+        self.url = url
+        self.stats = stats
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.timeout = timeout
+        self.session = requests.Session()
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._stopping = threading.Event()
+
+    def submit(self, payload, t_capture):
+        while True:
+            try:
+                self._queue.put_nowait((payload, t_capture))
+                return
+            except queue.Full:
+                try:
+                    self._queue.get_nowait()
+                    self.stats.dropped += 1
+                except queue.Empty:
+                    pass
+
+    def run(self):
+        while not (self._stopping.is_set() and self._queue.empty()):
+            batch = []
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            if batch:
+                self._post(batch)
+
+    def _post(self, batch):
+        try:
+            resp = self.session.post(self.url, params={"summary": "true"},
+                                     json=[payload for payload, _ in batch], timeout=self.timeout)
+            resp.raise_for_status()
+        except requests.RequestException:
+            self.stats.failed += len(batch)
+            return
+        now = time.perf_counter()
+        self.stats.delivered([now - t for _, t in batch])
+
+    def stop(self):
+        """停止接收并把队列里剩余的读数发完"""
+        self._stopping.set()
+        self.join(timeout=self.timeout * 2)
+        self.session.close()
+
+
+class PipelineStats:
+    """帧率与延迟统计 (最近 window 个样本)"""
+
+    def __init__(self, window=300):
+        self.processed = 0
+        self.dropped = 0
+        self.failed = 0
+        self.sent = 0
+        self._frame_lat = deque(maxlen=window)   # 采集 -> 识别完成
+        self._e2e_lat = deque(maxlen=window)     # 采集 -> 服务端确认
+        self._frame_times = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def frame(self, t_capture):
+        now = time.perf_counter()
+        with self._lock:
+            self.processed += 1
+            self._frame_lat.append(now - t_capture)
+            self._frame_times.append(now)
+
+    def delivered(self, latencies):
+        with self._lock:
+            self.sent += len(latencies)
+            self._e2e_lat.extend(latencies)
+
+    def fps(self):
+        with self._lock:
+            times = list(self._frame_times)
+        return (len(times) - 1) / (times[-1] - times[0]) if len(times) > 1 and times[-1] > times[0] else 0.0
+
+    def report(self, captured):
+        with self._lock:
+            frame_lat = np.array(self._frame_lat) * 1000
+            e2e_lat = np.array(self._e2e_lat) * 1000
+        pct = lambda a: "p50 %.1f / p95 %.1f ms" % tuple(np.percentile(a, [50, 95])) if len(a) else "---"  # noqa: E731
+        return (f"采集 {captured} 帧, 识别 {self.processed} 帧 ({self.fps():.1f} fps) | "
+                f"识别延迟 {pct(frame_lat)} | 端到端 {pct(e2e_lat)} | "
+                f"已上报 {self.sent}, 丢弃 {self.dropped}, 失败 {self.failed}")
+
+
+class Detector:
+    """
+    绿色漂浮物识别
+    - 只处理渠道 ROI (多边形，坐标为相对画面宽高的 0~1 比例) 的外接矩形区域，ROI 外的像素用掩膜去掉
+    - 按 scale 缩小后再做颜色分割，面积阈值同比缩小
+    - connectedComponentsWithStats 一次得到全部连通域的面积与外接矩形，按面积筛选是数组运算
+    几何参数按画面尺寸预先计算，尺寸变化时重新计算；返回的外接矩形为原始分辨率坐标 (N x 4 数组)
+    """
+
+    def __init__(self, scale=0.5, roi=None, min_area=MIN_AREA):
+        if not 0 < scale <= 1:
+            raise ValueError("scale 须在 (0, 1] 之间")
+        if roi is not None and len(roi) < 3:
+            raise ValueError("ROI 至少需要 3 个顶点")
+        self.scale = scale
+        self.roi = roi
+        self.min_area = min_area
+        self._shape = None
+
+    def _prepare(self, shape):
+        h, w = shape[:2]
+        if self.roi is not None:
+            pts = np.round(np.array(self.roi, dtype=np.float64) * [w - 1, h - 1]).astype(np.int32)
+            x0, y0, bw, bh = cv2.boundingRect(pts)
+        else:
+            x0, y0, bw, bh = 0, 0, w, h
+        sw, sh = max(1, round(bw * self.scale)), max(1, round(bh * self.scale))
+        mask = None
+        if self.roi is not None:
+            mask = np.zeros((sh, sw), dtype=np.uint8)
+            cv2.fillPoly(mask, [np.round((pts - [x0, y0]) * [sw / bw, sh / bh]).astype(np.int32)], 255)
+        self._crop = (slice(y0, y0 + bh), slice(x0, x0 + bw))
+        self._size = (sw, sh) if (sw, sh) != (bw, bh) else None
+        self._mask = mask
+        self._offset = np.array([x0, y0, 0, 0], dtype=np.float64)
+        self._factor = np.array([bw / sw, bh / sh, bw / sw, bh / sh])
+        self._min_pixels = self.min_area * (sw * sh) / (bw * bh)
+        # 8 连通时连通域个数不超过 ceil(w/2)*ceil(h/2)，能放进 16 位标签图时用 CV_16U (写标签图的开销减半)
+        self._ltype = cv2.CV_16U if ((sw + 1) // 2) * ((sh + 1) // 2) < 65535 else cv2.CV_32S
+        self._shape = shape
+
+    def __call__(self, frame):
+        if frame.shape != self._shape:
+            self._prepare(frame.shape)
+        region = frame[self._crop]
+        if self._size is not None:
+            region = cv2.resize(region, self._size, interpolation=cv2.INTER_AREA)
+        binary = cv2.inRange(cv2.cvtColor(region, cv2.COLOR_BGR2HSV), LOWER_GREEN, UPPER_GREEN)
+        if self._mask is not None:
+            cv2.bitwise_and(binary, self._mask, dst=binary)
+        if not cv2.countNonZero(binary):
+            return np.empty((0, 4), dtype=int)
+        _n, _labels, stats, _centroids = cv2.connectedComponentsWithStats(binary, connectivity=8, ltype=self._ltype)
+        stats = stats[1:]   # 第 0 个是背景
+        boxes = stats[stats[:, cv2.CC_STAT_AREA] > self._min_pixels, :4]
+        return np.round(boxes * self._factor + self._offset).astype(int)
+
+
+def parse_roi(text):
+    """"x,y x,y x,y ..." (0~1 比例坐标) -> 顶点列表"""
+    if not text:
+        return None
+    return [[float(v) for v in point.split(",")] for point in text.split()]
+
+
+def load_cameras(path):
+    """
+    多路摄像头配置 (JSON 数组)，每项：
+    {"source": 0 或视频文件路径, "station_id": "S1", "roi": [[x, y], ...], "scale": 0.5}
+    """
+    with open(path, encoding="utf-8") as f:
+        cameras = json.load(f)
+    for i, cam in enumerate(cameras):
+        if "source" not in cam:
+            raise ValueError(f"第 {i + 1} 路摄像头缺少 source")
+        cam.setdefault("station_id", f"cam{i + 1}")
+    return cameras
+
+
+def run_vision(source=0, headless=False, fps=10.0, station_id="default", report_interval=5.0, url=API_URL,
+               scale=0.5, roi=None):
+    print(f">>> 视觉识别子进程已启动 ({station_id}: {source})...")
+    detector = Detector(scale=scale, roi=roi)
+    cap = cv2.VideoCapture(source)
     time.sleep(1)
     if not cap.isOpened(): sys.exit(101)
     ret, _ = cap.read()
     if not ret: sys.exit(101)
 
-    while True:
-        ret, frame = cap.read()
-        if not ret: break
-        
-        hsv = cv2.cvtColor(frame, cv2.COLOR_BGR2HSV)
-        mask = cv2.inRange(hsv, LOWER_GREEN, UPPER_GREEN)
-        contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
-        count = sum(1 for c in contours if cv2.contourArea(c) > 500)
-        
-        for c in contours:
-            if cv2.contourArea(c) > 500:
-                x,y,w,h = cv2.boundingRect(c)
-                cv2.rectangle(frame, (x,y), (x+w,y+h), (0,255,0), 2)
-        
-        cv2.putText(frame, f"Obj: {count}", (10,30), cv2.FONT_HERSHEY_SIMPLEX, 1, (0,255,0), 2)
-        cv2.imshow("Vision Sensor", frame)
-        
-        try:
-            payload = {"depth": 2.1, "velocity_surf": 1.6, "voltage": 12.0, "channel_width": 5.0, "sediment": 0.2, "floating_count": count}
-            requests.post(API_URL, json=payload, timeout=0.5)
-        except: pass
-        
-        if cv2.waitKey(100) == ord('q'): break
-    
-    cap.release()
-    cv2.destroyAllWindows()
+    stats = PipelineStats()
+    grabber = FrameGrabber(cap, pace=None if isinstance(source, int) else (cap.get(cv2.CAP_PROP_FPS) or 30.0))
+    uplink = Uplink(url, stats)
+    grabber.start()
+    uplink.start()
+
+    stop = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *_: stop.set())
+    period = 1.0 / fps if fps > 0 else 0.0
+    seq = 0
+    next_report = time.monotonic() + report_interval
+    try:
+        while not stop.is_set():
+            started = time.monotonic()
+            item = grabber.latest(seq)
+            if item is None:
+                if grabber.ended: break
+                continue
+            frame, t_capture, seq = item
+
+            boxes = detector(frame)
+            count = len(boxes)
+            payload = {"station_id": station_id, "depth": 2.1, "velocity_surf": 1.6, "voltage": 12.0,
+                       "channel_width": 5.0, "sediment": 0.2, "floating_count": count}
+            uplink.submit(payload, t_capture)
+            stats.frame(t_capture)
+
+            if not headless:
+                for x, y, w, h in boxes:
+                    cv2.rectangle(frame, (x,y), (x+w,y+h), (0,255,0), 2)
+                cv2.putText(frame, f"Obj: {count}  {stats.fps():.1f} fps", (10,30), cv2.FONT_HERSHEY_SIMPLEX, 1, (0,255,0), 2)
+                cv2.imshow(f"Vision Sensor - {station_id}", frame)
+                if cv2.waitKey(1) == ord('q'): break
+
+            if time.monotonic() >= next_report:
+                print(f"[{station_id}] {stats.report(grabber.captured)}", flush=True)
+                next_report += report_interval
+            # 按目标帧率限速 (上报频率与原先每 100ms 一帧一致)
+            wait = period - (time.monotonic() - started)
+            if wait > 0: stop.wait(wait)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        grabber.stop()
+        uplink.stop()
+        grabber.join(timeout=1.0)
+        cap.release()
+        if not headless: cv2.destroyAllWindows()
+        print(f"[{station_id}] {stats.report(grabber.captured)}", flush=True)
+
+
+def run_cameras(cameras, **options):
+    """每路摄像头一个子进程；收到 SIGTERM 时转发给各子进程 (各自发完剩余数据再退出)，全部打不开时以 101 退出"""
+    procs = []
+    for cam in cameras:
+        kwargs = dict(options, source=cam["source"], station_id=cam["station_id"])
+        kwargs.update({k: cam[k] for k in ("scale", "roi") if k in cam})
+        proc = multiprocessing.Process(target=run_vision, kwargs=kwargs, name=f"vision-{cam['station_id']}")
+        proc.start()
+        procs.append(proc)
+    signal.signal(signal.SIGTERM, lambda *_: [p.terminate() for p in procs if p.is_alive()])
+    try:
+        for proc in procs:
+            proc.join()
+    except KeyboardInterrupt:
+        for proc in procs:
+            proc.join()
+    if all(proc.exitcode == 101 for proc in procs):
+        sys.exit(101)
+
 
 if __name__ == "__main__":
-    run_vision()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="视觉漂浮物识别传感器")
+    parser.add_argument("--source", action="append", help="摄像头编号或视频文件路径，可重复指定多路")
+    parser.add_argument("--station", action="append", help="测站编号，与 --source 按顺序对应")
+    parser.add_argument("--cameras", default=os.environ.get("MONITOR_CAMERAS"),
+                        help="多路摄像头配置文件 (JSON)，默认读环境变量 MONITOR_CAMERAS")
+    parser.add_argument("--scale", type=float, default=0.5, help="识别前的缩放比例 (0~1]")
+    parser.add_argument("--roi", help='渠道 ROI 多边形，"x,y x,y ..." 形式的 0~1 比例坐标')
+    parser.add_argument("--headless", action="store_true", help="不打开显示窗口")
+    parser.add_argument("--fps", type=float, default=10.0, help="识别与上报的目标帧率，0 表示不限速")
+    parser.add_argument("--url", default=API_URL, help="批量上传接口地址")
+    args = parser.parse_args()
+
+    options = dict(headless=args.headless, fps=args.fps, url=args.url, scale=args.scale, roi=parse_roi(args.roi))
+    if args.cameras:
+        cameras = load_cameras(args.cameras)
+    else:
+        sources = args.source or ["0"]
+        stations = args.station or (["default"] if len(sources) == 1 else [f"cam{i + 1}" for i in range(len(sources))])
+        if len(stations) != len(sources):
+            parser.error("--station 的个数须与 --source 一致")
+        cameras = [{"source": int(src) if src.isdigit() else src, "station_id": sid}
+                   for src, sid in zip(sources, stations)]
+    if len(cameras) == 1:
+        run_vision(**dict(options, source=cameras[0]["source"], station_id=cameras[0]["station_id"],
+                          **{k: cameras[0][k] for k in ("scale", "roi") if k in cameras[0]}))
+    else:
+        run_cameras(cameras, **options)